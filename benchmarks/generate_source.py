@@ -0,0 +1,169 @@
+import datetime
+import os
+import sqlite3
+
+import numpy as np
+
+
+# Size of the source at scale 1. Orders, clients and articles grow linearly with the scale
+BASE_ORDERS = 10000
+BASE_CLIENTES = 1000
+BASE_ARTICULOS = 2000
+
+# Orders per working day, and first day of the generated sales
+ORDERS_PER_DAY = 150
+FIRST_DAY = datetime.datetime(2020, 1, 2)
+
+# Share of dirty values (nulls, zeros, negatives and unknown codes) the cleaning rules of the ETL have to deal with
+DIRTY_RATE = 0.02
+
+SOURCE_DDL = """
+CREATE TABLE Rubros (Rubro INTEGER, Subrubro1 INTEGER, Subrubro2 INTEGER, Subrubro3 INTEGER, Nombre TEXT);
+CREATE TABLE Articulos (codigo INTEGER, subcodigo INTEGER, nombre TEXT, rubro INTEGER, subrubro INTEGER, subrubro2 INTEGER, subrubro3 INTEGER, precio REAL);
+CREATE TABLE TipoCliente (Tipo_cliente INTEGER, Detalle TEXT);
+CREATE TABLE Clientes (NroCuenta INTEGER, localidad TEXT, Razon_Social TEXT, Tipo_cliente INTEGER, Direccion TEXT);
+CREATE TABLE Vendedor (Cod_Vendedor INTEGER, Nombre TEXT);
+CREATE TABLE CabVentas (NroOrden INTEGER, Cod_Comprob TEXT, Cod_Vendedor INTEGER, FechaComp TIMESTAMP, Hora TIMESTAMP, NroCuenta INTEGER, Razon_Social TEXT, total REAL, Observaciones TEXT);
+CREATE TABLE ItemVentas (nroorden INTEGER, codigo INTEGER, subcodigo INTEGER, cantidad REAL, prec_unit REAL, prec_unit_iv REAL, total REAL, descripcion TEXT);
+"""
+
+LOCALIDADES = ['PARANÁ', 'Parana', 'PRANA', 'SANTA FE', 'Santafe', 'SANTO TOME', 'CRESPO', 'ORO VERDE', '', None]
+LOCALIDADES_WEIGHTS = [0.45, 0.1, 0.02, 0.2, 0.03, 0.05, 0.06, 0.05, 0.02, 0.02]
+
+COMPROBANTES = ['FA', 'FB', 'FC', 'NC', 'RE', 'PR']
+COMPROBANTES_WEIGHTS = [0.3, 0.45, 0.05, 0.08, 0.07, 0.05]
+
+RAZONES_ANULADAS = ['ANULADA', 'ANULADO', 'CANCELADO', 'A N U L A D A', '']
+
+
+def _dirty(rng, values, dirty_values, rate=DIRTY_RATE):
+    """
+    Replace a share of the values with random dirty values.
+    """
+    values = np.asarray(values, dtype=object)
+    mask = rng.random(len(values)) < rate
+    values[mask] = rng.choice(np.array(dirty_values, dtype=object), mask.sum())
+    return values
+
+
+def _rows(*columns):
+    """
+    Zip columns into rows of Python values (numpy scalars are not accepted by sqlite3).
+    """
+    return list(zip(*[column.tolist() if isinstance(column, np.ndarray) else column for column in columns]))
+
+
+def generateSource(path, scale=1, seed=1):
+    """
+    Generate a synthetic copy of the "El Profesional" source database in a SQLite file.
+
+    The tables have the columns read by the ETL and realistic distributions: popular articles are sold much
+    more often (Zipf), orders are spread over the working hours of consecutive days, most invoices are "facturas",
+    and a share of the values is dirty (nulls, zeros, negative amounts, unknown codes, annulled invoices).
+
+    Parameters:
+        path (str): Path of the SQLite file. It is replaced if it exists.
+        scale (int, optional): Scale factor of the number of orders, clients and articles. Default is 1
+        seed (int, optional): Seed of the random generator, so the same scale always gives the same data. Default is 1
+
+    Returns:
+        dict: Number of rows of each table.
+    """
+    rng = np.random.default_rng(seed)
+
+    n_orders = BASE_ORDERS * scale
+    n_clientes = BASE_CLIENTES * scale
+    n_articulos = BASE_ARTICULOS * scale
+
+    # Rubros: 6 rubros, with subrubros on 3 levels
+    rubros = [(0, 0, 0, 0, 'VARIOS')]
+    for rubro in range(1, 7):
+        rubros.append((rubro, 0, 0, 0, f'RUBRO {rubro}'))
+        for subrubro1 in range(1, 4):
+            rubros.append((rubro, subrubro1, 0, 0, f'RUBRO {rubro}.{subrubro1}'))
+            for subrubro2 in range(1, 3):
+                rubros.append((rubro, subrubro1, subrubro2, 0, f'RUBRO {rubro}.{subrubro1}.{subrubro2}'))
+    rubros_array = np.array([rubro[:4] for rubro in rubros])
+
+    # Articulos: consecutive codes, a few with subcodes, and the special articles of the ETL
+    codigos = np.arange(1, n_articulos + 1)
+    subcodigos = np.where(rng.random(n_articulos) < 0.1, rng.integers(1, 10, n_articulos), 0)
+    rubro_articulo = rubros_array[rng.integers(0, len(rubros_array), n_articulos)]
+    rubro_articulo[rng.random(n_articulos) < DIRTY_RATE, 3] = 7  # Subrubros that do not exist -> "SIN RUBRO"
+    nombres = _dirty(rng, [f'ARTICULO {codigo}-{subcodigo}' for codigo, subcodigo in zip(codigos, subcodigos)], [None])
+    precios = np.round(rng.lognormal(7, 1, n_articulos), 2)
+
+    articulos = _rows(codigos, subcodigos, nombres, rubro_articulo[:, 0], rubro_articulo[:, 1], rubro_articulo[:, 2], rubro_articulo[:, 3], precios)
+    articulos += [(999999, 0, 'DESCUENTO', 0, 0, 0, 0, 0.0), (999998, 0, 'OTRO', 0, 0, 0, 0, 0.0), (999997, 0, 'ANULADO', 0, 0, 0, 0, 0.0)]
+
+    tipos_cliente = [(1, 'CUENTA CORRIENTE'), (2, 'MOROSO'), (3, 'MOROSO NO VENDER')]
+
+    # Clientes: account 1 is "CONSUMIDOR FINAL", 9997 and 9999 are removed by the ETL
+    cuentas = np.arange(2, n_clientes + 2)
+    cuentas = cuentas[(cuentas != 9997) & (cuentas != 9999)]
+    localidades = rng.choice(np.array(LOCALIDADES, dtype=object), len(cuentas), p=LOCALIDADES_WEIGHTS)
+    tipos = _dirty(rng, rng.choice([1, 2, 3], len(cuentas), p=[0.9, 0.07, 0.03]), [None, 0, 5])
+    clientes = [(1, 'PARANÁ', 'CONSUMIDOR FINAL', 1, '')]
+    clientes += _rows(cuentas, localidades, [f'CLIENTE {cuenta}' for cuenta in cuentas.tolist()], tipos, [''] * len(cuentas))
+    clientes += [(9997, '', 'PRESUPUESTO', 1, ''), (9999, '', 'TOTAL DEL TICKET', 1, '')]
+
+    vendedores = [(1, 'TODOS')] + [(codigo, f'VENDEDOR {codigo}') for codigo in range(2, 21)] + [(21, 'NOTA DE CREDITO'), (22, '')]
+
+    # CabVentas: consecutive orders over the working hours of consecutive days
+    nro_orden = np.arange(1, n_orders + 1)
+    dias = (nro_orden - 1) // ORDERS_PER_DAY
+    fechas = [FIRST_DAY + datetime.timedelta(days=int(dia)) for dia in range(dias[-1] + 1)]
+    posicion = (nro_orden - 1) % ORDERS_PER_DAY
+    segundos = 8 * 3600 + posicion * (12 * 3600 // ORDERS_PER_DAY) + rng.integers(0, 12 * 3600 // ORDERS_PER_DAY, n_orders)
+    horas = [datetime.datetime(1899, 12, 30) + datetime.timedelta(seconds=int(segundo)) for segundo in segundos]
+
+    comprobantes = _dirty(rng, rng.choice(COMPROBANTES, n_orders, p=COMPROBANTES_WEIGHTS), [None])
+    cod_vendedor = _dirty(rng, rng.integers(1, 21, n_orders), [None, 0, 99])
+    cliente_orden = np.where(rng.random(n_orders) < 0.4, 1, rng.choice(cuentas, n_orders))
+    cliente_orden = _dirty(rng, cliente_orden, [None, 0, 10 ** 7])
+    razones = np.array([f'CLIENTE {cuenta}' if cuenta not in (None, 1) else 'CONSUMIDOR FINAL' for cuenta in cliente_orden.tolist()], dtype=object)
+    razones = _dirty(rng, razones, RAZONES_ANULADAS + [None])
+    totales = _dirty(rng, np.round(rng.lognormal(8, 1.2, n_orders), 2), [None, 0.0, -100.0])
+
+    cab_ventas = _rows(nro_orden, comprobantes, cod_vendedor, [fechas[dia] for dia in dias.tolist()],
+                       _dirty(rng, horas, [None], rate=DIRTY_RATE / 4), cliente_orden, razones, totales, [''] * n_orders)
+
+    # ItemVentas: 1 to 8 lines per order, popular articles sold more often
+    lineas = np.minimum(rng.geometric(0.35, n_orders), 8)
+    item_orden = np.repeat(nro_orden, lineas)
+    n_items = len(item_orden)
+
+    articulo = np.minimum(rng.zipf(1.3, n_items), n_articulos) - 1
+    item_codigo = _dirty(rng, codigos[articulo], [None, 0, -5, 999998, 10 ** 6 - 10])
+    item_subcodigo = _dirty(rng, subcodigos[articulo], [None, -1])
+    cantidad = rng.choice([1, 1, 1, 2, 3, 5, 10, 0.5], n_items)
+    prec_unit = np.round(precios[articulo] * rng.uniform(0.9, 1.1, n_items), 2)
+    prec_unit_iv = np.round(prec_unit * 1.21, 2)
+    item_total = np.round(prec_unit_iv * cantidad, 2)
+
+    item_ventas = _rows(item_orden, item_codigo, item_subcodigo, _dirty(rng, cantidad, [None, 0.0, -1.0]), _dirty(rng, prec_unit, [None, -1.0]),
+                        prec_unit_iv, _dirty(rng, item_total, [None, 0.0, -10.0]), [f'ARTICULO {codigo}' for codigo in codigos[articulo].tolist()])
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SOURCE_DDL)
+        conn.executemany("INSERT INTO Rubros VALUES (?, ?, ?, ?, ?)", rubros)
+        conn.executemany("INSERT INTO Articulos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", articulos)
+        conn.executemany("INSERT INTO TipoCliente VALUES (?, ?)", tipos_cliente)
+        conn.executemany("INSERT INTO Clientes VALUES (?, ?, ?, ?, ?)", clientes)
+        conn.executemany("INSERT INTO Vendedor VALUES (?, ?)", vendedores)
+        conn.executemany("INSERT INTO CabVentas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", cab_ventas)
+        conn.executemany("INSERT INTO ItemVentas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", item_ventas)
+    conn.close()
+
+    return {
+        'Rubros': len(rubros),
+        'Articulos': len(articulos),
+        'TipoCliente': len(tipos_cliente),
+        'Clientes': len(clientes),
+        'Vendedor': len(vendedores),
+        'CabVentas': len(cab_ventas),
+        'ItemVentas': len(item_ventas)
+    }
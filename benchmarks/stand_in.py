@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import types
+
+from sqlalchemy import create_engine, text
+
+
+# Path of the DDL of the data warehouse, relative to the root of the repository
+DDL_PATH = os.path.join('datawarehouse', 'DDL', 'DDL - Renglón Factura.sql')
+
+# Schema where the benchmark data warehouse is created, so the benchmark never touches the tables of 'public'
+BENCHMARK_SCHEMA = 'etl_benchmark'
+
+
+def connectSource(path):
+    """
+    Open a connection to a SQLite source database, standing in for the ODBC connection to "El Profesional".
+
+    The connection parses the TIMESTAMP columns as datetimes, and can be used from the extraction worker threads.
+
+    Parameters:
+        path (str): Path of the SQLite file (see 'generate_source.generateSource').
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    return sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
+
+def sourceModule(path):
+    """
+    Build a stand-in for the 'pyodbc' module, whose 'connect' opens the SQLite source database whatever the DSN.
+
+    Parameters:
+        path (str): Path of the SQLite file.
+
+    Returns:
+        module: The stand-in module.
+    """
+    module = types.ModuleType('pyodbc')
+    module.connect = lambda *args, **kwargs: connectSource(path)
+    module.Connection = sqlite3.Connection
+    return module
+
+
+def createBenchmarkEngine(dw_url):
+    """
+    Create an engine to a PostgreSQL database whose connections use the benchmark schema.
+
+    Parameters:
+        dw_url (str): URL of a local or throwaway PostgreSQL database.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine.
+    """
+    return create_engine(dw_url, connect_args={'options': f'-csearch_path={BENCHMARK_SCHEMA}'})
+
+
+def createBenchmarkDW(dw_url, repo_root):
+    """
+    (Re)create the benchmark data warehouse from the DDL of the repository, in its own schema.
+
+    Parameters:
+        dw_url (str): URL of a local or throwaway PostgreSQL database.
+        repo_root (str): Root directory of the repository.
+
+    Returns:
+        sqlalchemy.engine.Engine: Engine whose connections use the benchmark schema.
+    """
+    with open(os.path.join(repo_root, DDL_PATH), encoding='utf-8') as file:
+        ddl = file.read()
+
+    engine = createBenchmarkEngine(dw_url)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {BENCHMARK_SCHEMA}"))
+        conn.exec_driver_sql(ddl)
+
+    return engine
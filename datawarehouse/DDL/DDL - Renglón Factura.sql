@@ -4,7 +4,8 @@
 
 CREATE TABLE IF NOT EXISTS Rubros (
 	IDRubro INT PRIMARY KEY, -- INT para crear PKs compuestas por los Rubros y Subrubros
-	nombre VARCHAR(50)
+	nombre VARCHAR(50),
+	row_hash BIGINT NOT NULL DEFAULT 0 -- Hash del contenido de la fila, para detectar cambios en el origen (SCD tipo 1)
 );
 
 
@@ -12,6 +13,7 @@ CREATE TABLE IF NOT EXISTS Articulos (
 	IDArticulo INT PRIMARY KEY, -- INT para crear PKs compuestas por los Códigos de Articulos y SubCódigos de Articulos
 	nombre VARCHAR(100),
 	rubro INT,
+	row_hash BIGINT NOT NULL DEFAULT 0,
 	FOREIGN KEY (rubro) REFERENCES Rubros(IDRubro)
 );
 
@@ -23,7 +25,8 @@ CREATE TABLE IF NOT EXISTS Articulos (
 
 CREATE TABLE IF NOT EXISTS Orden (
 	NroOrden INT PRIMARY KEY,
-	total_venta DECIMAL(10, 2)
+	total_venta DECIMAL(10, 2),
+	row_hash BIGINT NOT NULL DEFAULT 0
 );
 
 
@@ -49,6 +52,7 @@ CREATE TABLE IF NOT EXISTS Clientes (
 	razon_social VARCHAR(200),
 	tipo_cliente INT,
 	localidad INT,
+	row_hash BIGINT NOT NULL DEFAULT 0,
 	FOREIGN KEY (tipo_cliente) REFERENCES TipoCliente(IDTipoCliente),
 	FOREIGN KEY (localidad) REFERENCES Localidades(IDLocalidad)
 );
@@ -61,7 +65,8 @@ CREATE TABLE IF NOT EXISTS Clientes (
 
 CREATE TABLE IF NOT EXISTS Vendedores (
 	IDVendedor INT PRIMARY KEY,
-	nombre VARCHAR(30)
+	nombre VARCHAR(30),
+	row_hash BIGINT NOT NULL DEFAULT 0
 );
 
 
@@ -83,14 +88,35 @@ CREATE TABLE IF NOT EXISTS Tiempo (
     Anio SMALLINT
 );
 
+-- Una fila por período de cada día. Un Tiempo creado con una fila por fecha y hora de factura debe convertirse
+-- antes con 'utils/migrate_tiempo_periods.sql', que también crea este índice
+CREATE UNIQUE INDEX IF NOT EXISTS tiempo_fecha_key ON Tiempo (Fecha);
+
+
+
+-------------------------------------------------------------
+-- 					Hash de las filas de las dimensiones
+-------------------------------------------------------------
+
+-- Para los data warehouses creados antes de las columnas 'row_hash'. Las filas existentes quedan con hash 0, así la
+-- siguiente ejecución las sobrescribe con los valores actuales del origen y guarda su hash real
+ALTER TABLE Rubros ADD COLUMN IF NOT EXISTS row_hash BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE Articulos ADD COLUMN IF NOT EXISTS row_hash BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE Orden ADD COLUMN IF NOT EXISTS row_hash BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE Clientes ADD COLUMN IF NOT EXISTS row_hash BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE Vendedores ADD COLUMN IF NOT EXISTS row_hash BIGINT NOT NULL DEFAULT 0;
+
 
 
 -------------------------------------------------------------
 -- 					Tabla de Hechos "Renglon_Factura"
 -------------------------------------------------------------
 
+-- Particionada por rango, por mes de la fecha de venta. El ETL crea y mantiene las particiones ('renglon_factura_YYYY_MM')
+-- y sus índices (B-tree sobre las claves foráneas, BRIN sobre Fecha) ('modules/fact_partitions.py')
 CREATE TABLE IF NOT EXISTS Renglon_Factura (
-	IDRenglon_Factura SERIAL PRIMARY KEY,
+	IDRenglon_Factura SERIAL,
+	Fecha DATE NOT NULL, -- Día de la venta, clave de partición
 	IDFecha INT,
 	IDArticulo INT,
 	IDCliente INT,
@@ -104,5 +130,69 @@ CREATE TABLE IF NOT EXISTS Renglon_Factura (
     FOREIGN KEY (IDArticulo) REFERENCES Articulos(IDArticulo),
     FOREIGN KEY (IDCliente) REFERENCES Clientes(IDCliente),
     FOREIGN KEY (IDVendedor) REFERENCES Vendedores(IDVendedor),
-	FOREIGN KEY (NroOrden) REFERENCES Orden(NroOrden)
-)
\ No newline at end of file
+	FOREIGN KEY (NroOrden) REFERENCES Orden(NroOrden),
+	PRIMARY KEY (IDRenglon_Factura, Fecha)
+) PARTITION BY RANGE (Fecha);
+
+-- En los data warehouses creados antes de las particiones, la tabla sigue siendo una tabla común y el ETL maneja sus
+-- índices de la misma forma. Sus filas existentes se pueden completar y mover a particiones con 'utils/partition_renglon_factura.sql'
+ALTER TABLE Renglon_Factura ADD COLUMN IF NOT EXISTS Fecha DATE;
+
+
+
+-------------------------------------------------------------
+-- 					Tablas de Agregados
+-------------------------------------------------------------
+
+-- Ventas preagregadas de los tableros. El ETL recalcula solo los días (y meses) afectados por cada carga
+CREATE TABLE IF NOT EXISTS Ventas_Diarias_Articulo (
+	Fecha DATE,
+	IDArticulo INT,
+	total_venta DECIMAL(14, 2),
+	cantidad_articulos DECIMAL(14, 2),
+	renglones INT,
+	ordenes INT,
+	PRIMARY KEY (Fecha, IDArticulo)
+);
+
+
+CREATE TABLE IF NOT EXISTS Ventas_Mensuales_Vendedor_Rubro (
+	Anio SMALLINT,
+	Mes_numero SMALLINT,
+	IDVendedor INT,
+	IDRubro INT,
+	total_venta DECIMAL(14, 2),
+	cantidad_articulos DECIMAL(14, 2),
+	renglones INT,
+	ordenes INT,
+	PRIMARY KEY (Anio, Mes_numero, IDVendedor, IDRubro)
+);
+
+
+
+-------------------------------------------------------------
+-- 					Transacciones de las ejecuciones del ETL
+-------------------------------------------------------------
+
+-- Cada carga de una ejecución inserta su fila dentro de su propia transacción, así una ejecución reanudada ('--resume')
+-- puede saber si la carga de la ejecución interrumpida fue confirmada
+CREATE TABLE IF NOT EXISTS ETL_Run_Transactions (
+	Run_ID VARCHAR(20),
+	Transaction_name VARCHAR(50),
+	committed_at TIMESTAMP DEFAULT now(),
+	PRIMARY KEY (Run_ID, Transaction_name)
+);
+
+
+
+-------------------------------------------------------------
+-- 					Marcas de extracción incremental
+-------------------------------------------------------------
+
+-- Marca de agua de cada tabla de origen incremental ('CabVentas', 'ItemVentas'), escrita por la transacción de carga
+-- de la ejecución que la avanzó. Un data warehouse sin marcas las inicializa desde la tabla de hechos en su siguiente ejecución
+CREATE TABLE IF NOT EXISTS ETL_Watermarks (
+	Source_table VARCHAR(50) PRIMARY KEY,
+	Watermark BIGINT,
+	updated_at TIMESTAMP DEFAULT now()
+);
@@ -0,0 +1,161 @@
+from sqlalchemy import text
+
+from modules.load_session import dwConnection
+
+
+# Aggregate tables of the dashboards, maintained by the ETL over the fact table.
+# - 'columns': column of the aggregate table -> expression over the fact row 'f', its 'tiempo' row 't' and the 'joins'.
+# - 'scope': columns that identify the groups refreshed together (every group of a day, or of a month), so a load
+#   only recomputes the groups of the periods it touched.
+# - 'joins': other dimensions needed by the expressions.
+# - 'dimensions': column of the fact row -> columns of the dimension row it references that the groups depend on.
+#   When a load overwrites one of them (SCD type 1), the periods of the fact rows that reference the row are recomputed.
+AGGREGATE_TABLES = {
+    'ventas_diarias_articulo': {
+        'columns': {'fecha': 'CAST(t.fecha AS DATE)', 'idarticulo': 'f.idarticulo'},
+        'scope': ['fecha'],
+        'joins': [],
+        'dimensions': {}
+    },
+    'ventas_mensuales_vendedor_rubro': {
+        'columns': {'anio': 't.anio', 'mes_numero': 't.mes_numero', 'idvendedor': 'f.idvendedor', 'idrubro': 'a.rubro'},
+        'scope': ['anio', 'mes_numero'],
+        'joins': ['JOIN articulos a ON a.idarticulo = f.idarticulo'],
+        'dimensions': {'idarticulo': ['rubro']}
+    }
+}
+
+# Measures of every aggregate table: column -> aggregate expression over the fact rows of the group
+AGGREGATE_MEASURES = {
+    'total_venta': 'SUM(f.total_venta_renglon)',
+    'cantidad_articulos': 'SUM(f.cantidad_articulos_renglon)',
+    'renglones': 'COUNT(*)',
+    'ordenes': 'COUNT(DISTINCT f.nroorden)'
+}
+
+
+def changedKeys(changes, key, columns):
+    """
+    Get the keys of the dimension rows overwritten by a load whose value changed in one of the given columns.
+
+    Parameters:
+        changes (dict): The overwritten rows, as they were ('before') and as they are now ('after'),
+            as stored by 'updateDimensionTableIntPK'. Empty if no row was overwritten.
+        key (str): The name of the primary key of the dimension.
+        columns (list): Names of the columns to compare.
+
+    Returns:
+        list: The keys of the changed rows.
+    """
+    if not changes:
+        return []
+
+    before = changes['before'].set_index(key)[columns]
+    after = changes['after'].set_index(key)[columns].reindex(before.index)
+    is_same = ((before == after) | (before.isna() & after.isna())).all(axis=1)
+
+    return [int(value) for value in before.index[~is_same]]
+
+
+def buildRefreshStatements(table, aggregate, fact_table='renglon_factura', measures=AGGREGATE_MEASURES, touched_only=True, changed_columns=()):
+    """
+    Build the statements that refresh the groups of an aggregate table touched by a load.
+
+    The touched groups are the ones whose scope (e.g. the day) contains one of the 'idfecha' given in the
+    ':idfechas' parameter (an array), or one of the fact rows that reference a changed dimension row (the
+    ':changed_<column>' parameters). They are deleted and recomputed from the fact table, so measures that
+    are not additive (e.g. distinct orders) stay exact, and the cost depends on the size of the touched periods.
+
+    The fact rows are read between the ':fecha_desde' and ':fecha_hasta' parameters, the days of the touched
+    periods given by the bounds statement, so only the partitions of those periods are scanned.
+
+    Parameters:
+        table (str): The name of the aggregate table.
+        aggregate (dict): Declaration of the table, as in 'AGGREGATE_TABLES'.
+        fact_table (str, optional): The name of the fact table. Default is 'renglon_factura'
+        measures (dict, optional): Measures of the table, as in 'AGGREGATE_MEASURES'. Default is 'AGGREGATE_MEASURES'
+        touched_only (bool, optional): If False, the statements empty and recompute the whole table,
+            and take no parameters. Default is True
+        changed_columns (iterable, optional): Columns of the fact rows whose changed keys are given. Default is ()
+
+    Returns:
+        tuple: The DELETE (or TRUNCATE), the bounds (None if 'touched_only' is False) and the INSERT statements (str).
+    """
+    group_expressions = list(aggregate['columns'].values())
+    scope_expressions = [aggregate['columns'][column] for column in aggregate['scope']]
+
+    touched_scopes = [f"SELECT DISTINCT {', '.join(scope_expressions)} FROM tiempo t WHERE t.idfecha = ANY(:idfechas)"]
+    for column in changed_columns:
+        touched_scopes.append(f"SELECT DISTINCT {', '.join(scope_expressions)} FROM {fact_table} f JOIN tiempo t ON t.idfecha = f.idfecha "
+                              f"WHERE f.{column} = ANY(:changed_{column})")
+    touched_scopes = " UNION ".join(touched_scopes)
+
+    if touched_only:
+        delete = f"DELETE FROM {table} WHERE ({', '.join(aggregate['scope'])}) IN ({touched_scopes})"
+        bounds = (f"SELECT CAST(MIN(t.fecha) AS DATE), CAST(MAX(t.fecha) AS DATE) FROM tiempo t "
+                  f"WHERE ({', '.join(scope_expressions)}) IN ({touched_scopes})")
+        where = f"WHERE f.fecha BETWEEN :fecha_desde AND :fecha_hasta AND ({', '.join(scope_expressions)}) IN ({touched_scopes}) "
+    else:
+        delete = f"TRUNCATE {table}"
+        bounds = None
+        where = ""
+
+    insert = (f"INSERT INTO {table} ({', '.join(list(aggregate['columns']) + list(measures))}) "
+              f"SELECT {', '.join(group_expressions + list(measures.values()))} "
+              f"FROM {fact_table} f JOIN tiempo t ON t.idfecha = f.idfecha {' '.join(aggregate['joins'])} "
+              f"{where}GROUP BY {', '.join(group_expressions)}")
+
+    return delete, bounds, insert
+
+
+def refreshAggregateTables(engine, idfechas=None, dimension_changes=None, aggregates=AGGREGATE_TABLES, fact_table='renglon_factura'):
+    """
+    Refresh the aggregate tables for the periods touched by a load of the fact table.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine or dict): Database engine, or a load session (see 'modules.load_session').
+        idfechas (iterable, optional): The 'idfecha' of the loaded fact rows. If None, the aggregate tables are
+            rebuilt from the whole fact table (e.g. after a full reload). Default is None
+        dimension_changes (dict, optional): Column of the fact rows -> the rows overwritten by the load in the
+            dimension it references (see 'changes' in 'updateDimensionTableIntPK'). Default is None
+        aggregates (dict, optional): Aggregate tables, as in 'AGGREGATE_TABLES'. Default is 'AGGREGATE_TABLES'
+        fact_table (str, optional): The name of the fact table. Default is 'renglon_factura'
+
+    Returns:
+        dict: Aggregate table name -> number of rows written.
+    """
+    touched_only = idfechas is not None
+    if touched_only:
+        idfechas = [int(idfecha) for idfecha in idfechas]
+    dimension_changes = dimension_changes or {}
+
+    rows = {}
+    with dwConnection(engine) as conn:
+        for table, aggregate in aggregates.items():
+            if not touched_only:
+                # Without touched periods, every period is touched: the whole table is rebuilt
+                delete, _, insert = buildRefreshStatements(table, aggregate, fact_table, touched_only=False)
+                conn.execute(text(delete))
+                rows[table] = conn.execute(text(insert)).rowcount
+                continue
+
+            # The periods of the loaded rows, and the ones of the fact rows whose dimension rows changed
+            params = {'idfechas': idfechas}
+            changed_columns = []
+            for column, columns in aggregate['dimensions'].items():
+                keys = changedKeys(dimension_changes.get(column), column, columns)
+                if keys:
+                    params[f'changed_{column}'] = keys
+                    changed_columns.append(column)
+            delete, bounds, insert = buildRefreshStatements(table, aggregate, fact_table, changed_columns=changed_columns)
+
+            # Days of the touched periods, given as literals so the planner only scans their partitions
+            fecha_desde, fecha_hasta = conn.execute(text(bounds), params).one()
+            if fecha_desde is None:
+                rows[table] = 0
+                continue
+
+            conn.execute(text(delete), params)
+            rows[table] = conn.execute(text(insert), dict(params, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)).rowcount
+
+    return rows
@@ -0,0 +1,341 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from modules.key_encoding import encodeArticuloId
+from modules.source_pushdown import applyArrowFilters
+from modules.source_schema import SOURCE_SCHEMAS, STRING, applySchema
+from modules.string_normalization import compileRuleSet, normalizeValue, RAZON_SOCIAL_RULES
+
+
+# Source tables extracted and cleaned as Arrow tables with '--arrow' (the other tables are small, and stay in pandas)
+ARROW_SOURCE_TABLES = ('CabVentas', 'ItemVentas')
+
+# Arrow type of each dtype of the source schemas ('category' columns are plain strings while they are cleaned)
+ARROW_TYPES = {
+    'Int16': pa.int16(),
+    'Int32': pa.int32(),
+    'Int64': pa.int64(),
+    'float64': pa.float64(),
+    'category': pa.string(),
+    STRING: pa.string()
+}
+
+# Dtypes of the cleaned tables, the same as the ones of the pandas cleaning ('transformCabVentas', 'transformItemVentas')
+CABVENTAS_FILTERED_DTYPES = {
+    'NroOrden': 'Int64',
+    'Cod_Comprob': 'category',
+    'Cod_Vendedor': 'int64',
+    'Fecha': 'datetime64[ns]',
+    'NroCuenta': 'int64',
+    'Razon_Social': 'object',
+    'total_orden': 'float64'
+}
+ITEMVENTAS_FILTERED_DTYPES = {
+    'NroOrden': 'int64',
+    'idarticulo': 'int64',
+    'cantidad': 'float64',
+    'precio_unitario': 'float64',
+    'precio_unitario_iva': 'float64',
+    'total_renglon': 'float64'
+}
+
+# Column with the position of each row in the extracted table, kept through the cleaning as the index of the result
+ROW_NUMBER = '__row'
+
+
+def _arrowColumn(values, name, table, arrow_type):
+    """
+    Build the Arrow array of a column from the values returned by the driver.
+    Values of another type (e.g. codes as strings) are cast as in 'applySchema' (non integers become nulls,
+    and integers out of the range of the type are kept with a wider one).
+    """
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        series = applySchema(pd.DataFrame({name: values}), table)[name]
+        return pa.array(series.to_numpy(dtype=object, na_value=None), type=ARROW_TYPES.get(str(series.dtype), arrow_type))
+
+
+def readArrowBatches(conn, query, params=None, table=None, memory_limit_mb=256, copies=4, probe_rows=1000):
+    """
+    Read the result of a source query as Arrow record batches, whose size is bounded by a memory ceiling.
+
+    The rows fetched by the driver are converted column by column into typed Arrow arrays, so the values are
+    not boxed again into the object columns of a dataframe. The batches are sized as in 'readTableChunks'.
+
+    Parameters:
+        conn (pyodbc.Connection): Connection to the source database.
+        query (str): The SQL query.
+        params (list, optional): Parameters of the query. Default is None
+        table (str, optional): Name of the source table, to cast the batches to its Arrow schema and filter them
+            with its source filters. Default is None
+        memory_limit_mb (int, optional): Memory ceiling of a batch and its copies, in MB. Default is 256
+        copies (int, optional): Number of copies of a batch alive at the same time during its cleaning. Default is 4
+        probe_rows (int, optional): Number of rows of the first batch. Default is 1000
+
+    Yields:
+        pyarrow.Table: The batches of the result, in order.
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, params or [])
+    columns = [column[0] for column in cursor.description]
+
+    schema = SOURCE_SCHEMAS.get(table, {})
+    if schema:
+        columns_used = [column for column in columns if column in schema]
+    else:
+        columns_used = columns
+
+    batch_rows = probe_rows
+    first_batch = True
+
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+
+        values = dict(zip(columns, zip(*rows)))
+        batch = pa.table({column: _arrowColumn(list(values[column]), column, table, ARROW_TYPES.get(schema.get(column)))
+                          for column in columns_used})
+
+        # Size the next batches with the memory used by the rows of the first one (before filtering, since they are all fetched)
+        if first_batch:
+            bytes_per_row = max(1, batch.nbytes / batch.num_rows)
+            batch_rows = max(probe_rows, int(memory_limit_mb * 1024 ** 2 / (bytes_per_row * copies)))
+            first_batch = False
+
+        if table is not None:
+            batch = applyArrowFilters(batch, table)
+
+        yield batch
+
+    cursor.close()
+
+
+def readArrowTable(conn, query, params=None, table=None):
+    """
+    Read the result of a source query as one Arrow table (see 'readArrowBatches').
+    A query without rows returns an empty table with the declared columns of the source table.
+    """
+    batches = list(readArrowBatches(conn, query, params, table))
+    if batches:
+        # A batch with integers out of the range of their type has a wider one (see '_arrowColumn')
+        return pa.concat_tables(batches, promote_options='permissive')
+
+    schema = SOURCE_SCHEMAS.get(table, {})
+    return pa.table({column: pa.array([], type=ARROW_TYPES.get(dtype, pa.null())) for column, dtype in schema.items()})
+
+
+def toPandas(data, dtypes):
+    """
+    Convert a cleaned Arrow table to a dataframe with the given dtypes, indexed by its 'ROW_NUMBER' column.
+    """
+    df = data.drop([ROW_NUMBER]).to_pandas().astype(dtypes)
+    df.index = pd.Index(data[ROW_NUMBER].to_numpy())
+    return df
+
+
+def _numberRows(data):
+    """
+    Add the 'ROW_NUMBER' column to an extracted table.
+    """
+    return data.append_column(ROW_NUMBER, pa.array(np.arange(data.num_rows, dtype=np.int64)))
+
+
+def _toTimestamp(values):
+    """
+    Cast a column of dates, datetimes or ISO 8601 strings to timestamps.
+    """
+    if pa.types.is_timestamp(values.type):
+        return values
+    return values.cast(pa.timestamp('us'))
+
+
+def _replaceMissing(values, replacements, default):
+    """
+    Replace the nulls, and the values in 'replacements', with 'default'.
+    """
+    default = pa.scalar(default).cast(values.type)
+    missing = pc.is_null(values)
+    if replacements:
+        missing = pc.or_(missing, pc.fill_null(pc.is_in(values, value_set=pa.array(replacements).cast(values.type)), False))
+    return pc.if_else(missing, default, values)
+
+
+def resolveArrowKeys(values, key_index, default=None, name=None, miss_counts=None):
+    """
+    Resolve a column of natural keys to surrogate keys with the Arrow 'index_in' kernel, as 'resolveKeys' does in pandas.
+
+    Parameters:
+        values (pyarrow.ChunkedArray): Natural keys to resolve.
+        key_index (dict): Index of the dimension, as returned by 'buildKeyIndex'.
+        default (optional): Surrogate key of the default member. If None, the misses are left null. Default is None
+        name (str, optional): Name of the dimension, used as the key of 'miss_counts'. Default is None
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pyarrow.ChunkedArray: The surrogate keys.
+    """
+    natural_keys = pa.array(key_index['index'])
+    surrogate_keys = pa.array(key_index['surrogate'], from_pandas=True)
+
+    # Integer keys are compared as int64, whatever the width of each side
+    if pa.types.is_integer(values.type) and pa.types.is_integer(natural_keys.type):
+        values = values.cast(pa.int64())
+        natural_keys = natural_keys.cast(pa.int64())
+    else:
+        natural_keys = natural_keys.cast(values.type)
+
+    positions = pc.index_in(values, value_set=natural_keys)
+    missing = pc.is_null(positions)
+
+    if miss_counts is not None:
+        miss_counts[name] = miss_counts.get(name, 0) + pc.sum(missing).as_py()
+
+    resolved = pc.take(surrogate_keys, positions)
+    if default is not None:
+        resolved = pc.fill_null(resolved, pa.scalar(default).cast(resolved.type))
+    return resolved
+
+
+def normalizeArrowColumn(values, rule_set):
+    """
+    Normalize a column with a rule set, evaluating the rules only once per distinct value (see 'normalizeColumn').
+
+    The column is dictionary encoded, the rules are applied to each value of the dictionary, and the results
+    are taken back to the rows through the indices.
+
+    Parameters:
+        values (pyarrow.ChunkedArray): The column to normalize.
+        rule_set (dict): Rule set, with the same format as 'LOCALIDAD_RULES'.
+
+    Returns:
+        pyarrow.Array: The normalized column.
+    """
+    encoded = pc.dictionary_encode(values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values)
+    dictionary = encoded.dictionary.to_pylist()
+
+    compiled_rules = compileRuleSet(rule_set)
+    normalized = [normalizeValue(value, rule_set, compiled_rules) for value in dictionary]
+
+    # The last position holds the result for nulls, so the null indices are pointed to it
+    normalized.append(rule_set['na_value'])
+
+    return pc.take(pa.array(normalized), pc.fill_null(encoded.indices, len(dictionary)))
+
+
+def transformCabVentasArrow(cabventas, vendedores_index, clientes_index, codigo_vendedor_todos, nroCuenta_consumidorFinal, miss_counts=None):
+    """
+    Clean the 'CabVentas' (invoices) source table with Arrow kernels, with the same rules as 'parseCabVentasFecha',
+    the removal of the duplicated 'Fecha' and 'transformCabVentas'.
+
+    Parameters:
+        cabventas (pyarrow.Table): Rows of the 'CabVentas' source table, as returned by 'readArrowTable'.
+        vendedores_index (dict): Index of the vendor codes, as returned by 'buildKeyIndex'. If None, the codes
+            are not resolved here, but by the load (see 'loadFactTableELT').
+        clientes_index (dict): Index of the client accounts, as returned by 'buildKeyIndex'. If None, the accounts
+            are not resolved here, but by the load.
+        codigo_vendedor_todos (int): Code of the vendor named "TODOS".
+        nroCuenta_consumidorFinal (int): Account of the client "CONSUMIDOR FINAL".
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.DataFrame: The same dataframe as the pandas cleaning.
+    """
+    data = _numberRows(cabventas)
+
+    # The 'Fecha' of each invoice is the day of 'FechaComp' at the time of day of 'Hora'
+    fechaComp = _toTimestamp(data['FechaComp'])
+    hora = _toTimestamp(data['Hora'])
+    fecha = pc.add(pc.floor_temporal(fechaComp, unit='day'), pc.subtract(hora, pc.floor_temporal(hora, unit='day')))
+    data = data.append_column('Fecha', fecha)
+
+    # Remove duplicate records from the 'Fecha' column, keeping the first one
+    first_rows = data.group_by('Fecha').aggregate([(ROW_NUMBER, 'min')])[f'{ROW_NUMBER}_min']
+    data = data.filter(pc.is_in(data[ROW_NUMBER], value_set=first_rows))
+
+    # Default member of the vendors for the null or 0 codes, and for the codes not found in 'df_VendedorFiltered'
+    cod_vendedor = _replaceMissing(data['Cod_Vendedor'], [0], codigo_vendedor_todos)
+    if vendedores_index is not None:
+        cod_vendedor = resolveArrowKeys(cod_vendedor, vendedores_index, default=codigo_vendedor_todos, name='vendedores', miss_counts=miss_counts)
+
+    # Account of the "CONSUMIDOR FINAL" for the null or 0 accounts, and for the accounts not found in 'df_ClientesFiltered'
+    nroCuenta = _replaceMissing(data['NroCuenta'], [0], nroCuenta_consumidorFinal)
+    if clientes_index is not None:
+        nroCuenta = resolveArrowKeys(nroCuenta, clientes_index, default=nroCuenta_consumidorFinal, name='clientes', miss_counts=miss_counts)
+
+    # Null, empty, cancelled and annulled 'Razon_Social' are "CONSUMIDOR FINAL" (see 'RAZON_SOCIAL_RULES'), and so are the
+    # invoices of the "CONSUMIDOR FINAL" account
+    razon_social = normalizeArrowColumn(data['Razon_Social'], RAZON_SOCIAL_RULES)
+    is_consumidorFinal = pc.fill_null(pc.equal(nroCuenta, pa.scalar(nroCuenta_consumidorFinal).cast(nroCuenta.type)), False)
+    razon_social = pc.if_else(is_consumidorFinal, 'CONSUMIDOR FINAL', razon_social)
+
+    data = pa.table({
+        'NroOrden': data['NroOrden'],
+        'Cod_Comprob': data['Cod_Comprob'],
+        'Cod_Vendedor': cod_vendedor.cast(pa.int64()),
+        'Fecha': data['Fecha'],
+        'NroCuenta': nroCuenta.cast(pa.int64()),
+        'Razon_Social': razon_social,
+        'total_orden': data['total'],
+        ROW_NUMBER: data[ROW_NUMBER]
+    })
+
+    # If the total is 0, negative, or empty, delete the record
+    data = data.filter(pc.greater(data['total_orden'], 0))
+
+    return toPandas(data, CABVENTAS_FILTERED_DTYPES)
+
+
+def transformItemVentasArrow(itemventas, nroOrdenes, articulos_index, codigo_articulo_otro, miss_counts=None):
+    """
+    Clean the 'ItemVentas' (invoice lines) source table with Arrow kernels, with the same rules as 'transformItemVentas'.
+
+    Parameters:
+        itemventas (pyarrow.Table): Rows of the 'ItemVentas' source table (or a batch of them), as returned by 'readArrowTable'.
+        nroOrdenes (pandas.Series): Order numbers kept after filtering 'CabVentas'.
+        articulos_index (dict): Index of the 'Articulos' dimension, as returned by 'buildKeyIndex'. If None, the ids
+            are not resolved here, but by the load (see 'loadFactTableELT').
+        codigo_articulo_otro (int): Article id of the article named "OTRO".
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.DataFrame: The same dataframe as 'transformItemVentas'.
+    """
+    data = _numberRows(itemventas)
+
+    # Filter the records by 'nroorden' that are in 'df_CabVentasFiltered'
+    nroOrdenes = pa.Array.from_pandas(nroOrdenes).cast(data['nroorden'].type)
+    data = data.filter(pc.is_in(data['nroorden'], value_set=nroOrdenes, skip_nulls=True))
+
+    # Null, negative or 0 'codigo' are the code of 'OTRO' (999998), and null or negative 'subcodigo' are 0
+    codigo = pc.fill_null(data['codigo'], 999998)
+    codigo = pc.if_else(pc.less_equal(codigo, 0), pa.scalar(999998).cast(codigo.type), codigo)
+    subcodigo = pc.fill_null(data['subcodigo'], 0)
+    subcodigo = pc.if_else(pc.less(subcodigo, 0), pa.scalar(0).cast(subcodigo.type), subcodigo)
+
+    # Compose the 'IDArticulo' from the codigo and subcodigo (6 and 2 digits), over the buffers of the columns
+    # An id that can not be composed is left invalid, so it is replaced by the article "OTRO" below
+    idarticulo = pa.chunked_array([encodeArticuloId(codigo.to_numpy(), subcodigo.to_numpy(), errors='coerce')])
+
+    if articulos_index is not None:
+        idarticulo = resolveArrowKeys(idarticulo, articulos_index, default=codigo_articulo_otro, name='articulos', miss_counts=miss_counts)
+
+    data = pa.table({
+        'NroOrden': data['nroorden'].cast(pa.int64()),
+        'idarticulo': idarticulo.cast(pa.int64()),
+        'cantidad': data['cantidad'].cast(pa.float64()),
+        'precio_unitario': data['prec_unit'].cast(pa.float64()),
+        'precio_unitario_iva': data['prec_unit_iv'].cast(pa.float64()),
+        'total_renglon': data['total'].cast(pa.float64()),
+        ROW_NUMBER: data[ROW_NUMBER]
+    })
+
+    # Delete the records whose 'cantidad' or 'total' are 0, negative or empty, or whose prices are negative or empty
+    valid = pc.and_kleene(pc.and_kleene(pc.greater(data['cantidad'], 0), pc.greater_equal(data['precio_unitario'], 0)),
+                          pc.and_kleene(pc.greater_equal(data['precio_unitario_iva'], 0), pc.greater(data['total_renglon'], 0)))
+    data = data.filter(valid)
+
+    return toPandas(data, ITEMVENTAS_FILTERED_DTYPES)
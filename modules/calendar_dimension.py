@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from modules.update_dimensions_table import antiJoinNaturalKey, bulkInsert
+from modules.load_session import dwConnection
+
+
+# Periods of the day of the 'Tiempo' dimension: (start hour, name). Each row of the dimension is one period of one day,
+# and its 'fecha' is the timestamp where the period starts.
+PERIODOS = [(0, 'Mañana'), (12, 'Tarde')]
+
+# Spanish names of the days of the week (indexed by 'dayofweek', Monday is 0) and of the months (indexed by month - 1)
+DIAS_NOMBRES = np.array(['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'], dtype=object)
+MESES_NOMBRES = np.array(['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+                          'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'], dtype=object)
+
+
+def generateCalendar(start, end, periodos=PERIODOS):
+    """
+    Generate the rows of the 'Tiempo' dimension for every period of every day between two dates.
+
+    All the attributes are computed at once for the whole range, indexing lookup arrays with the day of the week and the month.
+
+    Parameters:
+        start: First date of the range (its time is ignored).
+        end: Last date of the range, included (its time is ignored).
+        periodos (list, optional): Periods of the day, as (start hour, name). Default is 'PERIODOS'
+
+    Returns:
+        pandas.DataFrame: Dataframe with the columns of the 'Tiempo' dimension, except 'idfecha'.
+    """
+    dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+
+    period_hours = np.array([hour for hour, _ in periodos], dtype='timedelta64[h]')
+    period_names = np.array([name for _, name in periodos], dtype=object)
+
+    # One row per (day, period), with 'fecha' at the start of the period
+    fecha = pd.DatetimeIndex((dates.values[:, np.newaxis] + period_hours[np.newaxis, :]).ravel())
+    period_index = np.tile(np.arange(len(periodos)), len(dates))
+
+    mes_numero = fecha.month.values
+    trimestre = (mes_numero - 1) // 3 + 1
+
+    return pd.DataFrame({
+        'fecha': fecha,
+        'periodo': period_names[period_index],
+        'dia_nombre': DIAS_NOMBRES[fecha.dayofweek.values],
+        'diames_numero': fecha.day.values,
+        'mes_nombre': MESES_NOMBRES[mes_numero - 1],
+        'mes_numero': mes_numero,
+        'trimestre': trimestre,
+        'semestre': np.where(trimestre <= 2, 1, 2),
+        'anio': fecha.year.values
+    })
+
+
+def floorToPeriod(fechas, periodos=PERIODOS):
+    """
+    Floor timestamps to the start of their period of the day, which is the 'fecha' of their row in the 'Tiempo' dimension.
+
+    Parameters:
+        fechas (pandas.Series): Timestamps (e.g. the 'Fecha' of the invoices).
+        periodos (list, optional): Periods of the day, as (start hour, name). Default is 'PERIODOS'
+
+    Returns:
+        pandas.Series: The floored timestamps, with the same index as 'fechas'.
+    """
+    period_hours = np.array([hour for hour, _ in periodos])
+    period_index = np.searchsorted(period_hours, fechas.dt.hour.values, side='right') - 1
+
+    return fechas.dt.normalize() + pd.to_timedelta(period_hours[period_index], unit='h')
+
+
+def _checkCalendarGrain(conn, table, existing, calendar):
+    """
+    Raise an error if the calendar dimension still has the old grain (one row per invoice timestamp): it has no unique
+    index on 'fecha' (it could not be created over the repeated timestamps), or the rows read for the range are not
+    the start of a period. It has to be converted with 'utils/migrate_tiempo_periods.sql' first.
+    """
+    has_unique_fecha = conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+        "WHERE i.indrelid = to_regclass(:table) AND i.indisunique AND i.indnatts = 1 AND a.attname = 'fecha')"),
+        {'table': table}).scalar()
+
+    off_grain = ~existing['fecha'].isin(calendar['fecha'])
+
+    if not has_unique_fecha or off_grain.any():
+        raise ValueError(f"The '{table}' table has the grain of the invoice timestamps (no unique index on 'fecha', or "
+                         f"{off_grain.sum()} rows in the range that are not the start of a period), "
+                         f"convert it with 'utils/migrate_tiempo_periods.sql'")
+
+
+def updateCalendarDimension(engine, table, start, end, pk="idfecha", periodos=PERIODOS):
+    """
+    Make sure the calendar dimension has the rows of every period between two dates, and return those rows.
+
+    Only the rows of the range are read from the database (through the unique index on 'fecha'), and only
+    the missing ones are generated and inserted, so the cost depends on the length of the range and not
+    on the size of the dimension or on the number of invoices.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine or dict): Database engine, or a load session (see 'modules.load_session').
+        table (str): The name of the calendar dimension table.
+        start: First date of the range.
+        end: Last date of the range, included.
+        pk (str, optional): Name of the primary key. Default is "idfecha"
+        periodos (list, optional): Periods of the day, as (start hour, name). Default is 'PERIODOS'
+
+    Returns:
+        pandas.DataFrame: The rows of the dimension between 'start' and 'end', with their primary keys.
+    """
+    if pd.isna(start) or pd.isna(end):
+        return pd.DataFrame(columns=[pk, 'fecha'])
+
+    calendar = generateCalendar(start, end, periodos)
+
+    with dwConnection(engine) as conn:
+        existing = pd.read_sql(text(f"SELECT * FROM {table} WHERE fecha BETWEEN :start AND :end"), conn,
+                               params={'start': calendar['fecha'].min().to_pydatetime(),
+                                       'end': calendar['fecha'].max().to_pydatetime()})
+
+        _checkCalendarGrain(conn, table, existing, calendar)
+
+        # Insert the missing periods; the unique index on 'fecha' guarantees they are never duplicated
+        missing = antiJoinNaturalKey(calendar, existing.drop(pk, axis=1), 'fecha')
+        inserted = bulkInsert(conn, table, missing, conflict_pk='fecha')
+
+    if inserted.empty:
+        return existing
+    if existing.empty:
+        return inserted
+
+    return pd.concat([existing, inserted[existing.columns]], ignore_index=True)
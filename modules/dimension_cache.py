@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# Table of the cache file that stores, for each cached dimension, the state of the DW table it was taken from
+STATE_TABLE = 'dimension_state'
+
+# Seconds a connection waits for the lock of the cache file, which is written by dimensions updated concurrently
+CACHE_TIMEOUT = 60
+
+
+def queryDimensionState(conn, table, pk, hash_column=None):
+    """
+    Query the cheap fingerprint of a dimension table: its number of rows, its maximum primary key and, if the table
+    has a content hash column, the sum of its hashes (so an update in place, which changes neither the row count
+    nor the maximum key, changes the fingerprint).
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse.
+        table (str): The name of the dimension table.
+        pk (str): Name of the primary key.
+        hash_column (str, optional): Column with the content hash of each row. Default is None
+
+    Returns:
+        tuple: (row count, maximum primary key or None if the table is empty, sum of the hashes or None).
+    """
+    hash_sum = f"SUM({hash_column})" if hash_column is not None else "NULL"
+    row_count, max_pk, hash_sum = conn.execute(text(f"SELECT COUNT(*), MAX({pk}), {hash_sum} FROM {table}")).one()
+    return int(row_count), None if max_pk is None else int(max_pk), None if hash_sum is None else int(hash_sum)
+
+
+def _dimensionState(dimension_df, pk, hash_column=None):
+    """
+    Compute the fingerprint of a dimension dataframe, in the same format as 'queryDimensionState'.
+    """
+    if dimension_df.empty:
+        return 0, None, None
+    # The hashes are summed as Python integers, which do not overflow (as the NUMERIC sum of PostgreSQL)
+    hash_sum = None if hash_column is None else int(dimension_df[hash_column].astype('int64').astype(object).sum())
+    return len(dimension_df), int(dimension_df[pk].max()), hash_sum
+
+
+def _hasStateTable(cache):
+    """
+    Return True if the cache file has the state table, with its current columns. A state table written
+    by an older version is dropped, so every cached dimension is read again from the DW and re-cached.
+    """
+    columns = [row[1] for row in cache.execute(f"PRAGMA table_info({STATE_TABLE})")]
+    if columns and 'hash_sum' not in columns:
+        cache.execute(f"DROP TABLE {STATE_TABLE}")
+        return False
+    return len(columns) > 0
+
+
+def readCachedDimension(cache_path, table, state):
+    """
+    Read a dimension from the local cache, if the cache is still valid.
+
+    The cache is valid if the row count, maximum primary key and sum of the hashes stored with it match the given
+    state of the DW table.
+
+    Parameters:
+        cache_path (str): Path of the SQLite cache file.
+        table (str): The name of the dimension table.
+        state (tuple): Current state of the DW table, as returned by 'queryDimensionState'.
+
+    Returns:
+        pandas.DataFrame: The cached dimension, or None if there is no valid cache for it.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with closing(sqlite3.connect(cache_path, timeout=CACHE_TIMEOUT)) as cache, cache:
+        if not _hasStateTable(cache):
+            return None
+
+        cached_state = cache.execute(f"SELECT row_count, max_pk, hash_sum, dtypes FROM {STATE_TABLE} WHERE dimension = ?", (table,)).fetchone()
+        # The sum of the hashes is stored as text, since it does not fit in an SQLite integer
+        if cached_state is None or (cached_state[0], cached_state[1], None if cached_state[2] is None else int(cached_state[2])) != tuple(state):
+            return None
+
+        dimension_df = pd.read_sql(f'SELECT * FROM "{table}"', cache)
+
+    # SQLite does not keep the pandas dtypes (e.g. timestamps are stored as text), so they are restored
+    return dimension_df.astype(json.loads(cached_state[3]))
+
+
+def writeCachedDimension(cache_path, table, dimension_df, pk, new_rows=None, hash_column=None):
+    """
+    Store a dimension in the local cache, together with its state. It must only be called once the rows of
+    'dimension_df' are committed in the DW: a cache written before a rollback would be valid for the old rows.
+
+    Parameters:
+        cache_path (str): Path of the SQLite cache file.
+        table (str): The name of the dimension table.
+        dimension_df (pandas.DataFrame): The whole dimension, with its primary keys as they are in the database.
+        pk (str): Name of the primary key.
+        new_rows (pandas.DataFrame, optional): If given, only these rows are appended to the cached dimension,
+            which must be valid. If None, the cached dimension is replaced by 'dimension_df'. Default is None
+        hash_column (str, optional): Column with the content hash of each row, as in 'queryDimensionState'. Default is None
+    """
+    row_count, max_pk, hash_sum = _dimensionState(dimension_df, pk, hash_column)
+    dtypes = json.dumps({column: str(dtype) for column, dtype in dimension_df.dtypes.items()})
+
+    with closing(sqlite3.connect(cache_path, timeout=CACHE_TIMEOUT)) as cache, cache:
+        if not _hasStateTable(cache):
+            cache.execute(f"CREATE TABLE {STATE_TABLE} (dimension TEXT PRIMARY KEY, row_count INTEGER, max_pk INTEGER, hash_sum TEXT, dtypes TEXT)")
+
+        if new_rows is None:
+            dimension_df.to_sql(table, cache, if_exists='replace', index=False)
+        elif not new_rows.empty:
+            new_rows[dimension_df.columns].to_sql(table, cache, if_exists='append', index=False)
+
+        cache.execute(f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, ?, ?, ?)",
+                      (table, row_count, max_pk, None if hash_sum is None else str(hash_sum), dtypes))
@@ -0,0 +1,360 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import text
+
+from modules.load_session import dwConnection
+from modules.source_schema import applySchema
+from modules.source_pushdown import buildSelectList, buildWhereClauses, applyFallbackFilters
+from modules.arrow_pipeline import readArrowTable
+
+
+# Source tables that are extracted incrementally.
+# For each table: the source column used as high-water mark, and the DW table and column its first mark is seeded from.
+# Both marks are seeded from the fact table: the invoice lines are only loaded for the orders extracted in the same run,
+# so a 'CabVentas' mark seeded from 'orden' (loaded as a dimension, possibly ahead of the fact table) would skip the
+# lines of the orders between the two marks forever. The orders of a trailing window below the marks are extracted
+# and loaded again by every run (see 'lookbackWatermarks'), for the lines written after their order was loaded.
+# 'bounded_by': the mark of 'ItemVentas' never goes past the mark of 'CabVentas' (see 'boundWatermarks')
+WATERMARK_COLUMNS = {
+    'CabVentas': {'column': 'NroOrden', 'dw_table': 'renglon_factura', 'dw_column': 'nroorden'},
+    'ItemVentas': {'column': 'nroorden', 'dw_table': 'renglon_factura', 'dw_column': 'nroorden', 'bounded_by': 'CabVentas'}
+}
+
+
+def queryDWWatermark(engine, dw_table, dw_column):
+    """
+    Query the maximum value of a column already loaded in the data warehouse.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine): Database engine of the data warehouse.
+        dw_table (str): Name of the DW table.
+        dw_column (str): Name of the DW column.
+
+    Returns:
+        The maximum value, or None if the table is empty.
+    """
+    with engine.connect() as conn:
+        value = conn.execute(text(f"SELECT MAX({dw_column}) FROM {dw_table}")).scalar()
+
+    return value
+
+
+# DW table where the high-water marks are persisted, by the load transaction of the run that advanced them
+WATERMARKS_TABLE = 'etl_watermarks'
+
+
+def loadWatermarks(engine):
+    """
+    Load the high-water marks of the incremental source tables.
+
+    The marks are read from 'WATERMARKS_TABLE'. If a table has no persisted mark (e.g. the first run), the mark
+    is seeded from the maximum value already loaded in the data warehouse (see 'WATERMARK_COLUMNS').
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine): Database engine of the data warehouse.
+
+    Returns:
+        dict: Source table name -> high-water mark (None means "extract everything").
+    """
+    with engine.connect() as conn:
+        watermarks = dict(conn.execute(text(f"SELECT source_table, watermark FROM {WATERMARKS_TABLE}")).all())
+
+    for table, watermark_column in WATERMARK_COLUMNS.items():
+        if watermarks.get(table) is None:
+            watermarks[table] = queryDWWatermark(engine, watermark_column['dw_table'], watermark_column['dw_column'])
+
+    return watermarks
+
+
+def saveWatermarks(engine, watermarks):
+    """
+    Persist the high-water marks of the incremental source tables in 'WATERMARKS_TABLE'.
+
+    With a load session, the marks are written inside its transaction, so they are committed together with the
+    rows they were advanced by: a run that fails before its commit leaves the previous marks, and one that fails
+    after it can not extract (and load) the same rows again.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine or dict): Database engine of the data warehouse, or a load session.
+        watermarks (dict): Source table name -> high-water mark (tables without a mark are skipped).
+    """
+    rows = [{'table': table, 'watermark': watermark} for table, watermark in watermarks.items() if watermark is not None]
+    if not rows:
+        return
+
+    with dwConnection(engine) as conn:
+        conn.execute(text(f"INSERT INTO {WATERMARKS_TABLE} (source_table, watermark) VALUES (:table, :watermark) "
+                          f"ON CONFLICT (source_table) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()"), rows)
+
+
+def lookbackWatermarks(watermarks, orders):
+    """
+    Lower the high-water marks of the incremental tables to the start of a trailing window of orders, so the orders
+    of the window are extracted again, header and lines, and their fact rows can be replaced.
+
+    A line of 'ItemVentas' written after its order was loaded has a 'nroorden' at or below the marks, so it would
+    never be extracted again. The window starts 'orders' orders below the lowest mark, so it also covers the orders
+    whose header was loaded before their lines (the mark of 'ItemVentas' is then below the one of 'CabVentas').
+
+    Parameters:
+        watermarks (dict): Source table name -> high-water mark.
+        orders (int): Number of orders of the window (0 only re-extracts the orders between the marks).
+
+    Returns:
+        tuple: Source table name -> mark each table is extracted from, and the mark the window starts after
+        (the fact rows of the later orders are the ones to replace), or None if a table has no mark
+        (its rows are extracted up to its mark, so no window is applied).
+    """
+    marks = [watermarks.get(table) for table in WATERMARK_COLUMNS]
+    if any(mark is None for mark in marks):
+        return dict(watermarks), None
+
+    reload_after = min(marks) - orders
+    return {**watermarks, **{table: reload_after for table in WATERMARK_COLUMNS}}, reload_after
+
+
+def buildExtractionQuery(table, watermarks, pushdown=True):
+    """
+    Build the query that extracts a source table, restricted to the rows past its high-water mark.
+
+    With pushdown, the query only selects the columns used by the ETL, and the filters and semi-joins the source
+    can evaluate are added to its WHERE clause (see 'modules.source_pushdown'), so fewer bytes are sent over ODBC.
+
+    Parameters:
+        table (str): Name of the source table.
+        watermarks (dict): Source table name -> high-water mark.
+        pushdown (bool, optional): If True, push the projection and the filters down into the query.
+            If False, every column and row is extracted, and the filters are only applied in pandas. Default is True
+
+    Returns:
+        tuple: The SQL query and its list of parameters.
+    """
+    watermark = watermarks.get(table)
+    clauses = []
+    params = []
+
+    if table in WATERMARK_COLUMNS and watermark is not None:
+        clauses.append(f'{WATERMARK_COLUMNS[table]["column"]} > ?')
+        params.append(watermark)
+
+    if pushdown:
+        clauses += buildWhereClauses(table)
+
+    query = f'SELECT {buildSelectList(table) if pushdown else "*"} FROM {table}'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+
+    return query, params
+
+
+def _columnMax(data, column):
+    """
+    Return the maximum of a column of a dataframe or an Arrow table, as a Python value (None if there is none).
+    """
+    if isinstance(data, pa.Table):
+        return pc.max(data[column]).as_py()
+
+    value = data[column].max() if not data.empty else None
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def advanceWatermarks(watermarks, DB_tables):
+    """
+    Compute the new high-water marks after extracting the source tables.
+
+    The mark of each incremental table is the maximum extracted value of its watermark column,
+    or the previous mark if no new rows were extracted (e.g. only the orders of the trailing window).
+
+    Parameters:
+        watermarks (dict): Source table name -> high-water mark used for the extraction.
+        DB_tables (dict): Source table name -> extracted dataframe (or Arrow table).
+
+    Returns:
+        dict: Source table name -> new high-water mark.
+    """
+    new_watermarks = dict(watermarks)
+
+    for table, watermark_column in WATERMARK_COLUMNS.items():
+        if table not in DB_tables or len(DB_tables[table]) == 0:
+            continue
+
+        value = _columnMax(DB_tables[table], watermark_column['column'])
+        if value is not None and (new_watermarks.get(table) is None or value > new_watermarks[table]):
+            new_watermarks[table] = value
+
+    return new_watermarks
+
+
+def boundWatermarks(watermarks):
+    """
+    Keep the mark of each incremental table at or below the mark of the table it is 'bounded_by' in 'WATERMARK_COLUMNS'.
+
+    The lines of 'ItemVentas' past the mark of 'CabVentas' belong to orders that were not extracted (e.g. their header
+    was not written yet at the source), so they were not loaded: they are extracted again by the next run.
+
+    Parameters:
+        watermarks (dict): Source table name -> high-water mark.
+
+    Returns:
+        dict: Source table name -> bounded high-water mark.
+    """
+    bounded_watermarks = dict(watermarks)
+
+    for table, watermark_column in WATERMARK_COLUMNS.items():
+        bound = watermarks.get(watermark_column.get('bounded_by'))
+        if bound is not None and bounded_watermarks.get(table) is not None and bounded_watermarks[table] > bound:
+            bounded_watermarks[table] = bound
+
+    return bounded_watermarks
+
+
+def memoryMB(df):
+    """
+    Return the memory used by a dataframe (including the contents of the object columns) or an Arrow table, in MB.
+    """
+    if isinstance(df, pa.Table):
+        return df.nbytes / 1024 ** 2
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def extractTables(connect, tables, watermarks=None, max_workers=4, pushdown=True, arrow_tables=()):
+    """
+    Extract source tables concurrently, each worker thread reading over its own ODBC connection.
+
+    The big tables ('CabVentas', 'ItemVentas') dominate the extraction time, so reading the small ones
+    alongside them makes the wall time close to the time of the slowest table instead of the sum of all of them.
+
+    Every table is compacted with its dtype schema (see 'modules.source_schema') and filtered with its source filters
+    (see 'modules.source_pushdown') as soon as it is read, so only the used columns and rows are kept, with compact dtypes.
+
+    The tables in 'arrow_tables' are read as Arrow tables (see 'modules.arrow_pipeline'), compacted with the Arrow
+    types of their schema and filtered with the Arrow version of their source filters.
+
+    Parameters:
+        connect (callable): Function without arguments that opens a new connection to the source database.
+        tables (list): Names of the source tables to extract.
+        watermarks (dict, optional): Source table name -> high-water mark (see 'buildExtractionQuery'). Default is None
+        max_workers (int, optional): Number of worker threads and connections. Default is 4
+        pushdown (bool, optional): If True, the projection and the filters are pushed down into the extraction
+            queries (see 'buildExtractionQuery'). Default is True
+        arrow_tables (iterable, optional): Names of the tables read as Arrow tables. Default is () (none)
+
+    Returns:
+        tuple: Dictionary table name -> dataframe or Arrow table (in the order of 'tables'), and dictionary table name ->
+        extraction information ('seconds', 'memory_mb' of the dataframe, and 'round_trips': number of queries sent to the source).
+    """
+    watermarks = watermarks or {}
+    local = threading.local()
+    connections = []
+    connections_lock = threading.Lock()
+
+    def extractTable(table):
+        # Each worker thread opens its connection the first time it is used, and reuses it for the next tables
+        if not hasattr(local, 'conn'):
+            local.conn = connect()
+            with connections_lock:
+                connections.append(local.conn)
+
+        start = time.perf_counter()
+        query, params = buildExtractionQuery(table, watermarks, pushdown)
+
+        if table in arrow_tables:
+            df = readArrowTable(local.conn, query, params, table)
+        else:
+            df = applyFallbackFilters(applySchema(pd.read_sql(query, local.conn, params=params), table), table)
+
+        return df, {'seconds': time.perf_counter() - start, 'memory_mb': memoryMB(df), 'round_trips': 1}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tables)))) as executor:
+            futures = {table: executor.submit(extractTable, table) for table in tables}
+            results = {table: future.result() for table, future in futures.items()}
+    finally:
+        for conn in connections:
+            conn.close()
+
+    DB_tables = {table: results[table][0] for table in tables}
+    extraction_info = {table: results[table][1] for table in tables}
+
+    return DB_tables, extraction_info
+
+
+def readTableChunks(conn, query, params=None, memory_limit_mb=256, copies=4, probe_rows=1000, table=None):
+    """
+    Read the result of a source query in chunks whose size is bounded by a memory ceiling.
+
+    The first chunk has 'probe_rows' rows and is used to measure the memory used by a row. The following chunks
+    have as many rows as fit in 'memory_limit_mb', taking into account that the transformation of a chunk
+    makes up to 'copies' copies of it.
+
+    Parameters:
+        conn (pyodbc.Connection): Connection to the source database.
+        query (str): The SQL query.
+        params (list, optional): Parameters of the query. Default is None
+        memory_limit_mb (int, optional): Memory ceiling of a chunk and its copies, in MB. Default is 256
+        copies (int, optional): Number of copies of a chunk alive at the same time during its transformation. Default is 4
+        probe_rows (int, optional): Number of rows of the first chunk. Default is 1000
+        table (str, optional): Name of the source table, to compact the chunks with its dtype schema and filter them
+            with its source filters. Default is None
+
+    Yields:
+        pandas.DataFrame: The chunks of the result, in order.
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, params or [])
+    columns = [column[0] for column in cursor.description]
+
+    chunk_rows = probe_rows
+    first_chunk = True
+
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+
+        chunk = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns, coerce_float=True)
+        if table is not None:
+            chunk = applySchema(chunk, table)
+
+        # Size the next chunks with the memory used by the rows of the first one (before filtering, since they are all fetched)
+        if first_chunk:
+            bytes_per_row = max(1, chunk.memory_usage(deep=True).sum() / len(chunk))
+            chunk_rows = max(probe_rows, int(memory_limit_mb * 1024 ** 2 / (bytes_per_row * copies)))
+            first_chunk = False
+
+        if table is not None:
+            chunk = applyFallbackFilters(chunk, table)
+
+        yield chunk
+
+    cursor.close()
+
+
+def trackWatermark(chunks, table, watermarks):
+    """
+    Yield the chunks of an incremental source table, advancing its high-water mark in 'watermarks' as they are read.
+
+    Parameters:
+        chunks (iterable): Chunks (pandas.DataFrame or pyarrow.Table) of the source table.
+        table (str): Name of the source table.
+        watermarks (dict): Source table name -> high-water mark, updated in place.
+
+    Yields:
+        pandas.DataFrame or pyarrow.Table: The same chunks.
+    """
+    column = WATERMARK_COLUMNS[table]['column']
+
+    for chunk in chunks:
+        value = _columnMax(chunk, column)
+        if value is not None:
+            if watermarks.get(table) is None or value > watermarks[table]:
+                watermarks[table] = value
+
+        yield chunk
@@ -0,0 +1,162 @@
+import pandas as pd
+from sqlalchemy import text
+
+
+# Secondary indexes of every partition of the fact table: column -> index method.
+# B-tree for the foreign keys (checked by the loads and filtered by the dimensional queries), and BRIN for the
+# sale date, whose values follow the physical order of the loads.
+FACT_INDEXES = {
+    'idfecha': 'btree',
+    'idarticulo': 'btree',
+    'idcliente': 'btree',
+    'idvendedor': 'btree',
+    'nroorden': 'btree',
+    'fecha': 'brin'
+}
+
+# The indexes of a partition are dropped before a load and rebuilt after it when the load adds at least this share
+# of the rows the partition already has (building an index once is cheaper than maintaining it row by row)
+INDEX_REBUILD_RATIO = 0.2
+
+
+def partitionName(table, month):
+    """
+    Return the name of the monthly partition of a table (e.g. 'renglon_factura_2023_05').
+    """
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def isPartitioned(conn, table):
+    """
+    Return True if the table is a partitioned table (False for a plain table, e.g. one created before the partitions).
+    """
+    return conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+                        {'table': table}).scalar()
+
+
+def listPartitions(conn, table):
+    """
+    Return the partitions of a partitioned table, with the number of rows estimated by the planner.
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse.
+        table (str): The name of the partitioned table.
+
+    Returns:
+        dict: Partition name -> estimated rows (0 if the partition was never analyzed).
+    """
+    result = conn.execute(text("SELECT c.relname, c.reltuples FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                               "WHERE i.inhparent = to_regclass(:table)"), {'table': table})
+    return {name: max(0, int(rows)) for name, rows in result}
+
+
+def _estimatedRows(conn, table):
+    """
+    Return the number of rows of a table estimated by the planner (0 if it was never analyzed).
+    """
+    rows = conn.execute(text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}).scalar()
+    return max(0, int(rows or 0))
+
+
+def createIndexes(conn, partition, indexes=FACT_INDEXES):
+    """
+    Create the secondary indexes of a partition (or of a plain table) that do not exist.
+    """
+    for column, method in indexes.items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {partition}_{column}_idx ON {partition} USING {method} ({column})"))
+
+
+def dropIndexes(conn, partition, indexes=FACT_INDEXES):
+    """
+    Drop the secondary indexes of a partition (or of a plain table).
+    """
+    for column in indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {partition}_{column}_idx"))
+
+
+def startPartitionedLoad(conn, table, partition_column, truncate=False, indexes=FACT_INDEXES):
+    """
+    Start a load into a table partitioned by month of 'partition_column'.
+
+    A plain table (not partitioned) is handled as a single partition, so its indexes are managed in the same way.
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse, inside a transaction.
+        table (str): The name of the table.
+        partition_column (str): DATE column of the partitions (range partitioned by month).
+        truncate (bool, optional): If True, the table was emptied by the load, so the indexes of every
+            touched partition are rebuilt. Default is False
+        indexes (dict, optional): Secondary indexes of the partitions, as in 'FACT_INDEXES'. Default is 'FACT_INDEXES'
+
+    Returns:
+        dict: The state of the load, to be given to 'routeRows' and 'finishPartitionedLoad'.
+    """
+    partitioned = isPartitioned(conn, table)
+
+    return {
+        'table': table,
+        'column': partition_column,
+        'partitioned': partitioned,
+        'partitions': listPartitions(conn, table) if partitioned else {table: _estimatedRows(conn, table)},
+        'indexes': indexes,
+        'truncate': truncate,
+        'touched': set(),
+        'rebuilt': set()
+    }
+
+
+def routeRows(conn, state, frame):
+    """
+    Prepare the partitions that will receive the rows of a frame, before the frame is loaded.
+
+    The monthly partitions that do not exist are created. The first time a partition is touched by the load,
+    its indexes are dropped (to be rebuilt by 'finishPartitionedLoad') if it is new, if the table was truncated,
+    or if the frame adds at least 'INDEX_REBUILD_RATIO' of the rows it already has.
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse, inside the transaction of the load.
+        state (dict): The state of the load, as returned by 'startPartitionedLoad'.
+        frame (pandas.DataFrame): Rows about to be loaded, with the partition column.
+    """
+    table = state['table']
+
+    if state['partitioned']:
+        months = pd.to_datetime(frame[state['column']]).dt.to_period('M').dt.to_timestamp()
+        rows_per_partition = {partitionName(table, month): rows for month, rows in months.value_counts().items()}
+    else:
+        rows_per_partition = {table: len(frame)}
+
+    for partition, rows in rows_per_partition.items():
+        if partition in state['touched']:
+            continue
+        state['touched'].add(partition)
+
+        created = partition not in state['partitions']
+        if created:
+            month = pd.Timestamp(year=int(partition[-7:-3]), month=int(partition[-2:]), day=1)
+            conn.execute(text(f"CREATE TABLE {partition} PARTITION OF {table} "
+                              f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month + pd.offsets.MonthBegin(1):%Y-%m-%d}')"))
+            state['partitions'][partition] = 0
+
+        if created or state['truncate'] or rows >= INDEX_REBUILD_RATIO * state['partitions'][partition]:
+            dropIndexes(conn, partition, state['indexes'])
+            state['rebuilt'].add(partition)
+
+
+def finishPartitionedLoad(conn, state):
+    """
+    Finish a partitioned load: build the indexes of the touched partitions that are missing (the dropped ones
+    and the ones of new partitions), and ANALYZE only the touched partitions.
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse, inside the transaction of the load.
+        state (dict): The state of the load, as returned by 'startPartitionedLoad'.
+
+    Returns:
+        dict: 'touched' and 'rebuilt' partitions (sorted lists of names).
+    """
+    for partition in sorted(state['touched']):
+        createIndexes(conn, partition, state['indexes'])
+        conn.execute(text(f"ANALYZE {partition}"))
+
+    return {'touched': sorted(state['touched']), 'rebuilt': sorted(state['rebuilt'])}
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+# Number of decimal digits of each part of the composite keys, from the most to the least significant part.
+# 'IDRubro' is (rubro, subrubro1, subrubro2, subrubro3) and 'IDArticulo' is (codigo, subcodigo).
+RUBRO_KEY_WIDTHS = (3, 3, 2, 1)
+ARTICULO_KEY_WIDTHS = (6, 2)
+
+# The keys are stored in INT columns of the data warehouse
+KEY_MAX = np.iinfo(np.int32).max
+
+# Key returned by 'composeKey' with errors='coerce' for the rows whose parts are not valid
+INVALID_KEY = -1
+
+
+def _toIntegerArray(part):
+    """
+    Convert a key part to an int64 array, and return it together with the mask of the values that are not integers.
+    """
+    # Nullable dtypes (e.g. 'Int32') are converted with their nulls as NaN, so they are detected as not integers
+    if not isinstance(getattr(part, 'dtype', None), (np.dtype, type(None))):
+        part = part.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    values = np.asarray(part)
+
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64), np.zeros(len(values), dtype=bool)
+
+    values = values.astype(np.float64)
+    not_integer = ~np.isfinite(values) | (values != np.trunc(values))
+    return np.where(not_integer, 0, values).astype(np.int64), not_integer
+
+
+def composeKey(parts, widths, errors='raise'):
+    """
+    Compose an integer key from its parts with integer arithmetic, as if each part was zero-padded to its width
+    and the parts were concatenated as strings (e.g. codigo 123 and subcodigo 4 give 12304).
+
+    Every part must be a non-negative integer, every part except the first one must fit in its width,
+    and the key must fit in an INT column. The first part can have more digits than its width, as with the
+    string concatenation.
+
+    Parameters:
+        parts (list): Arrays or pandas Series with the parts of the key, from the most to the least significant.
+        widths (tuple): Number of digits of each part (e.g. 'RUBRO_KEY_WIDTHS').
+        errors (str, optional): 'raise' to raise a ValueError if a row is not valid, or 'coerce' to return
+            'INVALID_KEY' for those rows. Default is 'raise'
+
+    Returns:
+        numpy.ndarray: The int64 keys.
+    """
+    if len(parts) != len(widths):
+        raise ValueError(f"Expected {len(widths)} key parts, got {len(parts)}")
+
+    keys = np.zeros(len(parts[0]), dtype=np.int64)
+    invalid = np.zeros(len(parts[0]), dtype=bool)
+
+    for position, (part, width) in enumerate(zip(parts, widths)):
+        values, not_integer = _toIntegerArray(part)
+
+        invalid |= not_integer | (values < 0) | (values > KEY_MAX)
+        if position > 0:
+            invalid |= values >= 10 ** width
+
+        # Invalid values are zeroed so they can not overflow the arithmetic of the valid rows
+        values = np.where(invalid, 0, values)
+
+        keys = keys * 10 ** width + values
+
+    invalid |= keys > KEY_MAX
+
+    if invalid.any():
+        if errors == 'raise':
+            raise ValueError(f"{invalid.sum()} keys have parts that are not valid for the widths {widths}")
+        keys[invalid] = INVALID_KEY
+
+    return keys
+
+
+def decomposeKey(keys, widths):
+    """
+    Decompose integer keys composed with 'composeKey' into their parts.
+
+    Parameters:
+        keys (array-like): The integer keys.
+        widths (tuple): Number of digits of each part (e.g. 'RUBRO_KEY_WIDTHS').
+
+    Returns:
+        tuple: One int64 array per part, from the most to the least significant.
+    """
+    remaining = np.asarray(keys).astype(np.int64)
+    parts = []
+
+    for width in reversed(widths[1:]):
+        remaining, part = np.divmod(remaining, 10 ** width)
+        parts.append(part)
+    parts.append(remaining)
+
+    return tuple(reversed(parts))
+
+
+def encodeRubroId(rubro, subrubro1, subrubro2, subrubro3, errors='raise'):
+    """
+    Compose the 'IDRubro' key (9 digits: 3 of rubro, 3 of subrubro1, 2 of subrubro2 and 1 of subrubro3).
+    See 'composeKey' for the parameters.
+    """
+    return composeKey([rubro, subrubro1, subrubro2, subrubro3], RUBRO_KEY_WIDTHS, errors=errors)
+
+
+def decodeRubroId(ids):
+    """
+    Decompose 'IDRubro' keys into (rubro, subrubro1, subrubro2, subrubro3).
+    """
+    return decomposeKey(ids, RUBRO_KEY_WIDTHS)
+
+
+def encodeArticuloId(codigo, subcodigo, errors='raise'):
+    """
+    Compose the 'IDArticulo' key (8 digits: 6 of codigo and 2 of subcodigo).
+    See 'composeKey' for the parameters.
+    """
+    return composeKey([codigo, subcodigo], ARTICULO_KEY_WIDTHS, errors=errors)
+
+
+def decodeArticuloId(ids):
+    """
+    Decompose 'IDArticulo' keys into (codigo, subcodigo).
+    """
+    return decomposeKey(ids, ARTICULO_KEY_WIDTHS)
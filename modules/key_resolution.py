@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def buildKeyIndex(natural_keys, surrogate_keys=None):
+    """
+    Build the lookup index of a dimension, from its natural keys to its surrogate keys.
+
+    The index is a hash index over the distinct natural keys (the first occurrence of a repeated key wins),
+    built once and reused for every column (or chunk of a column) resolved against the dimension.
+
+    Parameters:
+        natural_keys (array-like): Natural keys of the dimension rows (e.g. the 'fecha' of 'Tiempo').
+        surrogate_keys (array-like, optional): Surrogate key of each row (e.g. the 'idfecha' of 'Tiempo').
+            If None, the natural key is the surrogate key too (e.g. 'Cod_Vendedor'). Default is None
+
+    Returns:
+        dict: The index ('index': pandas.Index of the natural keys, 'surrogate': numpy.ndarray of the surrogate keys).
+    """
+    natural_keys = pd.Series(natural_keys).reset_index(drop=True)
+    surrogate_keys = natural_keys if surrogate_keys is None else pd.Series(surrogate_keys).reset_index(drop=True)
+
+    first = ~natural_keys.duplicated().values
+
+    return {
+        'index': pd.Index(natural_keys[first]),
+        'surrogate': surrogate_keys[first].to_numpy()
+    }
+
+
+def resolveKeys(values, key_index, default=None, name=None, miss_counts=None):
+    """
+    Resolve a whole column of natural keys to surrogate keys in one vectorized lookup.
+
+    The values that are not found in the dimension (nulls included) are resolved to its default member
+    (e.g. the vendor "TODOS" or the article "OTRO"), and counted in 'miss_counts'.
+
+    Parameters:
+        values (pandas.Series): Natural keys to resolve.
+        key_index (dict): Index of the dimension, as returned by 'buildKeyIndex'.
+        default (optional): Surrogate key of the default member. If None, the misses are left null. Default is None
+        name (str, optional): Name of the dimension, used as the key of 'miss_counts'. Default is None
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.Series: The surrogate keys, with the same index as 'values'.
+    """
+    positions = key_index['index'].get_indexer(values)
+    missing = positions == -1
+
+    if miss_counts is not None:
+        miss_counts[name] = miss_counts.get(name, 0) + int(missing.sum())
+
+    if len(key_index['surrogate']) == 0:
+        resolved = np.full(len(values), np.nan if default is None else default, dtype=object)
+        return pd.Series(resolved, index=values.index, name=values.name).infer_objects()
+
+    resolved = key_index['surrogate'][positions]
+    if missing.any():
+        if default is None:
+            resolved = pd.Series(resolved).where(~missing).to_numpy()
+        else:
+            resolved = np.where(missing, default, resolved)
+
+    return pd.Series(resolved, index=values.index, name=values.name)
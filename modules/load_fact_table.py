@@ -0,0 +1,501 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from modules.fact_partitions import startPartitionedLoad, routeRows, finishPartitionedLoad
+from modules.load_session import dwConnection
+
+
+# Column types of the 'Renglon_Factura' fact table, as declared in the DDL.
+# 'int' columns are INT, 'date' columns are DATE, 'timestamp' columns are TIMESTAMP,
+# and (precision, scale) tuples are DECIMAL(precision, scale) columns.
+RENGLON_FACTURA_COLUMNS = {
+    'fecha': 'date',
+    'idfecha': 'int',
+    'idarticulo': 'int',
+    'idcliente': 'int',
+    'idvendedor': 'int',
+    'nroorden': 'int',
+    'total_venta_renglon': (10, 2),
+    'cantidad_articulos_renglon': (10, 2),
+    'precio_unitario': (12, 2),
+    'precio_unitario_iva': (12, 2)
+}
+
+# Column types of the staging table of the ELT load ('loadFactTableELT'): the cleaned sales rows, with the natural
+# keys of the dimensions instead of the surrogate keys of the fact table ('periodo' is the 'fecha' of 'Tiempo')
+RENGLON_FACTURA_STAGING_COLUMNS = {
+    'fecha': 'date',
+    'periodo': 'timestamp',
+    'idarticulo': 'int',
+    'idcliente': 'int',
+    'idvendedor': 'int',
+    'nroorden': 'int',
+    'total_venta_renglon': (10, 2),
+    'cantidad_articulos_renglon': (10, 2),
+    'precio_unitario': (12, 2),
+    'precio_unitario_iva': (12, 2)
+}
+
+# Surrogate keys of the fact table resolved by the ELT load: fact column -> dimension 'table', its natural 'key'
+# column (the surrogate key has the name of the fact column), and the 'staging' column joined with it
+RENGLON_FACTURA_KEY_JOINS = {
+    'idfecha': {'table': 'tiempo', 'key': 'fecha', 'staging': 'periodo'},
+    'idarticulo': {'table': 'articulos', 'key': 'idarticulo', 'staging': 'idarticulo'},
+    'idcliente': {'table': 'clientes', 'key': 'idcliente', 'staging': 'idcliente'},
+    'idvendedor': {'table': 'vendedores', 'key': 'idvendedor', 'staging': 'idvendedor'},
+    'nroorden': {'table': 'orden', 'key': 'nroorden', 'staging': 'nroorden'}
+}
+
+# Header and trailer of the PostgreSQL binary COPY format
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + np.array([0, 0], dtype='>i4').tobytes()
+PGCOPY_TRAILER = np.array([-1], dtype='>i2').tobytes()
+
+# Length of a NULL field in the binary COPY format
+PGCOPY_NULL = np.array([-1], dtype='>i4').tobytes()
+
+# Epoch of the DATE and TIMESTAMP values in the binary COPY format (days / microseconds since 2000-01-01)
+PGCOPY_DATE_EPOCH = pd.Timestamp('2000-01-01')
+
+
+def castFactColumns(data, columns):
+    """
+    Cast the columns of a fact dataframe to the types of the fact table.
+
+    INT columns are converted to nullable 'Int64', DATE columns are truncated to the day,
+    TIMESTAMP columns are converted to datetimes, and DECIMAL columns are rounded to their scale.
+    A ValueError is raised if a value does not fit in the precision of its column.
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe with the rows of the fact table.
+        columns (dict): Column types, with the same format as 'RENGLON_FACTURA_COLUMNS'.
+
+    Returns:
+        pandas.DataFrame: Dataframe with only the columns of the fact table, in order.
+    """
+    data = data[list(columns)].copy()
+
+    for column, column_type in columns.items():
+        if column_type == 'int':
+            data[column] = pd.to_numeric(data[column]).astype('Int64')
+            if (data[column].abs() > np.iinfo(np.int32).max).any():
+                raise ValueError(f"Column '{column}' has values that do not fit in an INT column")
+        elif column_type == 'date':
+            data[column] = pd.to_datetime(data[column]).dt.normalize()
+        elif column_type == 'timestamp':
+            data[column] = pd.to_datetime(data[column])
+        else:
+            precision, scale = column_type
+            data[column] = pd.to_numeric(data[column]).astype(float).round(scale)
+            if (data[column].abs() >= 10 ** (precision - scale)).any():
+                raise ValueError(f"Column '{column}' has values that do not fit in a DECIMAL({precision}, {scale}) column")
+
+    return data
+
+
+def _numericLayout(precision, scale):
+    """
+    Return the number of base-10000 digits before and after the decimal point needed by a DECIMAL(precision, scale).
+    """
+    integer_groups = max(1, -(-(precision - scale) // 4))
+    fraction_groups = -(-scale // 4)
+    return integer_groups, fraction_groups
+
+
+def _binaryFieldDtype(column_type):
+    """
+    Return the numpy dtype of one binary COPY field (length prefix included) of the given column type.
+    """
+    if column_type in ('int', 'date'):
+        return np.dtype([('length', '>i4'), ('value', '>i4')])
+    if column_type == 'timestamp':
+        return np.dtype([('length', '>i4'), ('value', '>i8')])
+
+    integer_groups, fraction_groups = _numericLayout(*column_type)
+    return np.dtype([('length', '>i4'),
+                     ('ndigits', '>i2'),
+                     ('weight', '>i2'),
+                     ('sign', '>u2'),
+                     ('dscale', '>i2'),
+                     ('digits', '>i2', (integer_groups + fraction_groups,))])
+
+
+def _columnValues(series, column_type):
+    """
+    Return the values of a column as the numpy array encoded by '_encodeBinaryField'
+    (INT values, DATE values as days and TIMESTAMP values as microseconds since 'PGCOPY_DATE_EPOCH',
+    or DECIMAL values as floats).
+    """
+    if column_type == 'int':
+        return series.to_numpy(dtype=np.int64)
+    if column_type == 'date':
+        return (series - PGCOPY_DATE_EPOCH).dt.days.to_numpy(dtype=np.int64)
+    if column_type == 'timestamp':
+        return ((series - PGCOPY_DATE_EPOCH) // pd.Timedelta(microseconds=1)).to_numpy(dtype=np.int64)
+    return series.to_numpy(dtype=np.float64)
+
+
+def _encodeBinaryField(values, column_type):
+    """
+    Encode the non-null values of a column as binary COPY fields, returning a structured numpy array.
+
+    INT and DATE values are both written as 4-byte integers, and TIMESTAMP values as 8-byte integers.
+    DECIMAL values are written as PostgreSQL 'numeric' values with a fixed number of digits,
+    which the server normalizes when it receives them.
+    """
+    field_dtype = _binaryFieldDtype(column_type)
+    fields = np.zeros(len(values), dtype=field_dtype)
+    fields['length'] = field_dtype.itemsize - 4
+
+    if column_type in ('int', 'date', 'timestamp'):
+        fields['value'] = values
+        return fields
+
+    precision, scale = column_type
+    integer_groups, fraction_groups = _numericLayout(precision, scale)
+
+    scaled = np.rint(np.abs(values) * 10 ** scale).astype(np.int64)
+    integer_part = scaled // 10 ** scale
+    fraction_part = (scaled % 10 ** scale) * 10 ** (4 * fraction_groups - scale)
+
+    digits = np.empty((len(values), integer_groups + fraction_groups), dtype=np.int64)
+    for group in range(integer_groups):
+        digits[:, integer_groups - 1 - group] = (integer_part // 10000 ** group) % 10000
+    for group in range(fraction_groups):
+        digits[:, integer_groups + fraction_groups - 1 - group] = (fraction_part // 10000 ** group) % 10000
+
+    fields['ndigits'] = integer_groups + fraction_groups
+    fields['weight'] = integer_groups - 1
+    fields['sign'] = np.where(values < 0, 0x4000, 0x0000)
+    fields['dscale'] = scale
+    fields['digits'] = digits
+    return fields
+
+
+def encodeBinaryCopy(data, columns):
+    """
+    Encode a dataframe as the body of a PostgreSQL binary COPY stream (without header and trailer).
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe already cast with 'castFactColumns'.
+        columns (dict): Column types, with the same format as 'RENGLON_FACTURA_COLUMNS'.
+
+    Returns:
+        bytes: The encoded tuples.
+    """
+    field_count = np.array([len(columns)], dtype='>i2').tobytes()
+
+    # Fast path: without NULLs every tuple has the same width, so the whole batch is one structured array
+    if not data.isna().any().any():
+        tuple_dtype = np.dtype([('field_count', '>i2')] +
+                               [(column, _binaryFieldDtype(column_type)) for column, column_type in columns.items()])
+        tuples = np.zeros(len(data), dtype=tuple_dtype)
+        tuples['field_count'] = len(columns)
+        for column, column_type in columns.items():
+            values = _columnValues(data[column], column_type)
+            tuples[column] = _encodeBinaryField(values, column_type)
+        return tuples.tobytes()
+
+    # With NULLs, the tuples are laid out in a byte matrix with the full width of every field, and the NULL fields
+    # (a -1 length) only keep their first 4 bytes: the kept bytes, read row by row, are the variable width tuples
+    widths = [_binaryFieldDtype(column_type).itemsize for column_type in columns.values()]
+    matrix = np.zeros((len(data), len(field_count) + sum(widths)), dtype=np.uint8)
+    keep = np.zeros(matrix.shape, dtype=bool)
+
+    matrix[:, :len(field_count)] = np.frombuffer(field_count, dtype=np.uint8)
+    keep[:, :len(field_count)] = True
+
+    offset = len(field_count)
+    for (column, column_type), width in zip(columns.items(), widths):
+        not_null = data[column].notna().to_numpy()
+        values = _columnValues(data[column][not_null], column_type)
+        fields = _encodeBinaryField(values, column_type).view(np.uint8).reshape(-1, width)
+
+        matrix[not_null, offset:offset + width] = fields
+        keep[not_null, offset:offset + width] = True
+        matrix[~not_null, offset:offset + len(PGCOPY_NULL)] = np.frombuffer(PGCOPY_NULL, dtype=np.uint8)
+        keep[~not_null, offset:offset + len(PGCOPY_NULL)] = True
+        offset += width
+
+    return matrix[keep].tobytes()
+
+
+def _copyBatch(cursor, table, batch, columns, copy_format):
+    """
+    Send one batch of rows to the server with a 'COPY ... FROM STDIN' statement.
+    """
+    column_names = ", ".join(columns)
+
+    if copy_format == 'binary':
+        buffer = io.BytesIO(PGCOPY_HEADER + encodeBinaryCopy(batch, columns) + PGCOPY_TRAILER)
+        cursor.copy_expert(f"COPY {table} ({column_names}) FROM STDIN WITH (FORMAT binary)", buffer)
+    else:
+        buffer = io.StringIO()
+        batch.to_csv(buffer, index=False, header=False, na_rep='')
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({column_names}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer)
+
+
+def _copyFrame(cursor, table, frame, columns, batch_size, copy_format):
+    """
+    Send the rows of a frame (already cast with 'castFactColumns') in batches of 'batch_size' rows, returning the number of batches.
+    """
+    batches = 0
+    for batch_start in range(0, len(frame), batch_size):
+        _copyBatch(cursor, table, frame.iloc[batch_start:batch_start + batch_size], columns, copy_format)
+        batches += 1
+    return batches
+
+
+def _deleteReloadedRows(conn, table, reload_column, reload_after, touched_column=None):
+    """
+    Delete the rows of a fact table that are loaded again (the ones whose 'reload_column' is greater than 'reload_after'),
+    and return the distinct values of 'touched_column' of the deleted rows.
+    """
+    returning = f" RETURNING {touched_column}" if touched_column is not None else ""
+    result = conn.execute(text(f"DELETE FROM {table} WHERE {reload_column} > :reload_after{returning}"), {'reload_after': int(reload_after)})
+    if touched_column is None:
+        return set()
+    return {int(value) for value in result.scalars() if value is not None}
+
+
+def loadFactTable(engine, table, data, columns=RENGLON_FACTURA_COLUMNS, batch_size=50000, copy_format='text', truncate=False, touched_column=None, partition_column=None,
+                  reload_column=None, reload_after=None):
+    """
+    Load a fact table by streaming the dataframe to PostgreSQL with 'COPY FROM STDIN'.
+
+    The rows are sent in batches of 'batch_size' rows, so the memory used by the encoded buffers is bounded,
+    and all the batches are loaded inside a single transaction: if a batch fails, nothing is loaded.
+    With a load session, that transaction is the one of the session, committed with the dimensions at the end of the run.
+    'data' can also be an iterable of dataframes (e.g. a generator of transformed chunks), which are
+    consumed one at a time inside the same transaction.
+
+    With 'partition_column', the table is partitioned by month of that DATE column (see 'modules.fact_partitions'):
+    the missing partitions are created before each frame is loaded, the indexes of the partitions that receive
+    a large share of new rows are dropped and rebuilt after the load, and only the touched partitions are analyzed.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine or dict): Database engine (PostgreSQL, psycopg2 driver), or a load session (see 'modules.load_session').
+        table (str): The name of the fact table.
+        data (pandas.DataFrame or iterable): Rows to load, excluding the serial primary key.
+        columns (dict, optional): Column types of the fact table. Default is 'RENGLON_FACTURA_COLUMNS'
+        batch_size (int, optional): Number of rows sent per COPY statement. Default is 50000
+        copy_format (str, optional): 'text' (CSV) or 'binary'. Default is 'text'
+        truncate (bool, optional): If True, the table is emptied in the same transaction before loading. Default is False
+        touched_column (str, optional): Column whose distinct loaded values are returned as 'touched' (e.g. 'idfecha',
+            to refresh the aggregates of the loaded periods). Default is None
+        partition_column (str, optional): DATE column the table is partitioned by (e.g. 'fecha'). Default is None
+        reload_column (str, optional): Column of the rows that are loaded again (e.g. 'nroorden'). Default is None
+        reload_after (int, optional): The rows whose 'reload_column' is greater are deleted in the same transaction before
+            loading, since 'data' has their new version (e.g. the orders of a trailing window). Their 'touched_column'
+            values are returned as touched too. Default is None (no rows are deleted)
+
+    Returns:
+        dict: Load statistics: 'rows', 'batches', 'seconds', 'rows_per_second' and, with 'touched_column',
+        'touched' (sorted list of the distinct values of the column) and, with 'partition_column', 'partitions'
+        ('touched' and 'rebuilt' partitions).
+    """
+    if copy_format not in ('text', 'binary'):
+        raise ValueError(f"Unknown COPY format '{copy_format}', expected 'text' or 'binary'")
+
+    if isinstance(data, pd.DataFrame):
+        data = [data]
+
+    start = time.perf_counter()
+    rows = 0
+    batches = 0
+    touched = set()
+
+    # The COPY statements are sent through the driver connection, inside the transaction of 'dwConnection'
+    with dwConnection(engine) as conn:
+        cursor = conn.connection.cursor()
+        try:
+            if truncate:
+                cursor.execute(f"TRUNCATE {table}")
+            elif reload_column is not None and reload_after is not None:
+                touched.update(_deleteReloadedRows(conn, table, reload_column, reload_after, touched_column))
+            if partition_column is not None:
+                partition_state = startPartitionedLoad(conn, table, partition_column, truncate=truncate)
+            for frame in data:
+                frame = castFactColumns(frame, columns)
+                if partition_column is not None:
+                    routeRows(conn, partition_state, frame)
+                if touched_column is not None:
+                    touched.update(frame[touched_column].dropna().astype('int64').tolist())
+                batches += _copyFrame(cursor, table, frame, columns, batch_size, copy_format)
+                rows += len(frame)
+            if partition_column is not None:
+                partitions = finishPartitionedLoad(conn, partition_state)
+        finally:
+            cursor.close()
+
+    seconds = time.perf_counter() - start
+
+    stats = {
+        'rows': rows,
+        'batches': batches,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else float('inf')
+    }
+    if touched_column is not None:
+        stats['touched'] = sorted(touched)
+    if partition_column is not None:
+        stats['partitions'] = partitions
+
+    return stats
+
+
+def _sqlType(column_type):
+    """
+    Return the SQL type of a column type, as declared in 'RENGLON_FACTURA_COLUMNS'.
+    """
+    if column_type in ('int', 'date', 'timestamp'):
+        return column_type.upper()
+    return f"DECIMAL({column_type[0]}, {column_type[1]})"
+
+
+def buildResolvedSelect(staging_table, columns, staging_columns, key_joins, defaults):
+    """
+    Build the query that resolves the surrogate keys of the staged rows against the dimensions of the data warehouse.
+
+    Each key is resolved with a LEFT JOIN on the natural key of its dimension, and the rows whose key is not found
+    get the default member of the dimension (COALESCE with the ':default_<column>' parameter). The keys without default
+    must all be found: 'loadFactTableELT' raises an error otherwise, before the query is run.
+
+    Parameters:
+        staging_table (str): The name of the staging table (aliased 's').
+        columns (list): Columns of the fact table, in order.
+        staging_columns (list): Columns of the staging table.
+        key_joins (dict): Keys resolved by the query, as in 'RENGLON_FACTURA_KEY_JOINS'.
+        defaults (dict): Fact column -> surrogate key of the default member of its dimension.
+
+    Returns:
+        tuple: The select list (list of str, one expression per column), and the FROM clause (str), where the
+        dimension row joined for a fact column 'c' is aliased 'k_c'.
+    """
+    select = []
+    for column in columns:
+        if column in key_joins:
+            expression = f"k_{column}.{column}"
+            if column in defaults:
+                expression = f"COALESCE({expression}, :default_{column})"
+        elif column in staging_columns:
+            expression = f"s.{column}"
+        else:
+            raise ValueError(f"Column '{column}' is neither a staged column nor a resolved key")
+        select.append(expression)
+
+    joins = [f"LEFT JOIN {join['table']} k_{column} ON k_{column}.{join['key']} = s.{join['staging']}"
+             for column, join in key_joins.items()]
+
+    return select, f"{staging_table} s " + " ".join(joins)
+
+
+def loadFactTableELT(engine, table, data, defaults, columns=RENGLON_FACTURA_COLUMNS, staging_columns=RENGLON_FACTURA_STAGING_COLUMNS,
+                     key_joins=RENGLON_FACTURA_KEY_JOINS, batch_size=50000, copy_format='text', truncate=False, touched_column=None,
+                     partition_column=None, miss_counts=None, reload_column=None, reload_after=None):
+    """
+    Load a fact table resolving its surrogate keys inside PostgreSQL (ELT), instead of in pandas.
+
+    The cleaned rows, with the natural keys of the dimensions, are streamed with COPY into an unlogged staging table,
+    and the fact table is populated from it with one set-based 'INSERT ... SELECT' that joins the staging rows to
+    the dimensions (see 'buildResolvedSelect'). So the dimensions never have to be read back into pandas.
+    Like 'loadFactTable', everything runs inside a single transaction (the one of the load session, if given),
+    and the staging table is dropped at the end of it.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine or dict): Database engine (PostgreSQL, psycopg2 driver), or a load session (see 'modules.load_session').
+        table (str): The name of the fact table.
+        data (pandas.DataFrame or iterable): Rows to stage, with the columns of 'staging_columns'.
+        defaults (dict): Fact column -> surrogate key of the default member of its dimension (e.g. the article "OTRO").
+            The keys of the other dimensions (e.g. the period of 'Tiempo') must all be found, or an error is raised.
+        columns (dict, optional): Column types of the fact table. Default is 'RENGLON_FACTURA_COLUMNS'
+        staging_columns (dict, optional): Column types of the staging table. Default is 'RENGLON_FACTURA_STAGING_COLUMNS'
+        key_joins (dict, optional): Keys resolved in the database. Default is 'RENGLON_FACTURA_KEY_JOINS'
+        batch_size (int, optional): Number of rows sent per COPY statement. Default is 50000
+        copy_format (str, optional): 'text' (CSV) or 'binary'. Default is 'text'
+        truncate (bool, optional): If True, the table is emptied in the same transaction before loading. Default is False
+        touched_column (str, optional): Column of the fact table whose distinct loaded values are returned as 'touched'. Default is None
+        partition_column (str, optional): DATE column the table is partitioned by, present in the staged rows too. Default is None
+        miss_counts (dict, optional): Number of keys not found per dimension, updated in place. Default is None
+        reload_column (str, optional): Column of the rows that are loaded again, as in 'loadFactTable'. Default is None
+        reload_after (int, optional): The rows whose 'reload_column' is greater are replaced, as in 'loadFactTable'. Default is None
+
+    Returns:
+        dict: Load statistics, as returned by 'loadFactTable'.
+    """
+    if copy_format not in ('text', 'binary'):
+        raise ValueError(f"Unknown COPY format '{copy_format}', expected 'text' or 'binary'")
+
+    if isinstance(data, pd.DataFrame):
+        data = [data]
+
+    staging_table = f"{table}_staging"
+    select, source = buildResolvedSelect(staging_table, list(columns), list(staging_columns), key_joins, defaults)
+    params = {f'default_{column}': int(default) for column, default in defaults.items()}
+
+    start = time.perf_counter()
+    batches = 0
+    reloaded = set()
+
+    with dwConnection(engine) as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {staging_table} "
+                          f"({', '.join(f'{column} {_sqlType(column_type)}' for column, column_type in staging_columns.items())})"))
+
+        # The COPY statements are sent through the driver connection, inside the transaction of 'dwConnection'
+        cursor = conn.connection.cursor()
+        try:
+            if truncate:
+                cursor.execute(f"TRUNCATE {table}")
+            elif reload_column is not None and reload_after is not None:
+                reloaded = _deleteReloadedRows(conn, table, reload_column, reload_after, touched_column)
+            if partition_column is not None:
+                partition_state = startPartitionedLoad(conn, table, partition_column, truncate=truncate)
+            for frame in data:
+                frame = castFactColumns(frame, staging_columns)
+                if partition_column is not None:
+                    routeRows(conn, partition_state, frame)
+                batches += _copyFrame(cursor, staging_table, frame, staging_columns, batch_size, copy_format)
+        finally:
+            cursor.close()
+
+        misses = conn.execute(text(f"SELECT {', '.join(f'COUNT(*) FILTER (WHERE k_{column}.{column} IS NULL)' for column in key_joins)} "
+                                   f"FROM {source}")).one()
+        for column, missing in zip(key_joins, misses):
+            name = key_joins[column]['table']
+            # A key without a default member would be loaded as a NULL foreign key (e.g. a period missing from the calendar)
+            if missing > 0 and column not in defaults:
+                raise ValueError(f"{missing} staged rows of '{table}' have a '{column}' that is not in the '{name}' dimension, "
+                                 f"which has no default member")
+            if miss_counts is not None:
+                miss_counts[name] = miss_counts.get(name, 0) + missing
+
+        rows = conn.execute(text(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(select)} FROM {source}"), params).rowcount
+
+        if touched_column is not None:
+            touched = conn.execute(text(f"SELECT DISTINCT {select[list(columns).index(touched_column)]} FROM {source}"), params).scalars()
+            touched = sorted(reloaded.union(int(value) for value in touched if value is not None))
+
+        if partition_column is not None:
+            partitions = finishPartitionedLoad(conn, partition_state)
+
+        conn.execute(text(f"DROP TABLE {staging_table}"))
+
+    seconds = time.perf_counter() - start
+
+    stats = {
+        'rows': rows,
+        'batches': batches,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else float('inf')
+    }
+    if touched_column is not None:
+        stats['touched'] = touched
+    if partition_column is not None:
+        stats['partitions'] = partitions
+
+    return stats
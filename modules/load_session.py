@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# Rows sent per multi-row INSERT statement of a load session
+INSERT_PAGE_SIZE = 5000
+
+
+@contextmanager
+def openLoadSession(engine, page_size=INSERT_PAGE_SIZE):
+    """
+    Open a load session: one pooled connection and one transaction shared by all the loads of a run
+    (dimension updates and fact table), committed atomically when the block ends.
+
+    If the block raises, the transaction is rolled back, so a failed run never leaves the dimensions
+    loaded without the fact rows that reference them (or the other way round). The loads of concurrent
+    stages take turns on the connection, while their transforms still run in parallel.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine): Database engine of the data warehouse.
+        page_size (int, optional): Rows sent per multi-row INSERT statement. Default is 'INSERT_PAGE_SIZE'
+
+    Yields:
+        dict: The load session ('conn', 'lock', and 'on_commit', the callbacks run once the transaction is committed),
+        to be given instead of the engine to the load functions (e.g. 'updateDimensionTable', 'updateCalendarDimension',
+        'loadFactTable').
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(insertmanyvalues_page_size=page_size)
+        session = {'conn': conn, 'lock': threading.RLock(), 'on_commit': []}
+        with conn.begin():
+            yield session
+
+    # Only reached if the transaction was committed
+    for callback in session['on_commit']:
+        callback()
+
+
+def isLoadSession(target):
+    """
+    Return True if 'target' is a load session (as opened by 'openLoadSession') instead of an engine.
+    """
+    return isinstance(target, dict) and 'conn' in target
+
+
+def afterCommit(target, callback):
+    """
+    Run 'callback' once the writes made through 'target' are committed: at the end of the load session,
+    or right away with an engine (whose standalone loads are already committed).
+
+    Used for the local side effects of a load (e.g. the dimension cache), which must not survive its rollback.
+    """
+    if isLoadSession(target):
+        with target['lock']:
+            target['on_commit'].append(callback)
+    else:
+        callback()
+
+
+@contextmanager
+def dwConnection(target):
+    """
+    Get a connection to the data warehouse, inside a transaction.
+
+    With a load session, its connection is used (holding the lock of the session), and the transaction is left
+    open for the rest of the run. With an engine, a new connection is opened and its transaction is committed
+    when the block ends, as a standalone load.
+
+    Parameters:
+        target (sqlalchemy.engine.Engine or dict): Database engine, or a load session.
+
+    Yields:
+        sqlalchemy.engine.Connection: The connection.
+    """
+    if isLoadSession(target):
+        with target['lock']:
+            yield target['conn']
+    else:
+        with target.connect() as conn, conn.begin():
+            yield conn
+
+
+def readTable(conn, table):
+    """
+    Read a whole table of the data warehouse with a single query (without reflecting its schema first).
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse.
+        table (str): The name of the table.
+
+    Returns:
+        pandas.DataFrame: The rows of the table.
+    """
+    return pd.read_sql(text(f"SELECT * FROM {table}"), conn)
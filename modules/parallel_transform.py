@@ -0,0 +1,156 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+
+# Tables with fewer rows are transformed in the calling process: sending them to the workers costs more than it saves
+PARALLEL_MIN_ROWS = 50000
+
+# Lookups of the worker process (e.g. the key indexes of the dimensions), set once when the worker starts
+_worker_lookups = {}
+
+
+def _initWorker(lookups):
+    """
+    Keep the shared lookups in the worker process, so they are not sent again with every task.
+    """
+    global _worker_lookups
+    _worker_lookups = lookups
+
+
+def _transformPart(task):
+    """
+    Transform one range of rows in a worker process. Returns the transformed rows and the misses counted on them.
+    """
+    function, frame, lookups, split_args, kwargs, count_misses = task
+    miss_counts = {} if count_misses else None
+
+    arguments = {name: _worker_lookups[lookup] for name, lookup in lookups.items()}
+    if count_misses:
+        arguments['miss_counts'] = miss_counts
+
+    return function(frame, **arguments, **split_args, **kwargs), miss_counts
+
+
+def openTransformPool(workers, lookups=None, min_rows=PARALLEL_MIN_ROWS):
+    """
+    Open a pool of worker processes for the row-local transforms of the sales tables.
+
+    The workers are forked, so they inherit the shared read-only lookups (e.g. the key indexes of the dimensions)
+    instead of receiving a copy with every task. The pool must be opened before the threads of the load start.
+    Where fork is not available (Windows), every worker would execute the ETL script again, since it has no
+    main guard: the pool is not opened, and the transforms run in the calling process.
+
+    Parameters:
+        workers (int): Number of worker processes. With 1 or less, the transforms run in the calling process.
+        lookups (dict, optional): Name -> lookup shared with the workers. Default is None
+        min_rows (int, optional): Tables with fewer rows are transformed in the calling process. Default is 'PARALLEL_MIN_ROWS'
+
+    Returns:
+        dict: The transform pool ('pool', None if the transforms run in the calling process, 'workers', 'lookups'
+        and 'min_rows'), to be given to 'parallelTransform' and closed with 'closeTransformPool'.
+    """
+    lookups = lookups or {}
+
+    pool = None
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        pool = multiprocessing.get_context('fork').Pool(workers, initializer=_initWorker, initargs=(lookups,))
+
+    return {'pool': pool, 'workers': workers, 'lookups': lookups, 'min_rows': min_rows}
+
+
+def closeTransformPool(transform_pool):
+    """
+    Close a transform pool, waiting for its worker processes to exit.
+    """
+    if transform_pool['pool'] is not None:
+        transform_pool['pool'].close()
+        transform_pool['pool'].join()
+
+
+def _rangeEdges(keys, parts):
+    """
+    Return the edges that split the keys (int64, without nulls) into 'parts' ranges with about the same number of rows.
+    """
+    if len(keys) == 0:
+        return np.array([], dtype='int64')
+    return np.unique(np.quantile(keys, np.linspace(0, 1, parts + 1)[1:-1], method='lower'))
+
+
+def _rangeOf(keys, edges):
+    """
+    Return the range of each key of a series. The null keys are sent to their own range, after the last one.
+    """
+    is_null = keys.isna().to_numpy()
+    ranges = np.searchsorted(edges, keys.to_numpy(dtype='int64', na_value=0), side='right')
+    ranges[is_null] = len(edges) + 1
+    return ranges
+
+
+def parallelTransform(transform_pool, function, df, column, lookups=None, split_args=None, miss_counts=None, **kwargs):
+    """
+    Apply a row-local transform to a table, with its rows split by ranges of 'column' across the transform pool.
+
+    The transform must only depend on each row and on its arguments (e.g. a validity filter or a key lookup), so
+    its result over the whole table is the concatenation of its results over the ranges. The results are put back
+    in the order of the rows of 'df', with their index, so they are the same as if 'function' was applied to 'df'.
+
+    Parameters:
+        transform_pool (dict): The transform pool, as returned by 'openTransformPool'.
+        function (callable): The transform (a module level function, so it can be sent to the workers).
+            It takes the rows as its first argument, and returns the transformed rows.
+        df (pandas.DataFrame): The rows to transform.
+        column (str): Integer column whose ranges split the rows (e.g. 'NroOrden'). Its null keys are transformed as one more range.
+        lookups (dict, optional): Argument of 'function' -> name of a lookup of the pool. Default is None
+        split_args (dict, optional): Argument of 'function' -> series of keys of 'column', split by the same
+            ranges (e.g. the order numbers to keep). Default is None
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. If given, 'function'
+            receives it as its 'miss_counts' argument. Default is None
+        **kwargs: Other arguments of 'function', the same for every range.
+
+    Returns:
+        pandas.DataFrame: The transformed rows.
+    """
+    lookups = lookups or {}
+    split_args = split_args or {}
+    pool = transform_pool['pool']
+
+    if pool is None or len(df) < transform_pool['min_rows']:
+        arguments = {name: transform_pool['lookups'][lookup] for name, lookup in lookups.items()}
+        if miss_counts is not None:
+            arguments['miss_counts'] = miss_counts
+        return function(df, **arguments, **split_args, **kwargs)
+
+    # The rows are numbered, so their order and index are restored after the ranges are transformed
+    index = df.index
+    df = df.set_axis(pd.RangeIndex(len(df)))
+
+    # The keys are integers (e.g. 'Int64' order numbers), read as int64 without their nulls to compute the edges
+    keys = df[column]
+    edges = _rangeEdges(keys.dropna().to_numpy(dtype='int64'), transform_pool['workers'])
+    ranges = _rangeOf(keys, edges)
+    split_ranges = {name: _rangeOf(values, edges) for name, values in split_args.items()}
+
+    # The range of the null keys is only transformed if there are null keys
+    parts = list(range(len(edges) + 1))
+    if (ranges == len(edges) + 1).any():
+        parts.append(len(edges) + 1)
+
+    tasks = [
+        (function, df[ranges == part], lookups,
+         {name: values[split_ranges[name] == part] for name, values in split_args.items()},
+         kwargs, miss_counts is not None)
+        for part in parts
+    ]
+
+    # 'map' returns the results in the order of the ranges
+    results = pool.map(_transformPart, tasks)
+
+    if miss_counts is not None:
+        for _, part_misses in results:
+            for name, misses in part_misses.items():
+                miss_counts[name] = miss_counts.get(name, 0) + misses
+
+    df_transformed = pd.concat([frame for frame, _ in results]).sort_index(kind='stable')
+    return df_transformed.set_axis(index[df_transformed.index])
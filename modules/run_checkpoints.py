@@ -0,0 +1,302 @@
+import glob
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from modules.load_session import dwConnection
+from modules.run_profiler import profileStage
+
+
+# Name of the manifest of every run directory
+MANIFEST_NAME = 'manifest.json'
+
+# DW table where every transaction of a run is recorded inside the transaction itself, so its commit can be verified
+# when the run is resumed (the manifest can not be written atomically with the commit)
+TRANSACTIONS_TABLE = 'etl_run_transactions'
+
+
+def _now():
+    """
+    Return the current local time, as an ISO 8601 string.
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _writeManifest(run):
+    """
+    Write the manifest of a run. It is written to a temporary file first and then renamed,
+    so an interrupted write never leaves a truncated manifest.
+    """
+    path = os.path.join(run['dir'], MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(run['manifest'], file, indent=4, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def _unfinishedRuns(runs_dir):
+    """
+    Return the directories and the manifests of the runs that did not finish, from the latest one.
+    """
+    runs = []
+    for manifest_path in sorted(glob.glob(os.path.join(runs_dir, '*', MANIFEST_NAME)), reverse=True):
+        with open(manifest_path, encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest['status'] == 'running':
+            runs.append((os.path.dirname(manifest_path), manifest))
+    return runs
+
+
+def _removeCheckpoints(run, status):
+    """
+    Remove the checkpoints of a run (the manifest is kept as the record of the run), and set its final status.
+    """
+    for stage in run['manifest']['stages'].values():
+        for file_name in stage['frames'].values():
+            path = os.path.join(run['dir'], file_name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    run['manifest']['status'] = status
+    run['manifest']['finished_at'] = _now()
+    _writeManifest(run)
+
+
+def startRun(runs_dir, arguments, resume=False):
+    """
+    Start a checkpointed run of the ETL, or resume the latest one that did not finish.
+
+    Every run has its own directory in 'runs_dir', with the checkpoints of its stages (the dataframes they produced)
+    and a manifest recording the stages that completed and the DW transactions that were committed.
+
+    Parameters:
+        runs_dir (str): Directory of the runs.
+        arguments (dict): Options of the run that change its results (e.g. {'full': False, 'stream': True}).
+        resume (bool, optional): If True, the latest unfinished run is resumed: its completed stages are reloaded
+            from their checkpoints, up to the first incomplete one. Default is False
+
+    Returns:
+        dict: The run ('dir', 'manifest', and 'resuming', True while the stages are reloaded from checkpoints).
+    """
+    unfinished = _unfinishedRuns(runs_dir)
+
+    if resume and unfinished:
+        run_dir, manifest = unfinished[0]
+        if manifest['arguments'] != arguments:
+            raise ValueError(f"The run in '{run_dir}' was started with the options {manifest['arguments']}, "
+                             f"it can not be resumed with {arguments}")
+        manifest['resumed_at'] = manifest.get('resumed_at', []) + [_now()]
+        run = {'dir': run_dir, 'manifest': manifest, 'resuming': True}
+    else:
+        # A new run replaces the interrupted ones, whose checkpoints are no longer needed
+        for run_dir, manifest in unfinished:
+            _removeCheckpoints({'dir': run_dir, 'manifest': manifest}, 'abandoned')
+
+        run_id = time.strftime('%Y%m%dT%H%M%S')
+        while os.path.exists(os.path.join(runs_dir, run_id)):
+            run_id = time.strftime('%Y%m%dT%H%M%S') + f'_{len(glob.glob(os.path.join(runs_dir, run_id[:15] + "*")))}'
+        run_dir = os.path.join(runs_dir, run_id)
+        os.makedirs(run_dir)
+        manifest = {
+            'run_id': run_id,
+            'started_at': _now(),
+            'arguments': arguments,
+            'status': 'running',
+            'values': {},
+            'stages': {},
+            'transactions': {}
+        }
+        run = {'dir': run_dir, 'manifest': manifest, 'resuming': False}
+
+    _writeManifest(run)
+    return run
+
+
+def loadCheckpoint(run, stage):
+    """
+    Reload the outputs of a stage, if the run is being resumed and the stage completed.
+
+    Once a stage has no checkpoint, the run stops resuming: that stage and every later one are executed again.
+
+    Parameters:
+        run (dict): The run, as returned by 'startRun'.
+        stage (str): Name of the stage (e.g. 'transform:Rubros').
+
+    Returns:
+        dict: Name -> dataframe or value saved by 'saveCheckpoint', or None if the stage has to be executed.
+    """
+    completed = run['manifest']['stages'].get(stage)
+    if not run['resuming'] or completed is None:
+        run['resuming'] = False
+        return None
+
+    outputs = dict(completed['values'])
+    for name, file_name in completed['frames'].items():
+        path = os.path.join(run['dir'], file_name)
+        if file_name.endswith('.arrow.parquet'):
+            outputs[name] = pq.read_table(path)
+        elif file_name.endswith('.parquet'):
+            outputs[name] = pd.read_parquet(path)
+        else:
+            outputs[name] = pd.read_pickle(path)
+
+    return outputs
+
+
+def saveCheckpoint(run, stage, frames, values=None):
+    """
+    Save the outputs of a stage, and record the stage as completed in the manifest.
+
+    The dataframes are written as Parquet, or pickled if Parquet can not store them (e.g. columns with mixed types).
+    Their index is kept, since some of them are looked up by position or by label. Arrow tables are written as Parquet too.
+
+    Parameters:
+        run (dict): The run, as returned by 'startRun'.
+        stage (str): Name of the stage.
+        frames (dict): Dataframe name -> dataframe (or Arrow table).
+        values (dict, optional): Name -> JSON serializable value, stored in the manifest as they are now
+            (e.g. the counters updated by the stage). Default is None
+    """
+    files = {}
+    for name, frame in frames.items():
+        base_path = os.path.join(run['dir'], f"{stage.replace(':', '_')}.{name}")
+        if isinstance(frame, pa.Table):
+            pq.write_table(frame, base_path + '.arrow.parquet')
+            files[name] = os.path.basename(base_path) + '.arrow.parquet'
+            continue
+        try:
+            frame.to_parquet(base_path + '.parquet')
+            files[name] = os.path.basename(base_path) + '.parquet'
+        except (ValueError, TypeError, ImportError):
+            frame.to_pickle(base_path + '.pkl')
+            files[name] = os.path.basename(base_path) + '.pkl'
+
+    run['manifest']['stages'][stage] = {
+        'completed_at': _now(),
+        'frames': files,
+        'values': json.loads(json.dumps(values or {}, default=str))
+    }
+    _writeManifest(run)
+
+
+def checkpointStage(run, profiler, stage, function, rows_in=None, values=None):
+    """
+    Execute a stage of the run, recorded by the profiler, and save its outputs as a checkpoint;
+    or reload them, if the run is being resumed and the stage completed.
+
+    Parameters:
+        run (dict): The run, as returned by 'startRun'.
+        profiler (dict): The profiler of the run (see 'modules.run_profiler').
+        stage (str): Name of the stage, for its checkpoint and its record (e.g. 'transform:Rubros').
+        function (callable): Function without arguments that executes the stage, and returns its outputs
+            (name -> dataframe or Arrow table). Their rows are the output rows of the stage.
+        rows_in (int, optional): Number of input rows of the stage. Default is None
+        values (dict, optional): Name -> dictionary updated by the stage (e.g. the counters of key misses),
+            saved with the checkpoint, and updated in place from it when the stage is reloaded. Default is None
+
+    Returns:
+        dict: The outputs of the stage.
+    """
+    values = values or {}
+
+    checkpoint = loadCheckpoint(run, stage)
+    if checkpoint is not None:
+        for name, value in values.items():
+            value.update(checkpoint.pop(name))
+        return checkpoint
+
+    with profileStage(profiler, stage, rows_in) as metrics:
+        outputs = function()
+        metrics['rows_out'] = sum(len(output) for output in outputs.values())
+
+    saveCheckpoint(run, stage, outputs, values=values)
+    return outputs
+
+
+def runValue(run, name, compute):
+    """
+    Return a value of the run that has to stay the same when the run is resumed (e.g. the high-water marks used
+    by its extraction): it is computed by 'compute' the first time, and read from the manifest afterwards.
+    The value must be JSON serializable.
+    """
+    values = run['manifest']['values']
+    if name not in values:
+        values[name] = compute()
+        _writeManifest(run)
+    return values[name]
+
+
+def prepareTransaction(engine, run, name, **details):
+    """
+    Record a DW transaction of the run before it is committed.
+
+    The transaction is recorded in 'TRANSACTIONS_TABLE', inside the transaction itself, and in the manifest with
+    the details needed to resume the run after it (e.g. the load statistics), which must be JSON serializable.
+    Once it is committed, 'recordTransaction' marks it as committed in the manifest.
+
+    Parameters:
+        engine (dict): The load session of the transaction (see 'modules.load_session').
+        run (dict): The run, as returned by 'startRun'.
+        name (str): Name of the transaction.
+        **details: Details of the transaction.
+    """
+    with dwConnection(engine) as conn:
+        conn.execute(text(f"INSERT INTO {TRANSACTIONS_TABLE} (run_id, transaction_name) VALUES (:run_id, :name)"),
+                     {'run_id': run['manifest']['run_id'], 'name': name})
+
+    run['manifest']['transactions'][name] = {'status': 'committing', **json.loads(json.dumps(details, default=str))}
+    _writeManifest(run)
+
+
+def recordTransaction(run, name):
+    """
+    Mark a DW transaction of the run as committed in the manifest, and return its details.
+    """
+    transaction = run['manifest']['transactions'][name]
+    transaction.update(status='committed', committed_at=_now())
+    _writeManifest(run)
+    return transaction
+
+
+def committedTransaction(run, name, engine):
+    """
+    Return the details of a DW transaction of the run if it was committed, or None if it was not.
+
+    A transaction that was interrupted while it was being committed is looked up in 'TRANSACTIONS_TABLE'.
+    A committed transaction must not be executed again when the run is resumed, whatever the state of the checkpoints.
+
+    Parameters:
+        run (dict): The run, as returned by 'startRun'.
+        name (str): Name of the transaction.
+        engine (sqlalchemy.engine.Engine): Database engine of the data warehouse.
+
+    Returns:
+        dict: The details recorded by 'prepareTransaction', or None.
+    """
+    transaction = run['manifest']['transactions'].get(name)
+    if transaction is None:
+        return None
+
+    if transaction['status'] == 'committing':
+        with engine.connect() as conn:
+            committed = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {TRANSACTIONS_TABLE} "
+                                          f"WHERE run_id = :run_id AND transaction_name = :name)"),
+                                     {'run_id': run['manifest']['run_id'], 'name': name}).scalar()
+        if not committed:
+            del run['manifest']['transactions'][name]
+            _writeManifest(run)
+            return None
+        return recordTransaction(run, name)
+
+    return transaction
+
+
+def finishRun(run):
+    """
+    Mark a run as finished, and remove its checkpoints (the manifest is kept as the record of the run).
+    """
+    _removeCheckpoints(run, 'finished')
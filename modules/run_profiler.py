@@ -0,0 +1,340 @@
+import cProfile
+import ctypes
+import datetime
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from sqlalchemy import event
+
+
+# Target table of an INSERT statement. Inserts into the temporary '*_staging' tables are not counted as inserted rows
+INSERT_PATTERN = re.compile(r'^\s*INSERT\s+INTO\s+"?(\w+)"?', re.IGNORECASE)
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    """
+    'PROCESS_MEMORY_COUNTERS' structure of the Windows API.
+    """
+    _fields_ = [('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)]
+
+
+def peakMemoryMB():
+    """
+    Return the peak resident memory of the process so far, in MB, or None if it can not be measured.
+    Reading it is cheap, so it is measured for every stage without slowing the run down.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes on Linux
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+    try:
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 1024 ** 2
+    except (AttributeError, OSError):
+        pass
+
+    return None
+
+
+def createProfiler(engine=None, cprofile=False):
+    """
+    Create the profiler of a run, which records the metrics of its stages (extractions, transforms and loads).
+
+    If a DW engine is given, every statement it executes is counted as a round-trip of the stage running in the
+    same thread, and the rows of its INSERT statements are counted as inserted rows.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine, optional): Database engine of the data warehouse. Default is None
+        cprofile (bool, optional): If True, each stage is also profiled with cProfile. Default is False
+
+    Returns:
+        dict: The profiler.
+    """
+    profiler = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'start': time.perf_counter(),
+        'stages': [],
+        'lock': threading.Lock(),
+        'local': threading.local(),
+        'cprofile': cprofile,
+        'cprofiles': {}
+    }
+
+    if engine is not None:
+        @event.listens_for(engine, 'after_cursor_execute')
+        def countStatement(conn, cursor, statement, parameters, context, executemany):
+            record = getattr(profiler['local'], 'record', None)
+            if record is None:
+                return
+
+            record['round_trips'] += 1
+            match = INSERT_PATTERN.match(statement)
+            if match and not match.group(1).endswith('_staging') and cursor.rowcount > 0:
+                record['rows_inserted'] += cursor.rowcount
+
+    return profiler
+
+
+def startStage(profiler, name, rows_in=None):
+    """
+    Start recording a stage, in the current thread.
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        name (str): Name of the stage (e.g. 'extract:CabVentas', 'transform:Clientes', 'load:clientes').
+        rows_in (int, optional): Number of input rows of the stage. Default is None
+
+    Returns:
+        dict: The record of the stage, to be given to 'endStage'.
+    """
+    record = {
+        'name': name,
+        'start': time.perf_counter() - profiler['start'],
+        'rows_in': rows_in,
+        'rows_out': None,
+        'rows_inserted': 0,
+        'round_trips': 0,
+        'peak_memory_delta_mb': None,
+        '_peak_memory_start': peakMemoryMB()
+    }
+
+    # Only one cProfile profiler can be active in a thread, so nested stages are not profiled
+    if profiler['cprofile'] and getattr(profiler['local'], 'cprofile', None) is None:
+        record['_cprofile'] = cProfile.Profile()
+        profiler['local'].cprofile = record['_cprofile']
+        record['_cprofile'].enable()
+
+    record['_parent'] = getattr(profiler['local'], 'record', None)
+    profiler['local'].record = record
+
+    return record
+
+
+def endStage(profiler, record, rows_out=None, rows_inserted=None, round_trips=None):
+    """
+    Finish recording a stage, and add it to the run.
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        record (dict): The record of the stage, as returned by 'startStage'.
+        rows_out (int, optional): Number of output rows of the stage. Default is None
+        rows_inserted (int, optional): Rows inserted by the stage, added to the ones counted from the engine. Default is None
+        round_trips (int, optional): Round-trips made outside of the engine (e.g. COPY statements), added to the counted ones. Default is None
+    """
+    end = time.perf_counter() - profiler['start']
+
+    cprofile = record.pop('_cprofile', None)
+    if cprofile is not None:
+        cprofile.disable()
+        profiler['local'].cprofile = None
+
+    # Growth of the peak resident memory of the process during the stage (process-wide, so it is shared by overlapping stages)
+    peak_memory_start = record.pop('_peak_memory_start')
+    peak_memory_end = peakMemoryMB()
+    if peak_memory_start is not None and peak_memory_end is not None:
+        record['peak_memory_delta_mb'] = peak_memory_end - peak_memory_start
+
+    profiler['local'].record = record.pop('_parent')
+
+    record['end'] = end
+    record['seconds'] = end - record['start']
+    record['rows_out'] = rows_out
+    record['rows_inserted'] += rows_inserted or 0
+    record['round_trips'] += round_trips or 0
+
+    with profiler['lock']:
+        profiler['stages'].append(record)
+        if cprofile is not None:
+            profiler['cprofiles'][record['name']] = cprofile
+
+
+@contextmanager
+def profileStage(profiler, name, rows_in=None):
+    """
+    Record a stage around a block of code. The block can set 'rows_out', 'rows_inserted' and 'round_trips'
+    in the yielded dictionary.
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        name (str): Name of the stage.
+        rows_in (int, optional): Number of input rows of the stage. Default is None
+
+    Yields:
+        dict: Metrics set by the block.
+    """
+    metrics = {}
+    record = startStage(profiler, name, rows_in)
+    try:
+        yield metrics
+    finally:
+        endStage(profiler, record, **metrics)
+
+
+def recordStage(profiler, name, seconds, rows_out=None, round_trips=None, **fields):
+    """
+    Add a stage that was timed elsewhere (e.g. the extraction of a table, timed by its worker thread).
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        name (str): Name of the stage.
+        seconds (float): Wall time of the stage.
+        rows_out (int, optional): Number of output rows of the stage. Default is None
+        round_trips (int, optional): Number of round-trips to the databases. Default is None
+        **fields: Other metrics of the stage (e.g. 'memory_mb' of an extraction).
+    """
+    with profiler['lock']:
+        profiler['stages'].append({
+            'name': name,
+            'start': None,
+            'end': None,
+            'seconds': seconds,
+            'rows_in': None,
+            'rows_out': rows_out,
+            'rows_inserted': 0,
+            'round_trips': round_trips or 0,
+            'peak_memory_delta_mb': None,
+            **fields
+        })
+
+
+def slowestStage(profiler):
+    """
+    Return the name of the slowest stage profiled with cProfile, or None if no stage was profiled.
+    """
+    profiled = [record for record in profiler['stages'] if record['name'] in profiler['cprofiles']]
+    if not profiled:
+        return None
+
+    return max(profiled, key=lambda record: record['seconds'])['name']
+
+
+def buildRunReport(profiler, **run_info):
+    """
+    Build the machine-readable report of a run.
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        **run_info: Information about the run (e.g. its command line arguments).
+
+    Returns:
+        dict: The report ('started_at', 'seconds', the given run information, and the 'stages' in order of start).
+    """
+    stages = sorted(profiler['stages'], key=lambda record: (record['start'] is not None, record['start'] or 0))
+
+    return {
+        'started_at': profiler['started_at'],
+        'seconds': time.perf_counter() - profiler['start'],
+        **run_info,
+        'stages': stages
+    }
+
+
+def writeRunReport(report_dir, report, profiler=None, top=25):
+    """
+    Write the JSON report of a run, and the cProfile statistics of its slowest stage (if it was profiled).
+
+    Parameters:
+        report_dir (str): Directory of the reports.
+        report (dict): The report, as returned by 'buildRunReport'.
+        profiler (dict, optional): The profiler, to write the cProfile statistics of the slowest stage. Default is None
+        top (int, optional): Number of functions of the cProfile summary. Default is 25
+
+    Returns:
+        tuple: Path of the JSON report, and the cProfile summary of the slowest stage (or None).
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    run_name = 'run_' + report['started_at'].replace(':', '').replace('-', '')
+
+    report_path = os.path.join(report_dir, f'{run_name}.json')
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=4, default=str)
+
+    slowest = slowestStage(profiler) if profiler is not None else None
+    if slowest is None:
+        return report_path, None
+
+    stats_path = os.path.join(report_dir, f'{run_name}.prof')
+    profiler['cprofiles'][slowest].dump_stats(stats_path)
+
+    summary = io.StringIO()
+    summary.write(f"cProfile of the slowest stage '{slowest}' (saved in {stats_path}):\n")
+    pstats.Stats(profiler['cprofiles'][slowest], stream=summary).sort_stats('cumulative').print_stats(top)
+
+    return report_path, summary.getvalue()
+
+
+def formatRunSummary(report):
+    """
+    Format the stages of a run report as a human-readable table.
+
+    Parameters:
+        report (dict): The report, as returned by 'buildRunReport'.
+
+    Returns:
+        str: The table.
+    """
+    def formatValue(value, spec=''):
+        return '-' if value is None else format(value, spec)
+
+    header = f"{'Stage':<32} {'Start':>8} {'Seconds':>8} {'Rows in':>10} {'Rows out':>10} {'Inserted':>10} {'Trips':>6} {'Peak +MB':>8}"
+    lines = [header, '-' * len(header)]
+
+    for record in report['stages']:
+        lines.append(f"{record['name']:<32} {formatValue(record['start'], '8.2f'):>8} {record['seconds']:8.2f} "
+                     f"{formatValue(record['rows_in']):>10} {formatValue(record['rows_out']):>10} "
+                     f"{record['rows_inserted']:>10} {record['round_trips']:>6} {formatValue(record['peak_memory_delta_mb'], '8.1f'):>8}")
+
+    lines.append('-' * len(header))
+    lines.append(f"{'Total':<32} {'':>8} {report['seconds']:8.2f}")
+
+    return '\n'.join(lines)
+
+
+def profileFunction(profiler, name, function, rows_in=None, metrics=len):
+    """
+    Wrap a function so that each call is recorded as a stage (e.g. a stage of 'modules.stage_scheduler').
+
+    Parameters:
+        profiler (dict): The profiler, as returned by 'createProfiler'.
+        name (str): Name of the stage.
+        function (callable): The function to wrap.
+        rows_in (int, optional): Number of input rows of the stage. Default is None
+        metrics (callable, optional): Function that receives the result and returns the output rows (int),
+            or a dictionary of metrics for 'endStage'. Default is 'len'
+
+    Returns:
+        callable: The wrapped function.
+    """
+    def profiledFunction(*args, **kwargs):
+        with profileStage(profiler, name, rows_in) as stage_metrics:
+            result = function(*args, **kwargs)
+            measured = metrics(result)
+            stage_metrics.update(measured if isinstance(measured, dict) else {'rows_out': measured})
+        return result
+
+    return profiledFunction
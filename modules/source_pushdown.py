@@ -0,0 +1,130 @@
+import pyarrow.compute as pc
+
+from modules.source_schema import SOURCE_SCHEMAS
+
+
+# Row filters of the source tables, applied as soon as the rows are extracted.
+# - 'sql' is pushed down into the WHERE clause of the extraction query, so the filtered rows are never sent over ODBC
+#   (None if the Access SQL dialect can not express the rule).
+# - 'pandas' is the reference version of the rule, applied to the extracted rows. It is a no-op when the SQL version
+#   is exact, and it keeps the result independent of the dialect otherwise (e.g. 'LIKE' is case-insensitive in Access).
+# - 'arrow' is the same rule as 'pandas', over an Arrow table (see 'modules.arrow_pipeline'). Rows whose mask is null are dropped.
+# Only the rules the ETL applies before any row-order dependent step are declared (e.g. 'CabVentas.total > 0' is
+# applied after the duplicated 'Fecha' are removed, so it stays in the script).
+SOURCE_FILTERS = {
+    'CabVentas': [
+        {'sql': "Cod_Comprob LIKE 'F%'", 'pandas': lambda df: df['Cod_Comprob'].str.startswith('F', na=False).astype(bool),
+         'arrow': lambda table: pc.starts_with(table['Cod_Comprob'], 'F')},
+        {'sql': "FechaComp IS NOT NULL", 'pandas': lambda df: df['FechaComp'].notna(), 'arrow': lambda table: pc.is_valid(table['FechaComp'])},
+        {'sql': "Hora IS NOT NULL", 'pandas': lambda df: df['Hora'].notna(), 'arrow': lambda table: pc.is_valid(table['Hora'])},
+        {'sql': "total IS NOT NULL", 'pandas': lambda df: df['total'].notna(), 'arrow': lambda table: pc.is_valid(table['total'])}
+    ],
+    'ItemVentas': [
+        {'sql': "cantidad > 0", 'pandas': lambda df: df['cantidad'] > 0, 'arrow': lambda table: pc.greater(table['cantidad'], 0)},
+        {'sql': "prec_unit >= 0", 'pandas': lambda df: df['prec_unit'] >= 0, 'arrow': lambda table: pc.greater_equal(table['prec_unit'], 0)},
+        {'sql': "prec_unit_iv >= 0", 'pandas': lambda df: df['prec_unit_iv'] >= 0, 'arrow': lambda table: pc.greater_equal(table['prec_unit_iv'], 0)},
+        {'sql': "total > 0", 'pandas': lambda df: df['total'] > 0, 'arrow': lambda table: pc.greater(table['total'], 0)}
+    ]
+}
+
+# Semi-joins pushed down into the extraction query: the rows of the table are only extracted if their 'column'
+# is a 'key' of the rows of 'table' that pass its SQL filters (e.g. the lines of the invoices that are "facturas").
+# The exact join is still made by the ETL (e.g. 'ItemVentas.nroorden' in the cleaned 'CabVentas').
+SOURCE_SEMI_JOINS = {
+    'ItemVentas': {'column': 'nroorden', 'table': 'CabVentas', 'key': 'NroOrden'}
+}
+
+
+def _sqlFilters(table, filters):
+    """
+    Return the SQL predicates of the filters of a table that the source can evaluate.
+    """
+    return [rule['sql'] for rule in filters.get(table, []) if rule['sql'] is not None]
+
+
+def buildSelectList(table, schemas=SOURCE_SCHEMAS):
+    """
+    Build the column list of the extraction query of a source table: only the columns used by the ETL.
+
+    Parameters:
+        table (str): Name of the source table.
+        schemas (dict, optional): Table name -> {column: dtype}. Default is 'SOURCE_SCHEMAS'
+
+    Returns:
+        str: The column list, or '*' if the table has no schema.
+    """
+    if table not in schemas:
+        return '*'
+    return ', '.join(schemas[table])
+
+
+def buildWhereClauses(table, filters=SOURCE_FILTERS, semi_joins=SOURCE_SEMI_JOINS):
+    """
+    Build the predicates pushed down into the WHERE clause of the extraction query of a source table.
+
+    Parameters:
+        table (str): Name of the source table.
+        filters (dict, optional): Table name -> list of rules, as in 'SOURCE_FILTERS'. Default is 'SOURCE_FILTERS'
+        semi_joins (dict, optional): Table name -> semi-join, as in 'SOURCE_SEMI_JOINS'. Default is 'SOURCE_SEMI_JOINS'
+
+    Returns:
+        list: The SQL predicates (without parameters), to be combined with AND.
+    """
+    clauses = _sqlFilters(table, filters)
+
+    if table in semi_joins:
+        semi_join = semi_joins[table]
+        subquery = f"SELECT {semi_join['key']} FROM {semi_join['table']}"
+        join_filters = _sqlFilters(semi_join['table'], filters)
+        if join_filters:
+            subquery += " WHERE " + " AND ".join(join_filters)
+        clauses.append(f"{semi_join['column']} IN ({subquery})")
+
+    return clauses
+
+
+def applyFallbackFilters(df, table, filters=SOURCE_FILTERS):
+    """
+    Apply the pandas version of the filters of a source table to its extracted rows.
+
+    Parameters:
+        df (pandas.DataFrame): Rows of the source table, already compacted with its schema.
+        table (str): Name of the source table.
+        filters (dict, optional): Table name -> list of rules, as in 'SOURCE_FILTERS'. Default is 'SOURCE_FILTERS'
+
+    Returns:
+        pandas.DataFrame: The rows that pass every filter.
+    """
+    if table not in filters or df.empty:
+        return df
+
+    keep = None
+    for rule in filters[table]:
+        mask = rule['pandas'](df).to_numpy(dtype=bool)
+        keep = mask if keep is None else keep & mask
+
+    return df[keep]
+
+
+def applyArrowFilters(table, name, filters=SOURCE_FILTERS):
+    """
+    Apply the Arrow version of the filters of a source table to its extracted rows.
+
+    Parameters:
+        table (pyarrow.Table): Rows of the source table, already cast with its Arrow schema.
+        name (str): Name of the source table.
+        filters (dict, optional): Table name -> list of rules, as in 'SOURCE_FILTERS'. Default is 'SOURCE_FILTERS'
+
+    Returns:
+        pyarrow.Table: The rows that pass every filter.
+    """
+    if name not in filters or table.num_rows == 0:
+        return table
+
+    keep = None
+    for rule in filters[name]:
+        mask = rule['arrow'](table)
+        keep = mask if keep is None else pc.and_kleene(keep, mask)
+
+    # The rows whose mask is null (e.g. comparisons with nulls) are dropped, as the NaN comparisons of the pandas rules
+    return table.filter(keep)
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+
+# Arrow-backed strings, with the NaN semantics of the numpy dtypes (comparisons with nulls are False, not NA)
+STRING = 'string[pyarrow_numpy]'
+
+# Columns used from each source table, and the dtype each one is stored with after the extraction.
+# - Nullable integers ('Int16', 'Int32', 'Int64') for the codes, so nulls do not turn them into float64.
+# - 'category' for the low-cardinality codes and names.
+# - None keeps the dtype returned by the driver (e.g. 'FechaComp' and 'Hora', which are parsed as strings later).
+# The columns that are not declared (e.g. 'ItemVentas.descripcion') are not selected by the extraction queries
+# (see 'modules.source_pushdown'), and are dropped as soon as the table is read otherwise.
+SOURCE_SCHEMAS = {
+    'Articulos': {
+        'codigo': 'Int32',
+        'subcodigo': 'Int16',
+        'nombre': STRING,
+        'rubro': 'Int16',
+        'subrubro': 'Int16',
+        'subrubro2': 'Int16',
+        'subrubro3': 'Int16'
+    },
+    'CabVentas': {
+        'NroOrden': 'Int64',
+        'Cod_Comprob': 'category',
+        'Cod_Vendedor': 'Int32',
+        'FechaComp': None,
+        'Hora': None,
+        'NroCuenta': 'Int32',
+        'Razon_Social': STRING,
+        'total': 'float64'
+    },
+    'Clientes': {
+        'NroCuenta': 'Int32',
+        'localidad': 'category',
+        'Razon_Social': STRING,
+        'Tipo_cliente': 'Int16'
+    },
+    'ItemVentas': {
+        'nroorden': 'Int64',
+        'codigo': 'Int32',
+        'subcodigo': 'Int16',
+        'cantidad': 'float64',
+        'prec_unit': 'float64',
+        'prec_unit_iv': 'float64',
+        'total': 'float64'
+    },
+    'Rubros': {
+        'Rubro': 'Int16',
+        'Subrubro1': 'Int16',
+        'Subrubro2': 'Int16',
+        'Subrubro3': 'Int16',
+        'Nombre': STRING
+    },
+    'TipoCliente': {
+        'Tipo_cliente': 'Int16',
+        'Detalle': STRING
+    },
+    'Vendedor': {
+        'Cod_Vendedor': 'Int32',
+        'Nombre': STRING
+    }
+}
+
+
+# Nullable integer dtypes of the schemas, from the narrowest one
+INTEGER_DTYPES = ('Int16', 'Int32', 'Int64')
+
+
+def _integerDtype(numbers, dtype):
+    """
+    Return the narrowest integer dtype, starting from 'dtype', whose range holds every value of a numeric series,
+    or None if not even 'Int64' holds them.
+    """
+    low, high = numbers.min(), numbers.max()
+    for candidate in INTEGER_DTYPES[INTEGER_DTYPES.index(dtype):]:
+        bounds = np.iinfo(candidate.lower())
+        if pd.isna(low) or (low >= bounds.min and high < bounds.max + 1):
+            return candidate
+    return None
+
+
+def _castColumn(series, dtype):
+    """
+    Cast a column to a dtype of the schema.
+    For the integer dtypes, the values that are not integers (e.g. empty strings) become nulls instead of raising.
+    A column with values out of the range of its integer dtype (e.g. a 'subcodigo' of 40000 in a bad source row)
+    is stored with a wider one, so the value reaches the cleaning, which rejects it as an invalid code.
+    Only the values out of the range of 'Int64' become nulls.
+    """
+    if dtype is None or series.dtype == dtype:
+        return series
+
+    if dtype.startswith('Int'):
+        numbers = pd.to_numeric(series, errors='coerce')
+        numbers = numbers.where(numbers % 1 == 0)
+
+        wide_dtype = _integerDtype(numbers, dtype)
+        if wide_dtype is None:
+            numbers, wide_dtype = numbers.where((numbers >= -2 ** 63) & (numbers < 2 ** 63)), 'Int64'
+        return numbers.astype(wide_dtype)
+
+    return series.astype(dtype)
+
+
+def applySchema(df, table, schemas=SOURCE_SCHEMAS):
+    """
+    Keep only the declared columns of a source table, and cast them to their declared dtypes.
+
+    Tables without a schema are returned unchanged, and declared columns missing from the dataframe are ignored.
+
+    Parameters:
+        df (pandas.DataFrame): Rows of the source table, as read from the database.
+        table (str): Name of the source table.
+        schemas (dict, optional): Table name -> {column: dtype}. Default is 'SOURCE_SCHEMAS'
+
+    Returns:
+        pandas.DataFrame: The compacted dataframe.
+    """
+    if table not in schemas:
+        return df
+
+    schema = {column: dtype for column, dtype in schemas[table].items() if column in df.columns}
+
+    return pd.DataFrame({column: _castColumn(df[column], dtype) for column, dtype in schema.items()}, index=df.index)
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def stage(function, depends_on=()):
+    """
+    Declare a stage of the pipeline.
+
+    Parameters:
+        function (callable): Function that runs the stage. It receives a dictionary with the results of the
+            stages it depends on (stage name -> result), and returns the result of the stage.
+        depends_on (iterable, optional): Names of the stages that must finish before this one starts
+            (e.g. the dimensions referenced by the foreign keys of a table). Default is ()
+
+    Returns:
+        dict: The stage ('function', 'depends_on').
+    """
+    return {'function': function, 'depends_on': tuple(depends_on)}
+
+
+def orderStages(stages):
+    """
+    Sort the stages of a pipeline so that every stage comes after the stages it depends on.
+
+    Parameters:
+        stages (dict): Stage name -> stage, as returned by 'stage'.
+
+    Returns:
+        list: The names of the stages, in a valid execution order.
+    """
+    for name, declared in stages.items():
+        unknown = [dependency for dependency in declared['depends_on'] if dependency not in stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {unknown}")
+
+    order = []
+    remaining = dict(stages)
+    while remaining:
+        ready = [name for name, declared in remaining.items() if all(dependency in order for dependency in declared['depends_on'])]
+        if not ready:
+            raise ValueError(f"The dependencies of the stages {list(remaining)} form a cycle")
+
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+
+    return order
+
+
+def runStages(stages, max_workers=4):
+    """
+    Run the stages of a pipeline on a pool of worker threads, as soon as the stages they depend on have finished.
+
+    Independent stages (e.g. the updates of dimensions that do not reference each other) run concurrently,
+    and a stage only starts when all its dependencies have returned (so the dimensions referenced by a table
+    are committed before it is loaded). If a stage fails, no new stages are started and its exception is raised.
+
+    Parameters:
+        stages (dict): Stage name -> stage, as returned by 'stage'.
+        max_workers (int, optional): Number of worker threads. Default is 4
+
+    Returns:
+        tuple: Dictionary stage name -> result, and dictionary stage name -> information of its execution
+        ('start' and 'end', in seconds since the scheduler started, and 'seconds').
+    """
+    pending = orderStages(stages)
+    results = {}
+    stage_info = {}
+    scheduler_start = time.perf_counter()
+
+    def runStage(name):
+        start = time.perf_counter()
+        dependencies = {dependency: results[dependency] for dependency in stages[name]['depends_on']}
+        result = stages[name]['function'](dependencies)
+        end = time.perf_counter()
+
+        stage_info[name] = {'start': start - scheduler_start, 'end': end - scheduler_start, 'seconds': end - start}
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+
+        while pending or running:
+            # Submit every stage whose dependencies have finished
+            for name in [name for name in pending if all(dependency in results for dependency in stages[name]['depends_on'])]:
+                running[executor.submit(runStage, name)] = name
+                pending.remove(name)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    # Do not start any other stage, and wait for the running ones before raising
+                    pending.clear()
+                    for other in running:
+                        other.cancel()
+                    raise
+
+    return results, stage_info
@@ -0,0 +1,106 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Value of 'default' that keeps the original value when no rule matches
+KEEP = object()
+
+# Rule sets. Each one has:
+# - 'upper': if True, the values are matched in upper case.
+# - 'rules': list of {'pattern': regex, 'value': result}, evaluated in order, the first rule whose pattern is found wins.
+# - 'default': result when no rule matches (or when the value is not a string), or KEEP.
+# - 'na_value': result for null values.
+# New spelling variants are added as patterns, without adding passes over the column.
+
+# 'Clientes.localidad' -> id of the 'Localidades' dimension (1: PARANÁ, 2: SANTA FE, 3: OTRO)
+LOCALIDAD_RULES = {
+    'upper': True,
+    'rules': [
+        {'pattern': r'^PA|PRANA|PARANA|PARANÁ', 'value': 1},
+        {'pattern': r'^SANT|SANTA FE|SANTAFE', 'value': 2}
+    ],
+    'default': 3,
+    'na_value': 3
+}
+
+# 'CabVentas.Razon_Social': empty, cancelled and annulled invoices are sold to "CONSUMIDOR FINAL"
+RAZON_SOCIAL_RULES = {
+    'upper': False,
+    'rules': [
+        {'pattern': r'^$', 'value': 'CONSUMIDOR FINAL'},
+        {'pattern': r'^CANCELAD[OA]', 'value': 'CONSUMIDOR FINAL'},
+        {'pattern': r'^ANULAD[OA]', 'value': 'CONSUMIDOR FINAL'},
+        {'pattern': r'^A N U L A D A', 'value': 'CONSUMIDOR FINAL'}
+    ],
+    'default': KEEP,
+    'na_value': 'CONSUMIDOR FINAL'
+}
+
+
+def compileRuleSet(rule_set):
+    """
+    Compile the patterns of a rule set.
+
+    Parameters:
+        rule_set (dict): Rule set, with the same format as 'LOCALIDAD_RULES'.
+
+    Returns:
+        list: (compiled pattern, result) tuples, in order.
+    """
+    return [(re.compile(rule['pattern']), rule['value']) for rule in rule_set['rules']]
+
+
+def normalizeValue(value, rule_set, compiled_rules=None):
+    """
+    Apply a rule set to a single non-null value.
+
+    Parameters:
+        value: The value to normalize.
+        rule_set (dict): Rule set, with the same format as 'LOCALIDAD_RULES'.
+        compiled_rules (list, optional): Rules already compiled with 'compileRuleSet'. Default is None
+
+    Returns:
+        The result of the first matching rule, or the default of the rule set.
+    """
+    if compiled_rules is None:
+        compiled_rules = compileRuleSet(rule_set)
+
+    default = value if rule_set['default'] is KEEP else rule_set['default']
+    if not isinstance(value, str):
+        return default
+
+    key = value.upper() if rule_set['upper'] else value
+    for pattern, result in compiled_rules:
+        if pattern.search(key):
+            return result
+
+    return default
+
+
+def normalizeColumn(series, rule_set):
+    """
+    Normalize a column with a rule set, evaluating the rules only once per distinct value.
+
+    The column is factorized into codes and distinct values, the rules are applied to each distinct value,
+    and the results are broadcast back to the rows through the codes.
+
+    Parameters:
+        series (pandas.Series): The column to normalize.
+        rule_set (dict): Rule set, with the same format as 'LOCALIDAD_RULES'.
+
+    Returns:
+        pandas.Series: The normalized column, with the same index as 'series'.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+    compiled_rules = compileRuleSet(rule_set)
+    normalized = np.empty(len(uniques) + 1, dtype=object)
+    for position, value in enumerate(uniques):
+        normalized[position] = normalizeValue(value, rule_set, compiled_rules)
+
+    # The last position holds the result for nulls, so the code -1 of 'factorize' points to it
+    normalized[-1] = rule_set['na_value']
+
+    return pd.Series(normalized[codes], index=series.index, name=series.name).infer_objects()
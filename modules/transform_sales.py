@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+
+from modules.calendar_dimension import floorToPeriod
+from modules.key_encoding import encodeArticuloId
+from modules.key_resolution import resolveKeys
+from modules.string_normalization import normalizeColumn, RAZON_SOCIAL_RULES
+
+
+def parseCabVentasFecha(df_CabVentas):
+    """
+    Select the columns of the 'CabVentas' (invoices) source table used by the ETL, and build the 'Fecha' of
+    each invoice from its 'FechaComp' and 'Hora'. Every rule only depends on the row itself.
+
+    Parameters:
+        df_CabVentas (pandas.DataFrame): Rows of the 'CabVentas' source table.
+
+    Returns:
+        pandas.DataFrame: The rows, with the datetime column 'Fecha'.
+    """
+    df_CabVentasFiltered = df_CabVentas[['NroOrden',
+                                         'Cod_Comprob',
+                                         'Cod_Vendedor',
+                                         'FechaComp',
+                                         'Hora',
+                                         'NroCuenta',
+                                         'Razon_Social',
+                                         'total'
+                                         ]]
+
+    # The records with null 'Cod_Comprob', 'FechaComp', 'Hora' or 'total', and the ones that are not "facturas" (invoices),
+    # were already removed by the source filters of the extraction (see 'SOURCE_FILTERS' in 'modules.source_pushdown')
+
+
+    # Convert the 'Hora' column to string
+    df_CabVentasFiltered['Hora'] = df_CabVentasFiltered['Hora'].astype(str)
+    # Extract the date from the 'Hora' column
+    df_CabVentasFiltered['Hora'] = df_CabVentasFiltered['Hora'].str.split(' ').str[1]
+
+    # Concatenate the 'FechaComp' column with the 'Hora' column
+    df_CabVentasFiltered['Fecha'] = df_CabVentasFiltered['FechaComp'].astype(str) + ' ' + df_CabVentasFiltered['Hora']
+    # Convert the 'Fecha' column to datetime
+    df_CabVentasFiltered['Fecha'] = pd.to_datetime(df_CabVentasFiltered['Fecha'], format='%Y-%m-%d %H:%M:%S')
+
+    return df_CabVentasFiltered
+
+
+def transformCabVentas(df_CabVentas, vendedores_index, clientes_index, codigo_vendedor_todos, nroCuenta_consumidorFinal, miss_counts=None):
+    """
+    Clean the 'CabVentas' (invoices) rows returned by 'parseCabVentasFecha', once their duplicated 'Fecha' are removed.
+
+    Every rule only depends on the row itself and on the given lookups, so the function can be applied
+    to the whole table or to parts of it with the same result.
+
+    Parameters:
+        df_CabVentas (pandas.DataFrame): Rows returned by 'parseCabVentasFecha'.
+        vendedores_index (dict): Index of the vendor codes, as returned by 'buildKeyIndex'. If None, the codes
+            are not resolved here, but by the load (see 'loadFactTableELT').
+        clientes_index (dict): Index of the client accounts, as returned by 'buildKeyIndex'. If None, the accounts
+            are not resolved here, but by the load.
+        codigo_vendedor_todos (int): Code of the vendor named "TODOS".
+        nroCuenta_consumidorFinal (int): Account of the client "CONSUMIDOR FINAL".
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.DataFrame: Dataframe with columns 'NroOrden', 'Cod_Comprob', 'Cod_Vendedor', 'Fecha', 'NroCuenta',
+        'Razon_Social' and 'total_orden'.
+    """
+    df_CabVentasFiltered = df_CabVentas
+
+    # If any value in the column is 0, or NaN, or empty, replace it with the code of the vendor named "TODOS" from the 'df_VendedorFiltered' dataframe
+    df_CabVentasFiltered['Cod_Vendedor'] = df_CabVentasFiltered['Cod_Vendedor'].replace(0, codigo_vendedor_todos)
+    df_CabVentasFiltered['Cod_Vendedor'] = df_CabVentasFiltered['Cod_Vendedor'].replace(np.nan, codigo_vendedor_todos)
+    df_CabVentasFiltered['Cod_Vendedor'] = df_CabVentasFiltered['Cod_Vendedor'].replace('', codigo_vendedor_todos)
+
+    # If any value in the 'Cod_Vendedor' column is not found in the 'df_VendedorFiltered' dataframe, replace it with the code of the vendor named "TODOS" from the 'df_VendedorFiltered' dataframe.
+    if vendedores_index is not None:
+        df_CabVentasFiltered['Cod_Vendedor'] = resolveKeys(df_CabVentasFiltered['Cod_Vendedor'], vendedores_index,
+                                                           default=codigo_vendedor_todos, name='vendedores', miss_counts=miss_counts)
+
+
+    # If any value in 'NroCuenta' is 0, NaN, or empty, replace it with the value of the 'Cuenta de Consumidor Final'.
+    df_CabVentasFiltered['NroCuenta'] = df_CabVentasFiltered['NroCuenta'].replace(0, nroCuenta_consumidorFinal)
+    df_CabVentasFiltered['NroCuenta'] = df_CabVentasFiltered['NroCuenta'].replace(np.nan, nroCuenta_consumidorFinal)
+    df_CabVentasFiltered['NroCuenta'] = df_CabVentasFiltered['NroCuenta'].replace('', nroCuenta_consumidorFinal)
+    df_CabVentasFiltered['NroCuenta'] = df_CabVentasFiltered['NroCuenta'].replace(' ', nroCuenta_consumidorFinal)
+
+    # If any value in 'NroCuenta' is not found in the 'df_ClientesFiltered' dataframe, replace it with the value of 'Cuenta de Consumidor Final'.
+    if clientes_index is not None:
+        df_CabVentasFiltered['NroCuenta'] = resolveKeys(df_CabVentasFiltered['NroCuenta'], clientes_index,
+                                                        default=nroCuenta_consumidorFinal, name='clientes', miss_counts=miss_counts)
+
+
+    # If any 'Razon_Social' is NaN, empty, "CANCELADO", "CANCELADA", "ANULADO", "ANULADA", 'A N U L A D A' or similar variations
+    # (recognized with the regex of 'RAZON_SOCIAL_RULES'), replace it with the value "CONSUMIDOR FINAL"
+    df_CabVentasFiltered['Razon_Social'] = normalizeColumn(df_CabVentasFiltered['Razon_Social'], RAZON_SOCIAL_RULES)
+
+    # If the 'NroCuenta' is equal to the one for "Consumidor Final", replace the 'Razon_Social' with the value "CONSUMIDOR FINAL"
+    df_CabVentasFiltered.loc[df_CabVentasFiltered['NroCuenta'] == nroCuenta_consumidorFinal, 'Razon_Social'] = 'CONSUMIDOR FINAL'
+
+
+    # If the total is 0, negative, or empty, delete the record
+    df_CabVentasFiltered = df_CabVentasFiltered[df_CabVentasFiltered['total'] > 0]
+
+
+    # Convert the 'Cod_Vendedor' and 'NroCuenta' columns to int
+    df_CabVentasFiltered['Cod_Vendedor'] = df_CabVentasFiltered['Cod_Vendedor'].astype(int)
+    df_CabVentasFiltered['NroCuenta'] = df_CabVentasFiltered['NroCuenta'].astype(int)
+
+
+    # Remove the columns 'FechaComp' and 'Hora', and move the column 'Fecha' to the position where 'FechaComp' was
+    df_CabVentasFiltered = df_CabVentasFiltered.drop(columns=['FechaComp', 'Hora'])
+    df_CabVentasFiltered = df_CabVentasFiltered[['NroOrden',
+                                                 'Cod_Comprob',
+                                                 'Cod_Vendedor',
+                                                 'Fecha',
+                                                 'NroCuenta',
+                                                 'Razon_Social',
+                                                 'total'
+                                                 ]]
+
+    # Rename columns
+    df_CabVentasFiltered = df_CabVentasFiltered.rename(columns={'NroOrden': 'NroOrden',
+                                                                'Cod_Comprob': 'Cod_Comprob',
+                                                                'Cod_Vendedor': 'Cod_Vendedor',
+                                                                'Fecha': 'Fecha',
+                                                                'NroCuenta': 'NroCuenta',
+                                                                'Razon_Social': 'Razon_Social',
+                                                                'total': 'total_orden'
+                                                                })
+
+    return df_CabVentasFiltered
+
+
+def transformItemVentas(df_ItemVentas, nroOrdenes, articulos_index, codigo_articulo_otro, miss_counts=None):
+    """
+    Clean the 'ItemVentas' (invoice lines) source table.
+
+    Every rule only depends on the row itself and on the given lookups, so the function can be applied
+    to the whole table or to consecutive chunks of it with the same result.
+
+    Parameters:
+        df_ItemVentas (pandas.DataFrame): Rows of the 'ItemVentas' source table.
+        nroOrdenes (pandas.Series): Order numbers kept after filtering 'CabVentas'.
+        articulos_index (dict): Index of the 'Articulos' dimension, as returned by 'buildKeyIndex'. If None, the ids
+            are not resolved here, but by the load (see 'loadFactTableELT').
+        codigo_articulo_otro (int): Article id of the article named "OTRO".
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.DataFrame: Dataframe with columns 'NroOrden', 'idarticulo', 'cantidad', 'precio_unitario',
+        'precio_unitario_iva' and 'total_renglon'.
+    """
+    df_ItemVentasFiltered = df_ItemVentas[['nroorden',
+                                           'codigo',
+                                           'subcodigo',
+                                           'cantidad',
+                                           'prec_unit',
+                                           'prec_unit_iv',
+                                           'total']]
+
+
+    # Filter the records by 'nroorden' that are in 'df_CabVentasFiltered'
+    df_ItemVentasFiltered = df_ItemVentasFiltered[df_ItemVentasFiltered['nroorden'].isin(nroOrdenes)]
+
+    # Convert NaN values in the 'codigo' and 'subcodigo' columns to 0
+    df_ItemVentasFiltered['codigo'] = df_ItemVentasFiltered['codigo'].fillna(999998)  # 999998 es el código de 'OTRO'
+    df_ItemVentasFiltered['subcodigo'] = df_ItemVentasFiltered['subcodigo'].fillna(0)
+
+    # If there is a value in 'codigo' that is negative or 0, replace it with 999998 (code for 'OTRO')
+    df_ItemVentasFiltered.loc[df_ItemVentasFiltered['codigo'] <= 0, 'codigo'] = 999998
+
+    # If there is a value in 'subcodigo' that is negative, replace it with 0
+    df_ItemVentasFiltered.loc[df_ItemVentasFiltered['subcodigo'] < 0, 'subcodigo'] = 0
+
+
+    # Compose the 'IDArticulo' from the codigo and subcodigo (6 and 2 digits)
+    # An id that can not be composed is left invalid, so it is replaced by the article "OTRO" below
+    df_ItemVentasFiltered['IDArticulo'] = encodeArticuloId(df_ItemVentasFiltered['codigo'], df_ItemVentasFiltered['subcodigo'], errors='coerce')
+
+    # If any value in the 'IDArticulo' column is not found in the 'df_ArticulosFiltered' dataframe, replace it with the code of the article named "OTRO" from the 'df_ArticulosFiltered' dataframe.
+    if articulos_index is not None:
+        df_ItemVentasFiltered['IDArticulo'] = resolveKeys(df_ItemVentasFiltered['IDArticulo'], articulos_index,
+                                                          default=codigo_articulo_otro, name='articulos', miss_counts=miss_counts)
+
+
+    # Convert to float the columns 'cantidad', 'prec_unit', 'prec_unit_iv' and 'total'
+    df_ItemVentasFiltered['cantidad'] = df_ItemVentasFiltered['cantidad'].astype(float)
+    df_ItemVentasFiltered['prec_unit'] = df_ItemVentasFiltered['prec_unit'].astype(float)
+    df_ItemVentasFiltered['prec_unit_iv'] = df_ItemVentasFiltered['prec_unit_iv'].astype(float)
+    df_ItemVentasFiltered['total'] = df_ItemVentasFiltered['total'].astype(float)
+
+
+    # If 'cantidad' is 0, negative, or empty, delete the record
+    df_ItemVentasFiltered = df_ItemVentasFiltered[df_ItemVentasFiltered['cantidad'] > 0]
+
+    # If 'prec_unit' is negative, or empty, delete the record
+    df_ItemVentasFiltered = df_ItemVentasFiltered[df_ItemVentasFiltered['prec_unit'] >= 0]
+
+    # If 'prec_unit_iv' with IVA is negative, or empty, delete the record
+    df_ItemVentasFiltered = df_ItemVentasFiltered[df_ItemVentasFiltered['prec_unit_iv'] >= 0]
+
+    # If 'total' is 0, negative, or empty, delete the record
+    df_ItemVentasFiltered = df_ItemVentasFiltered[df_ItemVentasFiltered['total'] > 0]
+
+
+
+    df_ItemVentasFiltered = df_ItemVentasFiltered.drop(columns=['codigo', 'subcodigo'])
+
+    df_ItemVentasFiltered = df_ItemVentasFiltered.rename(columns={'nroorden': 'NroOrden',
+                                                                'IDArticulo': 'idarticulo',
+                                                                'cantidad': 'cantidad',
+                                                                'prec_unit': 'precio_unitario',
+                                                                'prec_unit_iv': 'precio_unitario_iva',
+                                                                'total': 'total_renglon'})
+
+
+    # Convert 'nroorden' and 'idarticulo' columns to int
+    df_ItemVentasFiltered['NroOrden'] = df_ItemVentasFiltered['NroOrden'].astype(int)
+
+
+    df_ItemVentasFiltered = df_ItemVentasFiltered[['NroOrden',
+                                                   'idarticulo',
+                                                   'cantidad',
+                                                   'precio_unitario',
+                                                   'precio_unitario_iva',
+                                                   'total_renglon']]
+
+    return df_ItemVentasFiltered
+
+
+def mergeVentas(df_CabVentasFiltered, df_ItemVentasFiltered):
+    """
+    Join the cleaned invoices with their invoice lines, sorted by 'NroOrden'.
+    """
+    # Create Sales dataframe
+    # JOIN between 'df_CabVentasFiltered' and 'df_ItemVentasFiltered' to obtain the dataframe 'df_Ventas' using the 'NroOrden' column
+    df_Ventas = pd.merge(df_CabVentasFiltered, df_ItemVentasFiltered, on='NroOrden', how='inner')
+
+    # Ordenar por NroOrden
+    return df_Ventas.sort_values(by=['NroOrden'])
+
+
+def buildFactRenglonFactura(df_CabVentasFiltered, df_ItemVentasFiltered, tiempo_index, miss_counts=None):
+    """
+    Build the rows of the 'Renglon_Factura' fact table from the cleaned invoices and invoice lines.
+
+    Parameters:
+        df_CabVentasFiltered (pandas.DataFrame): Cleaned 'CabVentas' (invoices).
+        df_ItemVentasFiltered (pandas.DataFrame): Cleaned 'ItemVentas' (invoice lines), or a chunk of them.
+        tiempo_index (dict): Index of the 'Tiempo' dimension ('fecha' -> 'idfecha'), as returned by 'buildKeyIndex'.
+        miss_counts (dict, optional): Number of misses per dimension, updated in place. Default is None
+
+    Returns:
+        pandas.DataFrame: The fact rows, with the columns of the 'Renglon_Factura' table.
+    """
+    df_Ventas = mergeVentas(df_CabVentasFiltered, df_ItemVentasFiltered)
+
+    # Each invoice belongs to the period of the day of its 'Fecha'. 'Tiempo' has no default member: the calendar is
+    # generated over the range of dates of the invoices, so a period that is not found is an error, not a NULL key
+    periodos = floorToPeriod(df_Ventas['Fecha'])
+    idfecha = resolveKeys(periodos, tiempo_index, name='tiempo', miss_counts=miss_counts)
+    if idfecha.isna().any():
+        raise ValueError(f"{idfecha.isna().sum()} fact rows have a period that is not in the 'Tiempo' dimension "
+                         f"(e.g. {periodos[idfecha.isna()].iloc[0]}), the calendar does not cover the dates of the invoices")
+
+    # Create Fact table 'HechosRenglonFactura' wich means 'invoice line facts'
+    df_HechosRenglonFactura = pd.DataFrame({
+        # Sale date, the partition key of the table (the 'idfecha' are not in date order)
+        'fecha': df_Ventas['Fecha'].dt.normalize(),
+
+        # Dimensions
+        'idfecha': idfecha,
+        'idarticulo': df_Ventas['idarticulo'],
+        'idcliente': df_Ventas['NroCuenta'],
+        'idvendedor': df_Ventas['Cod_Vendedor'],
+        'nroorden': df_Ventas['NroOrden'],
+
+        # Metrics
+        'total_venta_renglon': df_Ventas['total_renglon'],
+        'cantidad_articulos_renglon': df_Ventas['cantidad'],
+        'precio_unitario': df_Ventas['precio_unitario'],
+        'precio_unitario_iva': df_Ventas['precio_unitario_iva']
+    })
+
+    return df_HechosRenglonFactura
+
+
+def buildFactStagingRows(df_CabVentasFiltered, df_ItemVentasFiltered):
+    """
+    Build the rows of the staging table of the ELT load of 'Renglon_Factura' (see 'loadFactTableELT').
+
+    They are the fact rows with the natural keys of the dimensions, whose surrogate keys are resolved
+    by the data warehouse: the start of the period of the sale ('periodo', the 'fecha' of 'Tiempo') instead of
+    'idfecha', and the article, client and vendor codes as they were cleaned, without checking the dimensions.
+
+    Parameters:
+        df_CabVentasFiltered (pandas.DataFrame): Cleaned 'CabVentas' (invoices).
+        df_ItemVentasFiltered (pandas.DataFrame): Cleaned 'ItemVentas' (invoice lines), or a chunk of them.
+
+    Returns:
+        pandas.DataFrame: The staged rows, with the columns of 'RENGLON_FACTURA_STAGING_COLUMNS'.
+    """
+    df_Ventas = mergeVentas(df_CabVentasFiltered, df_ItemVentasFiltered)
+
+    return pd.DataFrame({
+        'fecha': df_Ventas['Fecha'].dt.normalize(),
+        'periodo': floorToPeriod(df_Ventas['Fecha']),
+        'idarticulo': df_Ventas['idarticulo'],
+        'idcliente': df_Ventas['NroCuenta'],
+        'idvendedor': df_Ventas['Cod_Vendedor'],
+        'nroorden': df_Ventas['NroOrden'],
+        'total_venta_renglon': df_Ventas['total_renglon'],
+        'cantidad_articulos_renglon': df_Ventas['cantidad'],
+        'precio_unitario': df_Ventas['precio_unitario'],
+        'precio_unitario_iva': df_Ventas['precio_unitario_iva']
+    })
@@ -1,6 +1,274 @@
+import numpy as np
 import pandas as pd
+from sqlalchemy import text, table as sql_table, column, literal_column
+from sqlalchemy.dialects.postgresql import insert
 
-def updateDimensionTable(engine, table, data, pk="id"):
+from modules.dimension_cache import queryDimensionState, readCachedDimension, writeCachedDimension
+from modules.load_session import INSERT_PAGE_SIZE, afterCommit, dwConnection, readTable
+
+
+# Maximum number of bind parameters of a single PostgreSQL statement
+INSERT_MAX_PARAMETERS = 65535
+
+
+def _toKeyList(natural_key, data, pk):
+    """
+    Normalize a natural key declaration into a list of column names.
+    If no natural key is declared, every column of 'data' except the primary key is used.
+    """
+    if natural_key is None:
+        return [column for column in data.columns if column != pk]
+    if isinstance(natural_key, str):
+        return [natural_key]
+    return list(natural_key)
+
+
+def hashNaturalKey(data, natural_key):
+    """
+    Hash the natural key tuples of a dataframe, one 64-bit hash per row.
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe containing the natural key columns.
+        natural_key (list): Names of the columns that form the natural key.
+
+    Returns:
+        numpy.ndarray: Array of uint64 hashes, aligned with the rows of 'data'.
+    """
+    return pd.util.hash_pandas_object(data[natural_key], index=False).values
+
+
+def antiJoinNaturalKey(data, old_data, natural_key):
+    """
+    Return the rows of 'data' whose natural key is not present in 'old_data'.
+
+    The key tuples of both dataframes are hashed once and compared as a set, so the cost
+    is linear in the number of rows of both dataframes, and rows are compared as whole
+    keys instead of cell by cell. Rows repeated in 'data' are only returned once.
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe of candidate rows.
+        old_data (pandas.DataFrame): Dataframe of rows already stored in the dimension.
+        natural_key (str or list): Name or names of the columns that form the natural key.
+
+    Returns:
+        pandas.DataFrame: The rows of 'data' that are not in 'old_data'.
+    """
+    natural_key = _toKeyList(natural_key, data, None)
+
+    data = data.drop_duplicates(subset=natural_key)
+
+    if old_data.empty:
+        return data
+
+    # Align the key dtypes with the ones stored in the database, so equal values hash equally
+    data_keys = data[natural_key]
+    try:
+        data_keys = data_keys.astype(old_data[natural_key].dtypes.to_dict())
+    except (TypeError, ValueError):
+        pass
+
+    old_hashes = hashNaturalKey(old_data, natural_key)
+    is_new = ~pd.Series(hashNaturalKey(data_keys, natural_key)).isin(old_hashes).values
+
+    return data[is_new]
+
+
+def hashRowContent(data, columns):
+    """
+    Hash the content of the rows of a dataframe, one signed 64-bit hash per row (stored in a BIGINT column).
+
+    The values are hashed in a canonical form (numbers as float64, everything else as text, and missing values
+    as an empty text), so the hash of a row does not depend on the dtypes its columns were extracted with.
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe containing the columns.
+        columns (list): Names of the columns whose content is hashed.
+
+    Returns:
+        numpy.ndarray: Array of int64 hashes, aligned with the rows of 'data'.
+    """
+    canonical = {}
+    for name in columns:
+        values = data[name]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            canonical[name] = values.astype('float64')
+        else:
+            canonical[name] = values.astype(object).where(values.notna(), '').astype(str)
+
+    return pd.util.hash_pandas_object(pd.DataFrame(canonical, index=data.index), index=False).values.view(np.int64)
+
+
+def compareRowHashes(data, old_data, key, hash_column):
+    """
+    Classify the rows of 'data' against the rows already stored in a dimension, comparing their content hashes.
+
+    The keys of both dataframes are matched through their hashes (as in 'antiJoinNaturalKey'), so the cost is
+    linear in the number of rows, and the unchanged rows cost nothing beyond the comparison of two integers.
+
+    Parameters:
+        data (pandas.DataFrame): Dataframe of candidate rows, with the key and hash columns.
+        old_data (pandas.DataFrame): Dataframe of rows already stored in the dimension, with the key and hash columns.
+        key (list): Names of the columns that identify a row (primary key or natural key).
+        hash_column (str): Name of the column with the content hash of each row.
+
+    Returns:
+        tuple: Two boolean arrays aligned with the rows of 'data': the rows whose key is new,
+        and the rows whose key exists with a different content hash.
+    """
+    if old_data.empty:
+        return np.ones(len(data), dtype=bool), np.zeros(len(data), dtype=bool)
+
+    # Align the key dtypes with the ones stored in the database, so equal values hash equally
+    data_keys = data[key]
+    try:
+        data_keys = data_keys.astype(old_data[key].dtypes.to_dict())
+    except (TypeError, ValueError):
+        pass
+
+    old_index = pd.Index(hashNaturalKey(old_data, key))
+    old_hashes = old_data[hash_column].to_numpy(dtype=np.int64)
+    if not old_index.is_unique:
+        first = ~old_index.duplicated()
+        old_index, old_hashes = old_index[first], old_hashes[first]
+
+    positions = old_index.get_indexer(hashNaturalKey(data_keys, key))
+    is_new = positions < 0
+    is_changed = ~is_new & (old_hashes[np.where(is_new, 0, positions)] != data[hash_column].to_numpy(dtype=np.int64))
+
+    return is_new, is_changed
+
+
+def _toRecords(data):
+    """
+    Convert the rows of a dataframe to dictionaries of Python values (numpy scalars and pandas missing values
+    are not accepted by the driver).
+    """
+    return data.astype(object).where(data.notna(), None).to_dict('records')
+
+
+def _pageSize(conn, data):
+    """
+    Return the rows per multi-row statement: the 'insertmanyvalues_page_size' of the connection, capped so
+    a statement never exceeds the bind parameters accepted by PostgreSQL.
+    """
+    page_size = conn.get_execution_options().get('insertmanyvalues_page_size', INSERT_PAGE_SIZE)
+    return max(1, min(page_size, INSERT_MAX_PARAMETERS // max(1, len(data.columns))))
+
+
+def bulkInsert(conn, table, data, conflict_pk=None):
+    """
+    Insert the rows of 'data' into 'table' with multi-row 'INSERT ... RETURNING' statements, and return the inserted rows.
+
+    The rows are sent in pages of the 'insertmanyvalues_page_size' of the connection (see 'modules.load_session'),
+    capped so a statement never exceeds the bind parameters accepted by PostgreSQL, and the statement is compiled
+    once and reused for every page. If 'conflict_pk' is given, the rows whose primary key (or unique column)
+    already exists are ignored ('ON CONFLICT (pk) DO NOTHING').
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse, inside a transaction.
+        table (str): The name of the table.
+        data (pandas.DataFrame): Rows to insert, with the same column names as the table.
+        conflict_pk (str, optional): Primary key or unique column used to ignore existing rows. Default is None
+
+    Returns:
+        pandas.DataFrame: The inserted rows, with all the columns of the table (primary key included).
+    """
+    if data.empty:
+        return pd.DataFrame()
+
+    statement = insert(sql_table(table, *[column(name) for name in data.columns]))
+    if conflict_pk is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=[conflict_pk])
+    statement = statement.returning(literal_column('*'))
+
+    result = conn.execute(statement, _toRecords(data), execution_options={'insertmanyvalues_page_size': _pageSize(conn, data)})
+    return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+
+def bulkUpdate(conn, table, data, key):
+    """
+    Overwrite the rows of 'table' that have the keys of 'data' with its values (slowly changing dimension type 1),
+    and return the updated rows.
+
+    The rows are loaded into a temporary staging table with multi-row inserts, and applied with a single
+    'UPDATE ... FROM' statement, so the number of statements does not depend on the number of changed rows.
+
+    Parameters:
+        conn (sqlalchemy.engine.Connection): Connection to the data warehouse, inside a transaction.
+        table (str): The name of the table.
+        data (pandas.DataFrame): New values of the rows, with the key columns and the columns to overwrite.
+        key (list): Names of the columns that identify a row (primary key or natural key).
+
+    Returns:
+        pandas.DataFrame: The updated rows, with all the columns of the table.
+    """
+    data = data.drop_duplicates(subset=key)
+    if data.empty:
+        return pd.DataFrame()
+
+    staging = f"{table}_staging"
+    columns = ", ".join(data.columns)
+
+    # Create an empty staging table with the same columns (and types) as the dimension, and load the rows into it
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    conn.execute(text(f"CREATE TEMPORARY TABLE {staging} AS SELECT {columns} FROM {table} WHERE false"))
+    conn.execute(insert(sql_table(staging, *[column(name) for name in data.columns])), _toRecords(data),
+                 execution_options={'insertmanyvalues_page_size': _pageSize(conn, data)})
+
+    assignments = ", ".join(f"{name} = s.{name}" for name in data.columns if name not in key)
+    condition = " AND ".join(f"t.{name} = s.{name}" for name in key)
+    result = conn.execute(text(f"UPDATE {table} AS t SET {assignments} FROM {staging} AS s WHERE {condition} RETURNING t.*"))
+    updated = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+    conn.execute(text(f"DROP TABLE {staging}"))
+
+    return updated
+
+
+def _appendInserted(old_data, inserted):
+    """
+    Append the inserted rows to the previous content of a dimension, keeping the column order and dtypes of the latter.
+    """
+    if inserted.empty:
+        return old_data
+    if old_data.empty:
+        return inserted.reset_index(drop=True)
+
+    inserted = inserted[old_data.columns].astype(old_data.dtypes.to_dict(), errors='ignore')
+    return pd.concat([old_data, inserted], ignore_index=True)
+
+
+def _applyUpdated(dimension_df, updated, key):
+    """
+    Replace the rows of a dimension dataframe by their updated version, keeping the column order and dtypes of the former.
+    """
+    if updated.empty or dimension_df.empty:
+        return dimension_df
+
+    updated = updated[dimension_df.columns].astype(dimension_df.dtypes.to_dict(), errors='ignore')
+    is_updated = pd.Series(hashNaturalKey(dimension_df, key)).isin(hashNaturalKey(updated, key)).values
+
+    return pd.concat([dimension_df[~is_updated], updated], ignore_index=True)
+
+
+def _readCachedDimension(conn, cache_path, table, pk, hash_column=None):
+    """
+    Read a dimension from the local cache if it is enabled and still valid for the DW table, or return None.
+    """
+    if cache_path is None:
+        return None
+    return readCachedDimension(cache_path, table, queryDimensionState(conn, table, pk, hash_column))
+
+
+def _writeCachedDimension(engine, cache_path, table, dimension_df, pk, new_rows, hash_column):
+    """
+    Store a dimension in the local cache, if it is enabled, once its rows are committed (at the end of the load session).
+    """
+    if cache_path is not None:
+        afterCommit(engine, lambda: writeCachedDimension(cache_path, table, dimension_df, pk, new_rows=new_rows, hash_column=hash_column))
+
+
+def updateDimensionTable(engine, table, data, pk="id", natural_key=None, cache_path=None, hash_column=None):
     """
     Author: Maximiliano Fernandez
 
@@ -11,58 +279,125 @@ def updateDimensionTable(engine, table, data, pk="id"):
     The dimension table must be created and the columns must have the same names as in the dataframe.
 
     Parameters:
-        engine (sqlalchemy.engine.Engine): Database engine.
+        engine (sqlalchemy.engine.Engine or dict): Database engine, or a load session (see 'modules.load_session').
         table (str): The name of the dimension table to update.
         data (pandas.DataFrame): Dataframe of new data to be added, excluding the primary key
         pk (str, optional): Name of the primary key. Default is "id"
+        natural_key (str or list, optional): Column or columns that identify a row of the dimension
+            (e.g. 'fecha' for 'tiempo', or the primary key itself if 'data' supplies it). Default is every column of 'data' except the primary key
+        cache_path (str, optional): Path of the local dimension cache (see 'modules.dimension_cache').
+            If the cache is valid, the table is not read from the database. Default is None (no cache)
+        hash_column (str, optional): Column of the table with the content hash of each row. If given, the rows
+            whose natural key exists but whose other columns changed are overwritten (SCD type 1). Default is None
 
     Returns:
         dimension_df: The updated dimension table as a DataFrame.
     """
-    with engine.connect() as conn, conn.begin():
-        old_data = pd.read_sql_table(table, conn)
+    natural_key = _toKeyList(natural_key, data, pk)
+
+    # Columns that can change for an existing natural key, tracked through the hash of the row
+    attributes = [name for name in data.columns if name != pk and name not in natural_key]
+    track_changes = hash_column is not None and len(attributes) > 0
+    if track_changes:
+        data = data.assign(**{hash_column: hashRowContent(data, attributes)})
+
+    with dwConnection(engine) as conn:
+        old_data = _readCachedDimension(conn, cache_path, table, pk, hash_column if track_changes else None)
+        cache_is_valid = old_data is not None
 
-        # Delete the pk column
-        old_data.drop(pk, axis=1, inplace=True)
+        if not cache_is_valid:
+            old_data = readTable(conn, table)
 
-        # 'new_data' is the dataframe of set difference between 'old_data'
-        new_data = data[~data.stack().isin(old_data.stack().values).unstack()].dropna()
+        # 'new_data' is the set difference between 'data' and 'old_data' on the natural key
+        new_data = antiJoinNaturalKey(data, old_data, natural_key)
 
-        # Insert 'new_data'
-        new_data.to_sql(table, conn, if_exists='append', index=False)
+        # Insert 'new_data', getting back the rows with their primary keys as they are in the database
+        inserted = bulkInsert(conn, table, new_data)
 
-        # Query and return the final data
-        dimension_df = pd.read_sql_table(table, conn)
+        # Overwrite the existing rows whose content changed
+        updated = pd.DataFrame()
+        if track_changes:
+            _, is_changed = compareRowHashes(data, old_data, natural_key, hash_column)
+            updated = bulkUpdate(conn, table, data.loc[is_changed, natural_key + attributes + [hash_column]], natural_key)
+
+        # The final data is the previous data plus the inserted rows, with the updated rows replaced
+        dimension_df = _applyUpdated(_appendInserted(old_data, inserted), updated, natural_key)
+
+    _writeCachedDimension(engine, cache_path, table, dimension_df, pk, inserted if cache_is_valid and updated.empty else None,
+                          hash_column if track_changes else None)
 
     return dimension_df
 
 
-def updateDimensionTableIntPK(engine, table, data, pk="id"):
+def updateDimensionTableIntPK(engine, table, data, pk="id", bulk=True, cache_path=None, hash_column=None, changes=None):
     """
     Update a dimension table in a database using the provided engine, table name, data, and primary key.
     This function is used when the primary key is an integer and not a serial.
 
     Parameters:
-        engine (sqlalchemy.engine.Engine): Database engine
+        engine (sqlalchemy.engine.Engine or dict): Database engine, or a load session (see 'modules.load_session')
         table (str): The name of the dimension table to update.
         data (pandas.DataFrame): Dataframe of new data to be added, excluding the primary key
         pk (str, optional): Name of the primary key. Default is "id"
+        bulk (bool, optional): If True, the rows are inserted with multi-row statements, whose number does not
+            depend on the number of existing rows. If False, the rows are compared and inserted one by one. Default is True
+        cache_path (str, optional): Path of the local dimension cache (see 'modules.dimension_cache').
+            If the cache is valid, the table is not read from the database. Default is None (no cache)
+        hash_column (str, optional): Column of the table with the content hash of each row. If given, only the new
+            rows are inserted, and the existing rows whose content changed are overwritten (SCD type 1). Default is None
+        changes (dict, optional): If given with 'hash_column', the overwritten rows are stored in it, as they were
+            ('before') and as they are now ('after'). Default is None
 
     Returns:
         pandas.DataFrame: The updated dimension table as a DataFrame.
     """
-    with engine.connect() as conn, conn.begin():
-        existing_data = pd.read_sql_table(table, conn)
+    track_changes = hash_column is not None
+    if track_changes:
+        data = data.assign(**{hash_column: hashRowContent(data, [name for name in data.columns if name != pk])})
+
+    with dwConnection(engine) as conn:
+        existing_data = _readCachedDimension(conn, cache_path, table, pk, hash_column)
+        cache_is_valid = existing_data is not None
 
-        for index, row in data.iterrows():
-            pk_value = row[pk]
-            existing_index = existing_data[existing_data[pk] == pk_value].index
-            if len(existing_index) > 0:
-                pass
-            else:
-                row.to_frame().T.to_sql(table, conn, if_exists='append', index=False)
+        updated = pd.DataFrame()
+        if track_changes:
+            if not cache_is_valid:
+                existing_data = readTable(conn, table)
 
-        # Query and return the final data
-        dimension_df = pd.read_sql_table(table, conn)
+            # Overwrite the existing rows whose content changed, and leave only the new rows to be inserted
+            is_new, is_changed = compareRowHashes(data, existing_data, [pk], hash_column)
+            updated = bulkUpdate(conn, table, data[is_changed], [pk])
+            data = data[is_new]
 
-    return dimension_df
\ No newline at end of file
+            if changes is not None and not updated.empty:
+                changes['before'] = existing_data[existing_data[pk].isin(updated[pk])]
+                changes['after'] = updated
+
+        if bulk:
+            inserted = bulkInsert(conn, table, data, conflict_pk=pk)
+        else:
+            if existing_data is None:
+                existing_data = readTable(conn, table)
+
+            inserted_rows = []
+            for index, row in data.iterrows():
+                pk_value = row[pk]
+                existing_index = existing_data[existing_data[pk] == pk_value].index
+                if len(existing_index) > 0:
+                    pass
+                else:
+                    row.to_frame().T.to_sql(table, conn, if_exists='append', index=False)
+                    inserted_rows.append(row)
+
+            inserted = pd.DataFrame(inserted_rows)
+
+        if cache_is_valid or track_changes:
+            # The final data is the cached (or read) data plus the inserted rows, with the updated rows replaced
+            dimension_df = _applyUpdated(_appendInserted(existing_data, inserted), updated, [pk])
+        else:
+            # Query and return the final data
+            dimension_df = readTable(conn, table)
+
+    _writeCachedDimension(engine, cache_path, table, dimension_df, pk, inserted if cache_is_valid and updated.empty else None, hash_column)
+
+    return dimension_df
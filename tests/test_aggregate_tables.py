@@ -0,0 +1,31 @@
+import pandas as pd
+
+from modules.aggregate_tables import AGGREGATE_TABLES, buildRefreshStatements, changedKeys
+
+
+def test_changed_keys_only_of_the_compared_columns():
+    changes = {
+        'before': pd.DataFrame({'idarticulo': [1, 2, 3], 'nombre': ['A', 'B', 'C'], 'rubro': [10, 20, None]}),
+        'after': pd.DataFrame({'idarticulo': [3, 2, 1], 'nombre': ['C', 'B2', 'A'], 'rubro': [None, 20, 11]})
+    }
+
+    assert changedKeys(changes, 'idarticulo', ['rubro']) == [1]
+    assert changedKeys(changes, 'idarticulo', ['nombre', 'rubro']) == [1, 2]
+
+
+def test_changed_keys_without_changes():
+    assert changedKeys({}, 'idarticulo', ['rubro']) == []
+    assert changedKeys(None, 'idarticulo', ['rubro']) == []
+
+
+def test_refresh_statements_read_the_touched_days_only():
+    delete, bounds, insert = buildRefreshStatements('ventas_mensuales_vendedor_rubro', AGGREGATE_TABLES['ventas_mensuales_vendedor_rubro'],
+                                                    changed_columns=['idarticulo'])
+
+    assert 'f.fecha BETWEEN :fecha_desde AND :fecha_hasta' in insert
+    assert ':changed_idarticulo' in delete and ':changed_idarticulo' in bounds and ':changed_idarticulo' in insert
+
+    delete, bounds, insert = buildRefreshStatements('ventas_mensuales_vendedor_rubro', AGGREGATE_TABLES['ventas_mensuales_vendedor_rubro'],
+                                                    touched_only=False)
+
+    assert delete == 'TRUNCATE ventas_mensuales_vendedor_rubro' and bounds is None and 'WHERE' not in insert
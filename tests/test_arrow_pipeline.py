@@ -0,0 +1,97 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from modules.arrow_pipeline import ARROW_TYPES, _arrowColumn, transformCabVentasArrow, transformItemVentasArrow
+from modules.key_resolution import buildKeyIndex
+from modules.source_schema import SOURCE_SCHEMAS, applySchema
+from modules.transform_sales import parseCabVentasFecha, transformCabVentas, transformItemVentas
+
+
+def _sourceTables(table, values):
+    """
+    The same source rows as the pandas path and the Arrow path extract them ('readTable' and 'readArrowTable').
+    """
+    schema = SOURCE_SCHEMAS[table]
+    df = applySchema(pd.DataFrame(values), table)
+    arrow_table = pa.table({column: _arrowColumn(list(values[column]), column, table, ARROW_TYPES.get(schema[column])) for column in values})
+    return df, arrow_table
+
+
+def _cabVentas(rows, seed=0):
+    """
+    Synthetic 'CabVentas', with duplicated 'Fecha', null or 0 vendors and accounts, annulled or cancelled names and invalid totals.
+    """
+    rng = np.random.default_rng(seed)
+    # Few distinct days and times, so many invoices share their 'Fecha'
+    fechaComp = [datetime.datetime(2023, 1, 1) + datetime.timedelta(days=int(day)) for day in rng.integers(0, 20, rows)]
+    hora = [datetime.datetime(1899, 12, 30, int(hour), int(minute)) for hour, minute in zip(rng.integers(8, 20, rows), rng.choice([0, 30], rows))]
+    codes = lambda high: [None if value < 0 else int(value) for value in rng.integers(-1, high, rows)]
+
+    return {
+        'NroOrden': [int(value) for value in rng.permutation(rows) + 1],
+        'Cod_Comprob': [str(value) for value in rng.choice(['FA', 'FB'], rows)],
+        'Cod_Vendedor': codes(12),
+        'FechaComp': fechaComp,
+        'Hora': hora,
+        'NroCuenta': codes(60),
+        'Razon_Social': [None if value == '' else value for value in rng.choice(['', 'ANULADA', 'A N U L A D A', 'CANCELADO', 'Perez Juan', 'GOMEZ SA'], rows)],
+        'total': [float(value) for value in rng.choice([-5.0, 0.0, 10.5, 120.0, 999.99], rows)]
+    }
+
+
+def _itemVentas(rows, orders, seed=0):
+    """
+    Synthetic 'ItemVentas', with lines of unknown orders, null, 0 or negative codes and invalid quantities and prices.
+    """
+    rng = np.random.default_rng(seed)
+    nullable = lambda values, share: [None if rng.random() < share else value for value in values]
+
+    return {
+        'nroorden': nullable([int(value) for value in rng.integers(1, orders + 20, rows)], 0.03),
+        'codigo': nullable([int(value) for value in rng.integers(-3, 60, rows)], 0.05),
+        'subcodigo': nullable([int(value) for value in rng.integers(-1, 3, rows)], 0.05),
+        'cantidad': nullable([float(value) for value in rng.integers(-1, 5, rows)], 0.03),
+        'prec_unit': nullable([float(value) for value in rng.normal(50, 60, rows).round(2)], 0.03),
+        'prec_unit_iv': [float(value) for value in rng.normal(60, 70, rows).round(2)],
+        'total': nullable([float(value) for value in rng.normal(100, 120, rows).round(2)], 0.03)
+    }
+
+
+def test_arrow_cab_ventas_equals_pandas():
+    df_CabVentas, cabventas = _sourceTables('CabVentas', _cabVentas(2000))
+    vendedores_index = buildKeyIndex(pd.Series([1, 2, 3, 5, 8, 99]))
+    clientes_index = buildKeyIndex(pd.Series(np.arange(1, 60, 2)))
+
+    pandas_misses, arrow_misses = {}, {}
+    expected = parseCabVentasFecha(df_CabVentas).drop_duplicates(subset=['Fecha'])
+    expected = transformCabVentas(expected, vendedores_index, clientes_index, 99, 1, miss_counts=pandas_misses)
+    result = transformCabVentasArrow(cabventas, vendedores_index, clientes_index, 99, 1, miss_counts=arrow_misses)
+
+    assert len(result) < len(df_CabVentas)
+    pd.testing.assert_frame_equal(result, expected)
+    assert arrow_misses == pandas_misses
+
+
+def test_arrow_item_ventas_equals_pandas():
+    df_ItemVentas, itemventas = _sourceTables('ItemVentas', _itemVentas(5000, orders=400))
+    nroOrdenes = pd.Series(np.arange(1, 400, 3), dtype='Int64')
+    articulos_index = buildKeyIndex(pd.Series([codigo * 100 + subcodigo for codigo in range(1, 50) for subcodigo in range(2)] + [99999800]))
+
+    pandas_misses, arrow_misses = {}, {}
+    expected = transformItemVentas(df_ItemVentas, nroOrdenes, articulos_index, 99999800, miss_counts=pandas_misses)
+    result = transformItemVentasArrow(itemventas, nroOrdenes, articulos_index, 99999800, miss_counts=arrow_misses)
+
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected)
+    assert arrow_misses == pandas_misses
+
+
+def test_arrow_item_ventas_without_key_resolution():
+    df_ItemVentas, itemventas = _sourceTables('ItemVentas', _itemVentas(500, orders=100, seed=1))
+    nroOrdenes = pd.Series(np.arange(1, 100), dtype='Int64')
+
+    pd.testing.assert_frame_equal(transformItemVentasArrow(itemventas, nroOrdenes, None, 99999800),
+                                  transformItemVentas(df_ItemVentas, nroOrdenes, None, 99999800))
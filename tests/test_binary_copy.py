@@ -0,0 +1,156 @@
+import datetime
+import struct
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.load_fact_table import (PGCOPY_HEADER, PGCOPY_TRAILER, RENGLON_FACTURA_COLUMNS, RENGLON_FACTURA_STAGING_COLUMNS,
+                                     castFactColumns, encodeBinaryCopy)
+
+
+def _decodeNumeric(field):
+    """
+    Decode a PostgreSQL binary 'numeric' value into a Decimal.
+    """
+    ndigits, weight, sign, dscale = struct.unpack('>hhHh', field[:8])
+    digits = struct.unpack(f'>{ndigits}h', field[8:8 + 2 * ndigits])
+
+    value = sum(Decimal(digit) * Decimal(10000) ** (weight - position) for position, digit in enumerate(digits))
+    value = value.quantize(Decimal(1).scaleb(-dscale))
+    return -value if sign == 0x4000 else value
+
+
+def _decodeField(field, column_type):
+    """
+    Decode one binary COPY field of the given column type.
+    """
+    if column_type == 'int':
+        return struct.unpack('>i', field)[0]
+    if column_type == 'date':
+        return datetime.date(2000, 1, 1) + datetime.timedelta(days=struct.unpack('>i', field)[0])
+    if column_type == 'timestamp':
+        return datetime.datetime(2000, 1, 1) + datetime.timedelta(microseconds=struct.unpack('>q', field)[0])
+    return _decodeNumeric(field)
+
+
+def _decodeCopy(buffer, columns):
+    """
+    Decode a whole binary COPY stream (header, tuples and trailer) into a list of tuples (None for the NULL fields).
+    """
+    assert buffer[:11] == b'PGCOPY\n\xff\r\n\x00'
+    flags, extension_length = struct.unpack('>ii', buffer[11:19])
+    assert (flags, extension_length) == (0, 0)
+
+    rows = []
+    position = 19
+    while True:
+        field_count, = struct.unpack('>h', buffer[position:position + 2])
+        position += 2
+        if field_count == -1:
+            break
+        assert field_count == len(columns)
+
+        row = []
+        for column_type in columns.values():
+            length, = struct.unpack('>i', buffer[position:position + 4])
+            position += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(_decodeField(buffer[position:position + length], column_type))
+                position += length
+        rows.append(tuple(row))
+
+    assert position == len(buffer)
+    return rows
+
+
+def _encodeCopy(data, columns):
+    """
+    Encode a dataframe as a whole binary COPY stream, as it is sent by the fact load.
+    """
+    return PGCOPY_HEADER + encodeBinaryCopy(castFactColumns(data, columns), columns) + PGCOPY_TRAILER
+
+
+def _expectedRows(data, columns):
+    """
+    The rows of a dataframe with the Python values a COPY decoder must return.
+    """
+    data = castFactColumns(data, columns)
+    rows = []
+    for _, row in data.iterrows():
+        values = []
+        for column, column_type in columns.items():
+            value = row[column]
+            if pd.isna(value):
+                values.append(None)
+            elif column_type == 'int':
+                values.append(int(value))
+            elif column_type == 'date':
+                values.append(value.date())
+            elif column_type == 'timestamp':
+                values.append(value.to_pydatetime())
+            else:
+                values.append(Decimal(f'{value:.{column_type[1]}f}'))
+        rows.append(tuple(values))
+    return rows
+
+
+def _factRows(rows, seed=0):
+    """
+    Synthetic fact rows, with keys up to the INT limit, dates on both sides of the COPY epoch and amounts of every magnitude.
+    """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({column: rng.integers(1, 2 ** 31 - 1, rows) for column in ['idfecha', 'idarticulo', 'idcliente', 'idvendedor', 'nroorden']})
+    data['fecha'] = pd.Timestamp('1999-12-01') + pd.to_timedelta(rng.integers(0, 9000, rows), unit='D')
+    data['periodo'] = data['fecha'] + pd.to_timedelta(rng.choice([0, 12], rows), unit='h')
+    for column in ['total_venta_renglon', 'cantidad_articulos_renglon', 'precio_unitario', 'precio_unitario_iva']:
+        data[column] = (rng.normal(0, 1, rows) * 10.0 ** rng.integers(-2, 8, rows)).round(2)
+    return data
+
+
+def test_header_and_trailer():
+    assert PGCOPY_HEADER == b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8
+    assert PGCOPY_TRAILER == b'\xff\xff'
+
+
+@pytest.mark.parametrize('value, digits, weight, sign', [
+    (12345.67, (1, 2345, 6700), 1, 0x0000),
+    (-0.05, (0, 0, 500), 1, 0x4000),
+    (99999999.99, (9999, 9999, 9900), 1, 0x0000),
+    (0.0, (0, 0, 0), 1, 0x0000)
+])
+def test_numeric_digit_groups(value, digits, weight, sign):
+    # DECIMAL(10, 2): two base-10000 groups before the decimal point, and one after it
+    columns = {'total_venta_renglon': (10, 2)}
+    body = encodeBinaryCopy(castFactColumns(pd.DataFrame({'total_venta_renglon': [value]}), columns), columns)
+
+    field_count, length = struct.unpack('>hi', body[:6])
+    assert (field_count, length) == (1, 8 + 2 * len(digits))
+    assert struct.unpack('>hhHh', body[6:14]) == (len(digits), weight, sign, 2)
+    assert struct.unpack(f'>{len(digits)}h', body[14:]) == digits
+
+
+@pytest.mark.parametrize('columns', [RENGLON_FACTURA_COLUMNS, RENGLON_FACTURA_STAGING_COLUMNS])
+def test_round_trip_without_nulls(columns):
+    data = _factRows(300)
+
+    assert _decodeCopy(_encodeCopy(data, columns), columns) == _expectedRows(data, columns)
+
+
+@pytest.mark.parametrize('columns', [RENGLON_FACTURA_COLUMNS, RENGLON_FACTURA_STAGING_COLUMNS])
+def test_round_trip_with_nulls(columns):
+    rng = np.random.default_rng(1)
+    data = _factRows(300, seed=1).astype({'idfecha': 'Int64', 'idcliente': 'Int64'})
+    for column in ['idfecha', 'idcliente', 'precio_unitario', 'fecha', 'periodo']:
+        data.loc[rng.random(len(data)) < 0.2, column] = None
+
+    assert _decodeCopy(_encodeCopy(data, columns), columns) == _expectedRows(data, columns)
+
+
+def test_empty_batch():
+    data = _factRows(0)
+
+    assert encodeBinaryCopy(castFactColumns(data, RENGLON_FACTURA_COLUMNS), RENGLON_FACTURA_COLUMNS) == b''
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from modules.extract_tables import advanceWatermarks, boundWatermarks, lookbackWatermarks
+
+
+def test_lookback_starts_below_the_lowest_mark():
+    # The lines of the orders 1901 to 2000 were not extracted yet, so the window also covers them
+    marks, reload_after = lookbackWatermarks({'CabVentas': 2000, 'ItemVentas': 1900}, 100)
+
+    assert marks == {'CabVentas': 1800, 'ItemVentas': 1800}
+    assert reload_after == 1800
+
+
+def test_no_lookback_without_marks():
+    assert lookbackWatermarks({}, 100) == ({}, None)
+    assert lookbackWatermarks({'CabVentas': None, 'ItemVentas': None}, 100) == ({'CabVentas': None, 'ItemVentas': None}, None)
+
+
+def test_window_rows_do_not_lower_the_marks():
+    watermarks = {'CabVentas': 2000, 'ItemVentas': 2000}
+    window_rows = {'CabVentas': pd.DataFrame({'NroOrden': [1950, 1990]}), 'ItemVentas': pd.DataFrame({'nroorden': [1950, 2010]})}
+
+    new_watermarks = advanceWatermarks(watermarks, window_rows)
+
+    assert new_watermarks == {'CabVentas': 2000, 'ItemVentas': 2010}
+    assert boundWatermarks(new_watermarks) == {'CabVentas': 2000, 'ItemVentas': 2000}
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.key_encoding import (INVALID_KEY, KEY_MAX, decodeArticuloId, decodeRubroId, encodeArticuloId,
+                                  encodeRubroId)
+
+
+def test_rubro_id_round_trip():
+    rng = np.random.default_rng(0)
+    parts = [rng.integers(0, 1000, 500), rng.integers(0, 1000, 500), rng.integers(0, 100, 500), rng.integers(0, 10, 500)]
+
+    ids = encodeRubroId(*parts)
+
+    for decoded, part in zip(decodeRubroId(ids), parts):
+        np.testing.assert_array_equal(decoded, part)
+
+
+def test_rubro_id_is_the_concatenation_of_the_padded_parts():
+    ids = encodeRubroId(pd.Series([12, 1, 0]), pd.Series([345, 0, 0]), pd.Series([6, 2, 0]), pd.Series([7, 3, 0]))
+
+    assert ids.tolist() == [int('012' + '345' + '06' + '7'), int('001' + '000' + '02' + '3'), 0]
+
+
+def test_articulo_id_round_trip():
+    rng = np.random.default_rng(1)
+    codigo, subcodigo = rng.integers(0, 1000000, 500), rng.integers(0, 100, 500)
+
+    decoded_codigo, decoded_subcodigo = decodeArticuloId(encodeArticuloId(codigo, subcodigo))
+
+    np.testing.assert_array_equal(decoded_codigo, codigo)
+    np.testing.assert_array_equal(decoded_subcodigo, subcodigo)
+
+
+def test_articulo_id_of_the_special_articles():
+    # 'OTRO' and 'DESCUENTO', whose ids are used by the ETL
+    assert encodeArticuloId(np.array([999998, 999999]), np.array([0, 0])).tolist() == [99999800, 99999900]
+
+
+def test_first_part_can_have_more_digits_than_its_width():
+    assert encodeArticuloId(np.array([1234567]), np.array([8])).tolist() == [123456708]
+
+
+@pytest.mark.parametrize('codigo, subcodigo', [
+    (KEY_MAX // 100 + 1, 0),  # the key does not fit in an INT column
+    (1, 100),                 # the subcodigo does not fit in its 2 digits
+    (-1, 0),                  # negative part
+    (1, -1),
+    (1.5, 0),                 # not an integer
+    (np.nan, 0)               # null
+])
+def test_invalid_articulo_id(codigo, subcodigo):
+    codigo, subcodigo = np.array([codigo, 1]), np.array([subcodigo, 2])
+
+    assert encodeArticuloId(codigo, subcodigo, errors='coerce').tolist() == [INVALID_KEY, 102]
+    with pytest.raises(ValueError):
+        encodeArticuloId(codigo, subcodigo)
+
+
+def test_nullable_parts():
+    codigo = pd.Series([5, None, 7], dtype='Int32')
+    subcodigo = pd.Series([1, 2, None], dtype='Int16')
+
+    assert encodeArticuloId(codigo, subcodigo, errors='coerce').tolist() == [501, INVALID_KEY, INVALID_KEY]
+
+
+def test_rubro_id_overflow():
+    # 3 digits of rubro, but a rubro of 4 digits is accepted while the key fits in an INT column
+    assert encodeRubroId(np.array([1000]), np.array([0]), np.array([0]), np.array([0])).tolist() == [1000000000]
+    assert encodeRubroId(np.array([3000]), np.array([0]), np.array([0]), np.array([0]), errors='coerce').tolist() == [INVALID_KEY]
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.key_resolution import buildKeyIndex
+from modules.parallel_transform import openTransformPool, closeTransformPool, parallelTransform, _rangeOf
+from modules.transform_sales import transformItemVentas
+
+
+@pytest.fixture
+def transform_pool():
+    """
+    Pool of 3 workers that transforms every table in parallel, whatever its size.
+    """
+    rng = np.random.default_rng(0)
+    articulos = pd.Series(np.unique(rng.integers(1, 500, 300)) * 100)
+    pool = openTransformPool(3, lookups={'articulos': buildKeyIndex(articulos)}, min_rows=0)
+    yield pool
+    closeTransformPool(pool)
+
+
+def _markRows(df, offset):
+    """
+    Row-local transform: keeps the rows with an even 'value', and adds a column computed from each row.
+    """
+    df = df[df['value'] % 2 == 0]
+    return df.assign(marked=df['value'] + offset)
+
+
+def _itemVentas(rows, seed=0):
+    """
+    Synthetic 'ItemVentas', with the dtypes of its source schema and some null order numbers and codes.
+    """
+    rng = np.random.default_rng(seed)
+    nroorden = pd.array(rng.integers(1, rows // 3, rows), dtype='Int64')
+    nroorden[rng.random(rows) < 0.05] = pd.NA
+    codigo = pd.array(rng.integers(-5, 500, rows), dtype='Int32')
+    codigo[rng.random(rows) < 0.05] = pd.NA
+
+    return pd.DataFrame({
+        'nroorden': nroorden,
+        'codigo': codigo,
+        'subcodigo': pd.array(rng.integers(-1, 3, rows), dtype='Int16'),
+        'cantidad': rng.integers(-1, 10, rows).astype(float),
+        'prec_unit': rng.random(rows) * 100,
+        'prec_unit_iv': rng.random(rows) * 121,
+        'total': rng.random(rows) * 1000
+    }, index=rng.permutation(rows) + 1000)
+
+
+def test_range_of_sends_null_keys_to_their_own_range():
+    keys = pd.Series([5, 1, None, 30, None], dtype='Int64')
+    edges = np.array([3, 10])
+
+    assert _rangeOf(keys, edges).tolist() == [1, 0, 3, 2, 3]
+
+
+def test_parallel_transform_equals_serial_with_null_keys(transform_pool):
+    rng = np.random.default_rng(1)
+    keys = pd.array(rng.integers(0, 1000, 5000), dtype='Int64')
+    keys[::17] = pd.NA
+    df = pd.DataFrame({'key': keys, 'value': rng.integers(0, 100, 5000)}, index=rng.permutation(5000))
+
+    serial = _markRows(df, offset=7)
+    parallel = parallelTransform(transform_pool, _markRows, df, 'key', offset=7)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_parallel_item_ventas_equals_serial(transform_pool):
+    df_ItemVentas = _itemVentas(6000)
+    nroOrdenes = pd.Series(np.arange(1, 2000, 2), dtype='Int64')
+    articulos_index = transform_pool['lookups']['articulos']
+
+    serial_misses, parallel_misses = {}, {}
+    serial = transformItemVentas(df_ItemVentas, nroOrdenes, articulos_index, 99999800, miss_counts=serial_misses)
+    parallel = parallelTransform(transform_pool, transformItemVentas, df_ItemVentas, 'nroorden',
+                                 lookups={'articulos_index': 'articulos'}, split_args={'nroOrdenes': nroOrdenes},
+                                 miss_counts=parallel_misses, codigo_articulo_otro=99999800)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert parallel_misses == serial_misses
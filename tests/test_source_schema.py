@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from modules.source_schema import applySchema
+
+
+def test_non_integer_codes_become_nulls():
+    articulos = applySchema(pd.DataFrame({'codigo': ['12', '', 'x', 3.5, None]}), 'Articulos')
+
+    assert str(articulos['codigo'].dtype) == 'Int32'
+    assert articulos['codigo'].tolist() == [12, pd.NA, pd.NA, pd.NA, pd.NA]
+
+
+def test_codes_out_of_range_are_kept_with_a_wider_dtype():
+    articulos = applySchema(pd.DataFrame({'subcodigo': [1, 40000, None], 'rubro': [1, 2, 3]}), 'Articulos')
+
+    assert str(articulos['subcodigo'].dtype) == 'Int32'
+    assert articulos['subcodigo'].tolist() == [1, 40000, pd.NA]
+    assert str(articulos['rubro'].dtype) == 'Int16'
+
+
+def test_codes_out_of_the_int64_range_become_nulls():
+    articulos = applySchema(pd.DataFrame({'subcodigo': np.array([1, 1e20])}), 'Articulos')
+
+    assert str(articulos['subcodigo'].dtype) == 'Int64'
+    assert articulos['subcodigo'].tolist() == [1, pd.NA]
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from modules.update_dimensions_table import antiJoinNaturalKey
+
+
+def _tiposCliente(ids):
+    """
+    Rows of the 'TipoCliente' dimension, as built by the ETL: the unknown types are all named 'DESCONOCIDO'.
+    """
+    names = {1: 'CUENTA CORRIENTE', 2: 'MOROSO', 3: 'MOROSO NO VENDER'}
+    return pd.DataFrame({'idtipocliente': ids, 'tipo_cliente': [names.get(id_tipo, 'DESCONOCIDO') for id_tipo in ids]})
+
+
+def test_two_unknown_types_are_both_new():
+    new_data = antiJoinNaturalKey(_tiposCliente([1, 2, 3, 4, 5]), _tiposCliente([1, 2, 3]), 'idtipocliente')
+
+    assert new_data['idtipocliente'].tolist() == [4, 5]
+
+
+def test_new_unknown_type_is_new_when_another_one_is_stored():
+    new_data = antiJoinNaturalKey(_tiposCliente([1, 2, 3, 4, 5]), _tiposCliente([1, 2, 3, 4]), 'idtipocliente')
+
+    assert new_data['idtipocliente'].tolist() == [5]
+
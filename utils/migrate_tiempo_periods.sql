@@ -0,0 +1,45 @@
+-- Convertir un Tiempo creado con una fila por fecha y hora de factura (posiblemente repetida) a una fila por período de cada día.
+-- Ejecutarlo una sola vez, entre dos ejecuciones del ETL, antes del índice único 'tiempo_fecha_key' de 'datawarehouse/DDL/DDL - Renglón Factura.sql'.
+-- Las filas de cada período se unen en la de menor IDFecha, que conserva su clave, y las filas de hechos
+-- de las demás pasan a apuntar a ella. Los días (y por lo tanto las tablas de agregados) no cambian.
+BEGIN;
+
+-- Los mismos períodos que 'PERIODOS' en 'modules/calendar_dimension.py': 'Mañana' desde las 00:00, 'Tarde' desde las 12:00
+CREATE TEMPORARY TABLE tiempo_periods ON COMMIT DROP AS
+SELECT idfecha,
+       date_trunc('day', fecha) + CASE WHEN EXTRACT(HOUR FROM fecha) >= 12 THEN INTERVAL '12 hours' ELSE INTERVAL '0 hours' END AS periodo_fecha
+FROM Tiempo
+WHERE fecha IS NOT NULL;
+
+CREATE TEMPORARY TABLE tiempo_merge ON COMMIT DROP AS
+SELECT idfecha, periodo_fecha, MIN(idfecha) OVER (PARTITION BY periodo_fecha) AS keep_idfecha
+FROM tiempo_periods;
+
+-- Apuntar las filas de hechos a la fila conservada para su período
+UPDATE Renglon_Factura f
+SET IDFecha = m.keep_idfecha
+FROM tiempo_merge m
+WHERE f.IDFecha = m.idfecha AND m.idfecha <> m.keep_idfecha;
+
+DELETE FROM Tiempo t
+USING tiempo_merge m
+WHERE t.idfecha = m.idfecha AND m.idfecha <> m.keep_idfecha;
+
+-- Las filas conservadas empiezan en su período, con los mismos atributos que las filas generadas por 'generateCalendar'
+UPDATE Tiempo t
+SET fecha = m.periodo_fecha,
+    periodo = CASE WHEN EXTRACT(HOUR FROM m.periodo_fecha) >= 12 THEN 'Tarde' ELSE 'Mañana' END,
+    dia_nombre = (ARRAY['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'])[EXTRACT(ISODOW FROM m.periodo_fecha)::INT],
+    diames_numero = EXTRACT(DAY FROM m.periodo_fecha),
+    mes_numero = EXTRACT(MONTH FROM m.periodo_fecha),
+    mes_nombre = (ARRAY['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+                        'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'])[EXTRACT(MONTH FROM m.periodo_fecha)::INT],
+    trimestre = EXTRACT(QUARTER FROM m.periodo_fecha),
+    semestre = CASE WHEN EXTRACT(QUARTER FROM m.periodo_fecha) <= 2 THEN 1 ELSE 2 END,
+    anio = EXTRACT(YEAR FROM m.periodo_fecha)
+FROM tiempo_merge m
+WHERE t.idfecha = m.idfecha;
+
+CREATE UNIQUE INDEX IF NOT EXISTS tiempo_fecha_key ON Tiempo (Fecha);
+
+COMMIT;
@@ -0,0 +1,54 @@
+-- Mover las filas de un Renglon_Factura creado antes de las particiones a la tabla particionada.
+-- Ejecutarlo una sola vez, entre dos ejecuciones del ETL. La siguiente ejecución del ETL crea los índices de las particiones.
+BEGIN;
+
+ALTER TABLE Renglon_Factura RENAME TO Renglon_Factura_old;
+ALTER TABLE Renglon_Factura_old RENAME CONSTRAINT renglon_factura_pkey TO renglon_factura_old_pkey;
+ALTER INDEX IF EXISTS renglon_factura_idfecha_idx RENAME TO renglon_factura_old_idfecha_idx;
+
+-- La misma tabla que en 'datawarehouse/DDL/DDL - Renglón Factura.sql'
+CREATE TABLE Renglon_Factura (
+	IDRenglon_Factura SERIAL,
+	Fecha DATE NOT NULL,
+	IDFecha INT,
+	IDArticulo INT,
+	IDCliente INT,
+	IDVendedor INT,
+	NroOrden INT,
+	total_venta_renglon DECIMAL(10, 2),
+	cantidad_articulos_renglon DECIMAL(10, 2),
+	precio_unitario DECIMAL(12, 2),
+	precio_unitario_iva DECIMAL(12, 2),
+	FOREIGN KEY (IDFecha) REFERENCES Tiempo(IDFecha),
+	FOREIGN KEY (IDArticulo) REFERENCES Articulos(IDArticulo),
+	FOREIGN KEY (IDCliente) REFERENCES Clientes(IDCliente),
+	FOREIGN KEY (IDVendedor) REFERENCES Vendedores(IDVendedor),
+	FOREIGN KEY (NroOrden) REFERENCES Orden(NroOrden),
+	PRIMARY KEY (IDRenglon_Factura, Fecha)
+) PARTITION BY RANGE (Fecha);
+
+-- Una partición por mes de las filas existentes (la fecha de venta es el día de su período de 'Tiempo')
+DO $$
+DECLARE
+	month DATE;
+BEGIN
+	FOR month IN
+		SELECT DISTINCT CAST(date_trunc('month', t.fecha) AS DATE)
+		FROM Renglon_Factura_old f JOIN Tiempo t ON t.idfecha = f.idfecha
+	LOOP
+		EXECUTE format('CREATE TABLE IF NOT EXISTS renglon_factura_%s PARTITION OF Renglon_Factura FOR VALUES FROM (%L) TO (%L)',
+		               to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month');
+	END LOOP;
+END $$;
+
+INSERT INTO Renglon_Factura (IDRenglon_Factura, Fecha, IDFecha, IDArticulo, IDCliente, IDVendedor, NroOrden,
+                             total_venta_renglon, cantidad_articulos_renglon, precio_unitario, precio_unitario_iva)
+SELECT f.IDRenglon_Factura, CAST(t.fecha AS DATE), f.IDFecha, f.IDArticulo, f.IDCliente, f.IDVendedor, f.NroOrden,
+       f.total_venta_renglon, f.cantidad_articulos_renglon, f.precio_unitario, f.precio_unitario_iva
+FROM Renglon_Factura_old f JOIN Tiempo t ON t.idfecha = f.idfecha;
+
+SELECT setval(pg_get_serial_sequence('renglon_factura', 'idrenglon_factura'), (SELECT MAX(IDRenglon_Factura) FROM Renglon_Factura));
+
+DROP TABLE Renglon_Factura_old;
+
+COMMIT;